@@ -3,6 +3,8 @@ from flask_cors import CORS
 from app.config import Config
 from app.extensions import db, bcrypt, migrate, mail, socketio
 from app.api import init_app as init_api
+from app.share_pages import precompilar_paginas
+from app.blob_store import limpar_temporarios
 from flask_jwt_extended import JWTManager
 import os
 import psycopg2
@@ -101,9 +103,11 @@ def create_app():
 
 
     init_api(app)
+    precompilar_paginas(app)
     with app.app_context():
         db.create_all()
         load_terms_of_service()
+    limpar_temporarios(app.config['UPLOAD_TMP_MAX_AGE_MINUTES'] * 60)
 
     return app
 
@@ -18,6 +18,10 @@ from app.api.account import (
 from app.api.file import (
     FileUploadResource,
     FileDownloadResource,
+    FileBulkDownloadResource,
+    FileSignedUrlResource,
+    FileSignedDownloadResource,
+    DownloadMetricsResource,
     FileShareResource,
     FileShareViewResource,
     FileDownloadSharedResource,
@@ -25,11 +29,22 @@ from app.api.file import (
     FileDeleteResource,
     FilePreviewResource,
     FilePreviewContentResource,
+    FileThumbnailResource,
+    FileArchiveResource,
     FileRenameResource,
 )
+from app.api.upload import (
+    UploadSessionCreateResource,
+    UploadSessionResource,
+    UploadChunkResource,
+    UploadSessionCompleteResource,
+    FileUploadProbeResource,
+    FileBatchUploadResource,
+)
 
 from app.api.folder import (
     FolderContentResource,
+    FolderDownloadResource,
     FolderCreateResource,
     FolderDeleteResource,
     FolderRenameResource,
@@ -71,18 +86,33 @@ api.add_resource(FolderRenameResource, '/pastas/<string:folder_id>/raname')
 api.add_resource(FolderContentResource, 
                  '/folders', 
                  '/folders/<uuid:folder_id>')
+api.add_resource(FolderDownloadResource, '/folders/<uuid:folder_id>/download')
 api.add_resource(FolderShareResource, '/pastas/<string:folder_id>/share')
 api.add_resource(FolderUnshareResource, '/pastas/<string:folder_id>/unshare')
 api.add_resource(FolderSharedWithMeResource, '/pastas/compartilhadas')
 
 #Rotas de arquivos
 api.add_resource(FileUploadResource, '/files/upload')
+api.add_resource(FileUploadProbeResource, '/files/upload/probe')
+api.add_resource(FileBatchUploadResource, '/files/upload/batch')
 api.add_resource(FileDownloadResource, '/files/<uuid:file_id>/download')
+api.add_resource(FileBulkDownloadResource, '/files/download')
+api.add_resource(FileSignedUrlResource, '/files/<uuid:file_id>/signed-url')
+api.add_resource(FileSignedDownloadResource, '/files/signed/<string:token>')
+api.add_resource(DownloadMetricsResource, '/downloads/metrics')
 api.add_resource(FileRenameResource, '/files/<string:file_id>/rename')
 api.add_resource(FileDeleteResource, '/files/<string:file_id>/delete')
 api.add_resource(FileVisibilityResource, '/files/<string:file_id>/visibility')
 api.add_resource(FilePreviewResource, '/files/<string:file_id>/preview')
 api.add_resource(FilePreviewContentResource, '/files/<string:file_id>/preview-content')
+api.add_resource(FileThumbnailResource, '/files/<uuid:file_id>/thumbnail')
+api.add_resource(FileArchiveResource, '/files/<uuid:file_id>/archive')
+
+#Rotas de upload retomável
+api.add_resource(UploadSessionCreateResource, '/files/uploads')
+api.add_resource(UploadSessionResource, '/files/uploads/<uuid:upload_id>')
+api.add_resource(UploadChunkResource, '/files/uploads/<uuid:upload_id>/chunks/<int:indice>')
+api.add_resource(UploadSessionCompleteResource, '/files/uploads/<uuid:upload_id>/complete')
 
 
 # Rotas de compartilhamento
@@ -11,6 +11,7 @@ import random
 from flask import request
 from enum import Enum
 import json
+from app.share_cache import invalidar_compartilhamentos
 
 
 
@@ -441,6 +442,7 @@ class ConfirmarExclusaoContaResource(Resource):
         Codigo2FA.query.filter_by(id_usuario=usuario_id).delete()
 
         db.session.commit()
+        invalidar_compartilhamentos(id_usuario=usuario_id)
 
         registrar_log(
             usuario_id=usuario_id,
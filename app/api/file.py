@@ -3,17 +3,65 @@ from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 from enum import Enum 
 from app.models import Usuario, Arquivo, Pasta, Log, LogCategoria, LogSeveridade, Sessao, Compartilhamento
 from app.extensions import db
-from uuid import uuid4
+from uuid import uuid4, UUID
+from sqlalchemy import or_
 from datetime import datetime, timezone
-from flask import request, send_file, abort, send_file, make_response
+from flask import request, abort, make_response, current_app, jsonify, Response, stream_with_context
 from werkzeug.datastructures import FileStorage 
+from werkzeug.formparser import parse_form_data
 import os
+import hmac
+import time
 import hashlib
 from cryptography.fernet import Fernet
 from werkzeug.utils import secure_filename 
 import json
 import mimetypes
 from werkzeug.exceptions import abort
+from app.storage import HashingUploadStream, QuotaExcedidaError, obter_driver
+from app.delivery import (
+    aplicar_validadores,
+    cabecalho_disposicao,
+    enviar_arquivo,
+    iterar_intervalo,
+    requisicao_continuacao,
+    resposta_nao_modificada,
+    variante_disposicao,
+)
+from app.integrity import IntegrityCache
+from app.bandwidth import limitar_resposta, obter_limitador
+from app.thumbnails import (
+    FORMATOS_MINIATURA,
+    TAMANHOS_MINIATURA,
+    agendar_miniaturas,
+    obter_miniatura,
+    tem_miniatura,
+)
+from app.derivatives import DerivativeCache
+from app.text_preview import janela_bytes, janela_linhas
+from app.archive_preview import (
+    ERROS_ARQUIVO_COMPACTADO,
+    abrir_membro,
+    buscar_entrada,
+    iterar_membro,
+    listar_conteudo,
+    tem_listagem,
+)
+from app.api.folder import verificar_acesso_pasta
+from app.zip_stream import entradas_arquivos, enviar_zip
+from app.signed_url import (
+    AssinaturaInvalidaError,
+    LinkExpiradoError,
+    arquivo_assinado,
+    assinar_download,
+    obter_cache_links_assinados,
+    validar_download,
+)
+from app.blob_store import BlobStore, BlobWriter, BLOBS_TMP_DIR, obter_blob
+from app.share_cache import invalidar_compartilhamentos, obter_cache_compartilhamentos
+from app.share_counters import obter_contador_acessos
+from app.share_pages import cache_control_pagina, obter_cache_paginas, versao_pagina
+from app.quota import QuotaReservation
 
 
 def registrar_log(usuario_id, categoria, severidade, acao, detalhe=None, metadados=None, ip_origem=None):
@@ -60,25 +108,8 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-upload_parser = reqparse.RequestParser()
-upload_parser.add_argument('file', 
-                         type=FileStorage, 
-                         location='files', 
-                         required=True, 
-                         help='Arquivo é obrigatório')
-upload_parser.add_argument('is_public', 
-                         type=bool, 
-                         location='form', 
-                         default=False)
-upload_parser.add_argument('folder_id', 
-                         type=str, 
-                         location='form')
-upload_parser.add_argument('description', 
-                         type=str, 
-                         location='form')
-upload_parser.add_argument('tags', 
-                         type=str, 
-                         location='form')
+def form_bool(valor):
+    return str(valor).lower() in ('true', '1', 't', 'on')
 
 rename_parser = reqparse.RequestParser()
 rename_parser.add_argument('novo_nome', 
@@ -90,6 +121,24 @@ rename_parser.add_argument('manter_extensao',
                             default=True,
                             help='Se deve manter a extensão original do arquivo')
 
+bulk_download_parser = reqparse.RequestParser()
+bulk_download_parser.add_argument('ids',
+                                  type=str,
+                                  action='append',
+                                  location='json',
+                                  required=True,
+                                  help='Lista de ids dos arquivos é obrigatória')
+bulk_download_parser.add_argument('nome',
+                                  type=str,
+                                  location='json',
+                                  required=False)
+
+signed_url_parser = reqparse.RequestParser()
+signed_url_parser.add_argument('disposicao',
+                               type=str,
+                               location='json',
+                               default='attachment')
+
 share_parser = reqparse.RequestParser()
 share_parser.add_argument('expira_em', 
                         type=str, 
@@ -105,9 +154,11 @@ share_parser.add_argument('max_acessos',
 class FileUploadResource(Resource):
     @jwt_required()
     def post(self):
+        streams = []
+        reserva = None
         try:
             
-            if not request.content_type.startswith('multipart/form-data'):
+            if not request.content_type or not request.content_type.startswith('multipart/form-data'):
                 return {'message': 'Content-Type deve ser multipart/form-data'}, 415
 
             usuario_id = get_jwt_identity()
@@ -118,7 +169,6 @@ class FileUploadResource(Resource):
                 return {"error": "Termos não aceitos."}, 403
             
             jti = get_jwt()["jti"]
-            print(jti)
             sessao = Sessao.query.filter_by(
                 id_usuario=usuario_id,
                 jwt_token=jti,
@@ -128,37 +178,48 @@ class FileUploadResource(Resource):
                 return {"error": "Sessão não encontrada ou não verificada"}, 401
 
             
+            # Reserva atômica do que couber do Content-Length (que inclui o envelope multipart);
+            # o restante é reservado em blocos conforme o corpo chega e ajustado ao tamanho real no final
+            reserva = QuotaReservation(usuario.id)
+            if request.content_length:
+                reserva.reservar_disponivel(request.content_length)
+
+            # O corpo é comprimido e cifrado enquanto chega, com hash e quota verificados a cada bloco
+            gravador = BlobWriter()
+            def stream_factory(total_content_length, content_type, filename, content_length=None):
+                stream = HashingUploadStream(
+                    gravador,
+                    BLOBS_TMP_DIR,
+                    reserva=reserva,
+                    tipo_mime=mimetypes.guess_type(filename or '')[0]
+                )
+                streams.append(stream)
+                return stream
+
+            try:
+                _, form, files = parse_form_data(request.environ, stream_factory=stream_factory)
+            except QuotaExcedidaError:
+                return {'message': 'Quota de armazenamento excedida'}, 400
 
-            args = upload_parser.parse_args()
-            uploaded_file = args['file']
+            uploaded_file = files.get('file')
             
-            if not uploaded_file:
-                return {'message': 'Nenhum arquivo recebido'}, 400
+            if not uploaded_file or not uploaded_file.filename:
+                return {'message': 'Arquivo é obrigatório'}, 400
 
            
             if not allowed_file(uploaded_file.filename):
                 return {'message': 'Tipo de arquivo não permitido'}, 400
 
-            
-            uploaded_file.seek(0, os.SEEK_END)
-            file_size = uploaded_file.tell()
-            uploaded_file.seek(0)
-
-            if usuario.armazenamento_utilizado + file_size > usuario.quota_armazenamento:
-                return {'message': 'Quota de armazenamento excedida'}, 400
-
-            
-            upload_dir = os.path.join('uploads', str(usuario.id))
-            os.makedirs(upload_dir, exist_ok=True)
+            stream = uploaded_file.stream
+            file_size = stream.tamanho
 
             
             file_ext = os.path.splitext(uploaded_file.filename)[1].lower()
             unique_filename = f"{uuid4().hex}{file_ext}"
-            file_path = os.path.join(upload_dir, unique_filename)
 
 
             
-            folder_id = args.get('folder_id')
+            folder_id = form.get('folder_id')
             existing_file = Arquivo.query.filter_by(
                 id_usuario=usuario_id,
                 nome_original=uploaded_file.filename,
@@ -174,19 +235,23 @@ class FileUploadResource(Resource):
                 }, 409
             
             
-            uploaded_file.save(file_path)
-
-            
-            file_hash = hashlib.sha256()
-            with open(file_path, 'rb') as f:
-                for chunk in iter(lambda: f.read(4096), b''):
-                    file_hash.update(chunk)
+            try:
+                reserva.ajustar(file_size)
+            except QuotaExcedidaError:
+                reserva.liberar()
+                return {'message': 'Quota de armazenamento excedida'}, 400
 
-            
             mime_type, _ = mimetypes.guess_type(uploaded_file.filename)
             if not mime_type:
                 mime_type = 'application/octet-stream'
 
+            # Conteúdo idêntico já armazenado não ocupa disco novamente
+            blob_store = BlobStore()
+            file_path, precisa_gravar = blob_store.adicionar_referencia(stream.hexdigest(), file_size)
+            if precisa_gravar:
+                gravacao = stream.finalizar(file_path)
+                blob_store.registrar_gravacao(stream.hexdigest(), file_path, gravacao)
+
             
             new_file = Arquivo(
                 id=uuid4(),
@@ -196,16 +261,17 @@ class FileUploadResource(Resource):
                 caminho_armazenamento=file_path,
                 tamanho=file_size,
                 tipo_mime=mime_type,
-                publico=args['is_public'],
-                descricao=args.get('description'),
-                tags=args.get('tags'),
-                hash_arquivo=file_hash.hexdigest(),
-                id_pasta=args.get('folder_id')
+                publico=form_bool(form.get('is_public', False)),
+                descricao=form.get('description'),
+                tags=form.get('tags'),
+                hash_arquivo=stream.hexdigest(),
+                id_pasta=folder_id
             )
 
             db.session.add(new_file)
-            usuario.armazenamento_utilizado += file_size
             db.session.commit()
+            reserva.confirmar()
+            agendar_miniaturas([new_file])
 
             return {
                 'message': 'Upload realizado com sucesso',
@@ -217,18 +283,17 @@ class FileUploadResource(Resource):
 
         except Exception as e:
             db.session.rollback()
-            
-            if 'file_path' in locals() and os.path.exists(file_path):
-                try:
-                    os.remove(file_path)
-                except:
-                    pass
-            
             print(f"ERRO NO UPLOAD: {str(e)}")
             return {
                 'message': 'Erro no processamento do arquivo',
                 'error': str(e)
             }, 500
+
+        finally:
+            for stream in streams:
+                stream.descartar()
+            if reserva:
+                reserva.liberar()
         
 class FileDownloadResource(Resource):
     @jwt_required()
@@ -261,20 +326,96 @@ class FileDownloadResource(Resource):
                 if not arquivo:
                     return {'message': 'Arquivo não encontrado ou acesso negado'}, 404
 
-            
-            if not os.path.exists(arquivo.caminho_armazenamento):
+            nome_arquivo = secure_filename(arquivo.nome_original)
+            nao_modificado = resposta_nao_modificada(arquivo, variante=variante_disposicao('attachment', nome_arquivo))
+            if nao_modificado is not None:
+                return nao_modificado
+
+            driver = obter_driver()
+            if not driver.existe(arquivo.caminho_armazenamento):
                 return {'message': 'Arquivo não encontrado no servidor'}, 404
 
             
-            file_hash = hashlib.sha256()
-            with open(arquivo.caminho_armazenamento, 'rb') as f:
-                for chunk in iter(lambda: f.read(4096), b''):
-                    file_hash.update(chunk)
-            
-            if file_hash.hexdigest() != arquivo.hash_arquivo:
+            # O hash só é recalculado quando o carimbo do arquivo mudou (ver INTEGRITY_CHECK_POLICY)
+            if not IntegrityCache(driver=driver).verificar(arquivo):
                 return {'message': 'Arquivo corrompido'}, 500
 
            
+            # Retomadas e seeks (Range) não geram um novo registro de download
+            if not requisicao_continuacao():
+                registrar_log(
+                    usuario_id=usuario_id,
+                    categoria=LogCategoria.ARQUIVO,
+                    severidade=LogSeveridade.INFO,
+                    acao='Download de arquivo',
+                    detalhe=f"Arquivo: {arquivo.nome_original}",
+                    metadados={
+                        'file_id': str(arquivo.id),
+                        'file_size': arquivo.tamanho
+                    },
+                    ip_origem=request.remote_addr
+                )
+
+           
+            return enviar_arquivo(
+                arquivo,
+                disposicao='attachment',
+                nome_arquivo=nome_arquivo,
+                usuario_id=usuario_id
+            )
+
+        except Exception as e:
+            print(f"ERRO NO DOWNLOAD: {str(e)}")
+            return {
+                'message': 'Erro ao processar download',
+                'error': str(e)
+            }, 500
+
+
+class FileSignedUrlResource(Resource):
+    @jwt_required()
+    def post(self, file_id):
+        """Gera um link de download assinado e de curta duração para o arquivo"""
+        try:
+            usuario_id = get_jwt_identity()
+            usuario = Usuario.query.get(usuario_id)
+            jti = get_jwt()["jti"]
+
+            if not usuario or usuario.conta_exclusao_solicitada:
+                return {'message': 'Usuário não encontrado'}, 404
+            if not usuario.termos_aceitos:
+                return {"error": "Termos não aceitos."}, 403
+
+            sessao = Sessao.query.filter_by(
+                id_usuario=usuario_id,
+                jwt_token=jti,
+                dois_fatores_validado=True
+            ).first()
+            if not sessao:
+                return {"error": "Sessão não encontrada ou não verificada"}, 401
+
+            args = signed_url_parser.parse_args()
+            disposicao = args['disposicao']
+            if disposicao not in ('attachment', 'inline'):
+                return {'message': "Disposição deve ser 'attachment' ou 'inline'"}, 400
+
+            arquivo = Arquivo.query.filter_by(id=file_id, id_usuario=usuario_id, excluido=False).first()
+            if not arquivo:
+                arquivo = Arquivo.query.filter_by(id=file_id, publico=True, excluido=False).first()
+                if not arquivo:
+                    return {'message': 'Arquivo não encontrado ou acesso negado'}, 404
+
+            driver = obter_driver()
+            if not driver.existe(arquivo.caminho_armazenamento):
+                return {'message': 'Arquivo não encontrado no servidor'}, 404
+
+            # A verificação de integridade acontece aqui; o download pelo link só reconfere, com
+            # cache curto, se o arquivo e esta sessão continuam válidos
+            if not IntegrityCache(driver=driver).verificar(arquivo):
+                return {'message': 'Arquivo corrompido'}, 500
+
+            token, expira_em = assinar_download(arquivo, obter_blob(arquivo), usuario_id, disposicao, jti=jti)
+
             registrar_log(
                 usuario_id=usuario_id,
                 categoria=LogCategoria.ARQUIVO,
@@ -283,26 +424,163 @@ class FileDownloadResource(Resource):
                 detalhe=f"Arquivo: {arquivo.nome_original}",
                 metadados={
                     'file_id': str(arquivo.id),
-                    'file_size': arquivo.tamanho
+                    'file_size': arquivo.tamanho,
+                    'link_assinado': True,
+                    'expira_em': expira_em.isoformat()
                 },
                 ip_origem=request.remote_addr
             )
 
-           
-            return send_file(
-                arquivo.caminho_armazenamento,
-                as_attachment=True,
-                download_name=secure_filename(arquivo.nome_original),
-                mimetype=arquivo.tipo_mime
+            return {
+                'url': f"{request.host_url}api/files/signed/{token}",
+                'expira_em': expira_em.isoformat()
+            }, 200
+
+        except Exception as e:
+            print(f"ERRO AO GERAR LINK ASSINADO: {str(e)}")
+            return {
+                'message': 'Erro ao gerar link de download',
+                'error': str(e)
+            }, 500
+
+
+class FileSignedDownloadResource(Resource):
+    def get(self, token):
+        """Download por link assinado: sem JWT; arquivo e sessão são reconferidos via SignedLinkCache"""
+        try:
+            try:
+                dados = validar_download(token)
+            except LinkExpiradoError:
+                return {'message': 'Este link expirou'}, 403
+            except (AssinaturaInvalidaError, ValueError, KeyError):
+                return {'message': 'Link inválido'}, 403
+
+            # Arquivo excluído, trocado ou não mais acessível, ou sessão encerrada, revogam o link
+            if not obter_cache_links_assinados().valido(dados):
+                return {'message': 'Este link não é mais válido'}, 403
+
+            arquivo, blob = arquivo_assinado(dados)
+            # O conteúdo do link não muda enquanto ele for válido, então o cliente pode guardá-lo até expirar
+            cache_control = f"private, max-age={max(int(dados['e'] - time.time()), 0)}, immutable"
+
+            nome_arquivo = secure_filename(arquivo.nome_original) if dados['d'] == 'attachment' else arquivo.nome_original
+            nao_modificado = resposta_nao_modificada(arquivo, variante=variante_disposicao(dados['d'], nome_arquivo))
+            if nao_modificado is not None:
+                nao_modificado.headers['Cache-Control'] = cache_control
+                return nao_modificado
+
+            if not obter_driver().existe(arquivo.caminho_armazenamento):
+                return {'message': 'Arquivo não encontrado no servidor'}, 404
+
+            response = enviar_arquivo(
+                arquivo,
+                disposicao=dados['d'],
+                nome_arquivo=nome_arquivo,
+                blob=blob,
+                usuario_id=dados['u']
             )
+            response.headers['Cache-Control'] = cache_control
+            return response
 
         except Exception as e:
-            print(f"ERRO NO DOWNLOAD: {str(e)}")
+            print(f"ERRO NO DOWNLOAD POR LINK ASSINADO: {str(e)}")
             return {
                 'message': 'Erro ao processar download',
                 'error': str(e)
             }, 500
 
+
+class FileBulkDownloadResource(Resource):
+    @jwt_required()
+    def post(self):
+        """Baixa vários arquivos selecionados como um único ZIP gerado em streaming"""
+        try:
+            usuario_id = get_jwt_identity()
+            usuario = Usuario.query.get(usuario_id)
+            jti = get_jwt()["jti"]
+
+            if not usuario or usuario.conta_exclusao_solicitada:
+                return {'message': 'Usuário não encontrado'}, 404
+            if not usuario.termos_aceitos:
+                return {"error": "Termos não aceitos."}, 403
+
+            sessao = Sessao.query.filter_by(
+                id_usuario=usuario_id,
+                jwt_token=jti,
+                dois_fatores_validado=True
+            ).first()
+            if not sessao:
+                return {"error": "Sessão não encontrada ou não verificada"}, 401
+
+            args = bulk_download_parser.parse_args()
+            max_arquivos = current_app.config['DOWNLOAD_BATCH_MAX_FILES']
+
+            try:
+                ids = list(dict.fromkeys(UUID(file_id) for file_id in args['ids']))
+            except ValueError:
+                return {'message': 'Id de arquivo inválido'}, 400
+            if not ids:
+                return {'message': 'Nenhum arquivo selecionado'}, 400
+            if len(ids) > max_arquivos:
+                return {'message': f'Máximo de {max_arquivos} arquivos por download'}, 400
+
+            # Mesma regra do download individual (dono ou arquivo público), em uma única consulta
+            autorizados = {
+                arquivo.id: arquivo
+                for arquivo in Arquivo.query.filter(
+                    Arquivo.id.in_(ids),
+                    Arquivo.excluido == False,
+                    or_(Arquivo.id_usuario == usuario_id, Arquivo.publico == True)
+                )
+            }
+            negados = [str(file_id) for file_id in ids if file_id not in autorizados]
+            if negados:
+                return {
+                    'message': 'Arquivo não encontrado ou acesso negado',
+                    'ids': negados
+                }, 404
+
+            arquivos = [autorizados[file_id] for file_id in ids]
+            # Montadas antes do log: o commit dele expiraria os Arquivos carregados acima
+            entradas = entradas_arquivos(arquivos)
+
+            registrar_log(
+                usuario_id=usuario_id,
+                categoria=LogCategoria.ARQUIVO,
+                severidade=LogSeveridade.INFO,
+                acao='Download de arquivos em lote',
+                detalhe=f"{len(arquivos)} arquivos",
+                metadados={
+                    'file_ids': [str(arquivo.id) for arquivo in arquivos],
+                    'tamanho_total': sum(arquivo.tamanho for arquivo in arquivos)
+                },
+                ip_origem=request.remote_addr
+            )
+
+            nome_zip = secure_filename(args.get('nome') or '') or 'arquivos'
+            return enviar_zip(f"{nome_zip}.zip", entradas, usuario_id=usuario_id)
+
+        except Exception as e:
+            print(f"ERRO NO DOWNLOAD EM LOTE: {str(e)}")
+            return {
+                'message': 'Erro ao processar download em lote',
+                'error': str(e)
+            }, 500
+
+class DownloadMetricsResource(Resource):
+    def get(self):
+        """Métricas do limitador de banda deste processo (downloads ativos, bytes, espera, recusas)"""
+        token_esperado = current_app.config['DOWNLOAD_METRICS_TOKEN']
+        if not token_esperado:
+            return {'message': 'Métricas de download desativadas'}, 404
+
+        token = request.headers.get('X-Metrics-Token', '')
+        if not hmac.compare_digest(token.encode(), token_esperado.encode()):
+            return {'message': 'Token de métricas inválido'}, 403
+
+        return obter_limitador().metricas(), 200
+
+
 class FileDeleteResource(Resource):
     @jwt_required()
     def delete(self, file_id):
@@ -341,6 +619,7 @@ class FileDeleteResource(Resource):
             
             
             db.session.commit()
+            invalidar_compartilhamentos(id_arquivo=arquivo.id)
 
             
             registrar_log(
@@ -447,6 +726,7 @@ class FileRenameResource(Resource):
             arquivo.data_modificacao = datetime.now(timezone.utc)
             
             db.session.commit()
+            invalidar_compartilhamentos(id_arquivo=arquivo.id)
 
             
             registrar_log(
@@ -521,6 +801,7 @@ class FileVisibilityResource(Resource):
             arquivo.data_modificacao = datetime.now(timezone.utc)
             
             db.session.commit()
+            invalidar_compartilhamentos(id_arquivo=arquivo.id)
 
             
             registrar_log(
@@ -623,6 +904,17 @@ class FilePreviewResource(Resource):
                     'download_url': f'/api/files/{arquivo.id}/download',
                     'preview_url': f'/api/files/{arquivo.id}/preview-content'
                 }, 200
+            elif tem_listagem(arquivo.tipo_mime):
+                return {
+                    'preview_available': True,
+                    'file_id': str(arquivo.id),
+                    'file_name': arquivo.nome_original,
+                    'file_size': arquivo.tamanho,
+                    'file_type': arquivo.tipo_mime,
+                    'is_archive': True,
+                    'download_url': f'/api/files/{arquivo.id}/download',
+                    'archive_url': f'/api/files/{arquivo.id}/archive'
+                }, 200
             else:
                 
                 return {
@@ -668,23 +960,29 @@ class FilePreviewContentResource(Resource):
                 id_usuario=usuario_id,
                 excluido=False
             ).first()
-            print("\n\n\nCaminho do arquivo no DB:", arquivo.caminho_armazenamento)
-            print("Caminho absoluto:", os.path.abspath(arquivo.caminho_armazenamento))
-            print("Arquivo existe?", os.path.exists(arquivo.caminho_armazenamento))
             if not arquivo:
                 return abort(404, description="Arquivo não encontrado ou acesso negado")
-            
-            
-            caminho_absoluto = os.path.abspath(arquivo.caminho_armazenamento)
-            
-            
-            print(f"""
-            [DEBUG] Caminho no banco: {arquivo.caminho_armazenamento}
-            Caminho absoluto: {caminho_absoluto}
-            Existe? {os.path.exists(caminho_absoluto)}
-            """)
-            
-            if not os.path.exists(caminho_absoluto):
+
+            # Cada forma de pré-visualização é uma representação diferente, com ETag própria
+            limite = current_app.config['PREVIEW_TEXT_MAX_BYTES']
+            disposicao_previa = f'inline; filename="{secure_filename(arquivo.nome_original)}"'
+            if arquivo.tipo_mime.startswith('image/'):
+                variante = None
+            elif arquivo.tipo_mime == 'application/pdf':
+                variante = variante_disposicao('inline', secure_filename(arquivo.nome_original))
+            elif 'linha' in request.args or 'inicio' in request.args:
+                variante = 'janela:' + '&'.join(
+                    f"{chave}={request.args[chave]}" for chave in ('linha', 'linhas', 'inicio', 'fim') if chave in request.args
+                ) + f":{limite}"
+            else:
+                variante = f"previa:{limite}:{disposicao_previa}"
+
+            nao_modificado = resposta_nao_modificada(arquivo, variante=variante)
+            if nao_modificado is not None:
+                return nao_modificado
+
+            driver = obter_driver()
+            if not driver.existe(arquivo.caminho_armazenamento):
                 return abort(404, description="Arquivo físico não encontrado no servidor")
             
             
@@ -700,31 +998,231 @@ class FilePreviewContentResource(Resource):
 
             
             if arquivo.tipo_mime.startswith('image/'):
-                return send_file(
-                    caminho_absoluto,  
-                    mimetype=arquivo.tipo_mime
-                )
+                return enviar_arquivo(arquivo, usuario_id=usuario_id)
             elif arquivo.tipo_mime == 'application/pdf':
-                response = make_response(send_file(
-                    caminho_absoluto,  
-                    mimetype=arquivo.tipo_mime
-                ))
-                response.headers['Content-Disposition'] = f'inline; filename="{secure_filename(arquivo.nome_original)}"'
-                return response
+                return enviar_arquivo(
+                    arquivo,
+                    disposicao='inline',
+                    nome_arquivo=secure_filename(arquivo.nome_original),
+                    usuario_id=usuario_id
+                )
+            elif 'linha' in request.args or 'inicio' in request.args:
+                # Janela por linhas (?linha=N&linhas=M) ou por bytes (?inicio=X&fim=Y), em JSON
+                try:
+                    if 'linha' in request.args:
+                        linha = int(request.args['linha'])
+                        linhas = int(request.args.get('linhas', current_app.config['PREVIEW_TEXT_PAGE_LINES']))
+                        if linha < 1 or not 1 <= linhas <= current_app.config['PREVIEW_TEXT_MAX_LINES']:
+                            raise ValueError
+                        janela = janela_linhas(arquivo, linha, linhas, driver=driver)
+                    else:
+                        inicio = int(request.args['inicio'])
+                        fim = int(request.args['fim']) if 'fim' in request.args else None
+                        if inicio < 0 or (fim is not None and fim < inicio):
+                            raise ValueError
+                        janela = janela_bytes(arquivo, inicio, fim, driver=driver)
+                except ValueError:
+                    return {
+                        'message': 'Janela inválida',
+                        'error': f"linha >= 1, 1 <= linhas <= {current_app.config['PREVIEW_TEXT_MAX_LINES']}, 0 <= inicio <= fim"
+                    }, 400
+
+                response = jsonify(janela)
+                return limitar_resposta(aplicar_validadores(response, arquivo, variante=variante), usuario_id)
             else:
-                
-                with open(caminho_absoluto, 'rb') as f: 
-                    content = f.read()
-                
-                response = make_response(content)
-                response.headers['Content-Type'] = arquivo.tipo_mime
-                response.headers['Content-Disposition'] = f'inline; filename="{secure_filename(arquivo.nome_original)}"'
-                return response
+                # Sem janela: o começo do arquivo, até PREVIEW_TEXT_MAX_BYTES, em streaming
+                fim = min(arquivo.tamanho, limite) - 1
+                response = Response(
+                    stream_with_context(iterar_intervalo(arquivo, obter_blob(arquivo), driver, 0, fim)) if fim >= 0 else b'',
+                    mimetype=arquivo.tipo_mime
+                )
+                response.headers['Content-Length'] = str(fim + 1)
+                response.headers['Content-Disposition'] = disposicao_previa
+                if arquivo.tamanho > limite:
+                    response.headers['X-Preview-Truncated'] = 'true'
+                return limitar_resposta(aplicar_validadores(response, arquivo, variante=variante), usuario_id)
 
         except Exception as e:
             print(f"ERRO NO SERVIÇO DE CONTEÚDO: {str(e)}")
             return abort(500, description=f"Erro ao servir conteúdo para pré-visualização: {str(e)}")
 
+
+class FileThumbnailResource(Resource):
+    @jwt_required()
+    def get(self, file_id):
+        """Miniatura (WebP/JPEG) de uma imagem, gerada uma vez e servida do cache de derivados"""
+        try:
+            usuario_id = get_jwt_identity()
+            usuario = Usuario.query.get(usuario_id)
+
+            if not usuario or usuario.conta_exclusao_solicitada:
+                return {'message': 'Usuário não encontrado'}, 404
+            if not usuario.termos_aceitos:
+                return {"error": "Termos não aceitos."}, 403
+
+            jti = get_jwt()["jti"]
+            sessao = Sessao.query.filter_by(
+                id_usuario=usuario_id,
+                jwt_token=jti,
+                dois_fatores_validado=True
+            ).first()
+            if not sessao:
+                return {"error": "Sessão não encontrada ou não verificada"}, 401
+
+            arquivo = Arquivo.query.filter_by(id=file_id, excluido=False).first()
+            # Dono, arquivo público ou arquivo dentro de uma pasta compartilhada com o usuário
+            if not arquivo or not (
+                str(arquivo.id_usuario) == str(usuario_id)
+                or arquivo.publico
+                or (arquivo.id_pasta and verificar_acesso_pasta(arquivo.id_pasta, usuario_id))
+            ):
+                return {'message': 'Arquivo não encontrado ou acesso negado'}, 404
+
+            if not tem_miniatura(arquivo.tipo_mime):
+                return {'message': 'Este tipo de arquivo não tem miniatura'}, 415
+
+            try:
+                tamanho = int(request.args.get('tamanho', 320))
+            except ValueError:
+                tamanho = None
+            if tamanho not in TAMANHOS_MINIATURA:
+                return {'message': f'Tamanho deve ser um de {list(TAMANHOS_MINIATURA)}'}, 400
+
+            formato = request.args.get('formato')
+            if formato is None:
+                formato = 'webp' if request.accept_mimetypes['image/webp'] else 'jpeg'
+            if formato not in FORMATOS_MINIATURA:
+                return {'message': f'Formato deve ser um de {list(FORMATOS_MINIATURA)}'}, 400
+
+            # A miniatura deriva do hash do conteúdo: nunca muda, então o navegador pode guardá-la por um ano
+            etag = f"{arquivo.hash_arquivo}-{tamanho}-{formato}"
+            if request.if_none_match.contains(etag):
+                response = make_response('', 304)
+                del response.headers['Content-Type']
+            else:
+                derivado = obter_miniatura(arquivo, tamanho, formato)
+                if derivado is None:
+                    return {'message': 'Não foi possível gerar a miniatura desta imagem'}, 415
+                response = make_response(DerivativeCache().ler(derivado))
+                response.headers['Content-Type'] = derivado.tipo_mime
+
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+            if 'formato' not in request.args:
+                response.vary.add('Accept')
+            return response
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"ERRO NA MINIATURA: {str(e)}")
+            return {
+                'message': 'Erro ao gerar miniatura',
+                'error': str(e)
+            }, 500
+
+
+class FileArchiveResource(Resource):
+    @jwt_required()
+    def get(self, file_id):
+        """Lista o conteúdo de um zip/tar/7z sem extraí-lo, ou entrega um único item (?membro=caminho)"""
+        try:
+            usuario_id = get_jwt_identity()
+            usuario = Usuario.query.get(usuario_id)
+
+            if not usuario or usuario.conta_exclusao_solicitada:
+                return {'message': 'Usuário não encontrado'}, 404
+            if not usuario.termos_aceitos:
+                return {"error": "Termos não aceitos."}, 403
+
+            jti = get_jwt()["jti"]
+            sessao = Sessao.query.filter_by(
+                id_usuario=usuario_id,
+                jwt_token=jti,
+                dois_fatores_validado=True
+            ).first()
+
+            if not sessao:
+                return {'message': 'Sessão não encontrada ou não verificada'}, 401
+
+            arquivo = Arquivo.query.filter_by(
+                id=file_id,
+                id_usuario=usuario_id,
+                excluido=False
+            ).first()
+            if not arquivo:
+                return {'message': 'Arquivo não encontrado ou acesso negado'}, 404
+
+            if not tem_listagem(arquivo.tipo_mime):
+                return {'message': 'Este arquivo não é um arquivo compactado'}, 415
+
+            # A listagem e cada item são representações diferentes do arquivo, com ETags próprias
+            nome = request.args.get('membro')
+            variante = 'listagem' if nome is None else f"membro:{nome}"
+            nao_modificado = resposta_nao_modificada(arquivo, variante=variante)
+            if nao_modificado is not None:
+                return nao_modificado
+
+            driver = obter_driver()
+            if not driver.existe(arquivo.caminho_armazenamento):
+                return {'message': 'Arquivo físico não encontrado no servidor'}, 404
+
+            try:
+                listagem = listar_conteudo(arquivo, DerivativeCache(driver))
+            except ERROS_ARQUIVO_COMPACTADO as e:
+                return {'message': 'Não foi possível ler o conteúdo deste arquivo compactado', 'error': str(e)}, 415
+
+            if nome is None:
+                entradas = [
+                    {chave: valor for chave, valor in entrada.items() if chave != 'offset'}
+                    for entrada in listagem['entradas']
+                ]
+                response = jsonify({**listagem, 'entradas': entradas})
+                return aplicar_validadores(response, arquivo, variante=variante)
+
+            entrada = buscar_entrada(listagem, nome)
+            if entrada is None and not listagem['truncado']:
+                return {'message': 'Item não encontrado no arquivo compactado'}, 404
+            if entrada is not None and entrada['diretorio']:
+                return {'message': 'O item é um diretório'}, 400
+            if entrada is not None and entrada.get('criptografado'):
+                return {'message': 'O item é protegido por senha'}, 415
+
+            # Abre o membro antes da resposta: item ausente ou arquivo ilegível ainda viram 404/415
+            try:
+                membro = abrir_membro(arquivo, nome, entrada, driver)
+            except KeyError:
+                return {'message': 'Item não encontrado no arquivo compactado'}, 404
+            except ERROS_ARQUIVO_COMPACTADO as e:
+                return {'message': 'Não foi possível ler o conteúdo deste arquivo compactado', 'error': str(e)}, 415
+
+            registrar_log(
+                usuario_id=usuario_id,
+                categoria=LogCategoria.ARQUIVO,
+                severidade=LogSeveridade.INFO,
+                acao='Download de item de arquivo compactado',
+                detalhe=f"Arquivo: {arquivo.nome_original}, item: {nome}",
+                metadados={'file_id': str(arquivo.id), 'membro': nome},
+                ip_origem=request.remote_addr
+            )
+
+            response = Response(
+                stream_with_context(iterar_membro(membro)),
+                mimetype=mimetypes.guess_type(nome)[0] or 'application/octet-stream'
+            )
+            if entrada is not None:
+                response.headers['Content-Length'] = str(entrada['tamanho'])
+            response.headers['Content-Disposition'] = cabecalho_disposicao('attachment', os.path.basename(nome.rstrip('/')))
+            return limitar_resposta(aplicar_validadores(response, arquivo, variante=variante), usuario_id)
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"ERRO NA LISTAGEM DE ARQUIVO COMPACTADO: {str(e)}")
+            return {
+                'message': 'Erro ao ler o arquivo compactado',
+                'error': str(e)
+            }, 500
+
+
 class FileShareResource(Resource):
     @jwt_required()
     def post(self, file_id):
@@ -786,14 +1284,13 @@ class FileShareViewResource(Resource):
         """Endpoint público para visualização de arquivos compartilhados"""
         try:
             
-            compartilhamento = Compartilhamento.query.filter_by(
-                token=token,
-                ativo=True
-            ).first()
+            estado = obter_cache_compartilhamentos().resolver(token)
             
-            if not compartilhamento:
+            if not estado:
                 return abort(404, description="Link não encontrado ou expirado")
 
+            compartilhamento, arquivo = estado
+
             
             if compartilhamento.data_expiracao:
                 now = datetime.now(timezone.utc)
@@ -801,166 +1298,26 @@ class FileShareViewResource(Resource):
                     return abort(403, description="Este link expirou")
 
             
-            if compartilhamento.max_acessos and compartilhamento.acessos >= compartilhamento.max_acessos:
+            if compartilhamento.max_acessos and (compartilhamento.acessos or 0) >= compartilhamento.max_acessos:
                 return abort(403, description="Limite de acessos atingido")
 
-            arquivo = compartilhamento.arquivo
-            compartilhamento.acessos += 1
-            db.session.commit()
+            # Com limite, o acesso é reservado no banco; o estado em cache só evita a ida quando já esgotou
+            if not requisicao_continuacao() and not obter_contador_acessos().registrar(compartilhamento):
+                return abort(403, description="Limite de acessos atingido")
 
             
             if arquivo.publico:
-                
-                viewable_types = [
-                    'image/jpeg', 'image/png', 'image/gif', 'image/webp',
-                    'application/pdf', 
-                    'text/plain', 'text/html', 'text/css',
-                    'application/json'
-                ]
-
-                if arquivo.tipo_mime in viewable_types:
-                    
-                    if arquivo.tipo_mime.startswith('image/'):
-                        content = f"""
-                        <!DOCTYPE html>
-                        <html>
-                        <head>
-                            <title>{arquivo.nome_original}</title>
-                            <style>
-                                body {{ font-family: Arial, sans-serif; text-align: center; }}
-                                .container {{ max-width: 800px; margin: 0 auto; padding: 20px; }}
-                                img {{ max-width: 100%; max-height: 80vh; }}
-                                .btn {{ 
-                                    display: inline-block; 
-                                    padding: 10px 20px; 
-                                    background: #4CAF50; 
-                                    color: white; 
-                                    text-decoration: none; 
-                                    border-radius: 5px; 
-                                    margin-top: 20px;
-                                }}
-                            </style>
-                        </head>
-                        <body>
-                            <div class="container">
-                                <h2>{arquivo.nome_original}</h2>
-                                <img src="/api/files/download-shared/{arquivo.id}?token={token}&preview=true" alt="{arquivo.nome_original}">
-                                <div>
-                                    <p>Tamanho: {round(arquivo.tamanho/(1024*1024), 2)} MB</p>
-                                    <a href="/api/files/download-shared/{arquivo.id}?token={token}" class="btn">Baixar Arquivo</a>
-                                </div>
-                            </div>
-                        </body>
-                        </html>
-                        """
-                    elif arquivo.tipo_mime == 'application/pdf':
-                        content = f"""
-                        <!DOCTYPE html>
-                        <html>
-                        <head>
-                            <title>{arquivo.nome_original}</title>
-                            <style>
-                                body {{ font-family: Arial, sans-serif; }}
-                                .container {{ max-width: 800px; margin: 0 auto; padding: 20px; }}
-                                .btn {{ 
-                                    display: inline-block; 
-                                    padding: 10px 20px; 
-                                    background: #4CAF50; 
-                                    color: white; 
-                                    text-decoration: none; 
-                                    border-radius: 5px; 
-                                    margin-top: 20px;
-                                }}
-                                iframe {{
-                                    width: 100%;
-                                    height: 80vh;
-                                    border: none;
-                                }}
-                            </style>
-                        </head>
-                        <body>
-                            <div class="container">
-                                <h2>{arquivo.nome_original}</h2>
-                                <iframe src="/api/files/download-shared/{arquivo.id}?token={token}&preview=true"></iframe>
-                                <div>
-                                    <p>Tamanho: {round(arquivo.tamanho/(1024*1024), 2)} MB</p>
-                                    <a href="/api/files/download-shared/{arquivo.id}?token={token}" class="btn">Baixar Arquivo</a>
-                                </div>
-                            </div>
-                        </body>
-                        </html>
-                        """
-                    else: 
-                        content = f"""
-                        <!DOCTYPE html>
-                        <html>
-                        <head>
-                            <title>{arquivo.nome_original}</title>
-                            <style>
-                                body {{ font-family: Arial, sans-serif; }}
-                                .container {{ max-width: 800px; margin: 0 auto; padding: 20px; }}
-                                .btn {{ 
-                                    display: inline-block; 
-                                    padding: 10px 20px; 
-                                    background: #4CAF50; 
-                                    color: white; 
-                                    text-decoration: none; 
-                                    border-radius: 5px; 
-                                    margin-top: 20px;
-                                }}
-                                iframe {{
-                                    width: 100%;
-                                    height: 80vh;
-                                    border: 1px solid #ddd;
-                                }}
-                            </style>
-                        </head>
-                        <body>
-                            <div class="container">
-                                <h2>{arquivo.nome_original}</h2>
-                                <iframe src="/api/files/download-shared/{arquivo.id}?token={token}&preview=true"></iframe>
-                                <div>
-                                    <p>Tamanho: {round(arquivo.tamanho/(1024*1024), 2)} MB</p>
-                                    <a href="/api/files/download-shared/{arquivo.id}?token={token}" class="btn">Baixar Arquivo</a>
-                                </div>
-                            </div>
-                        </body>
-                        </html>
-                        """
+                # HTML pronto por (token, versão do arquivo); a revalidação por ETag nem chega a ele
+                etag = versao_pagina(token, arquivo)
+                if request.if_none_match.contains(etag):
+                    response = make_response('', 304)
+                    del response.headers['Content-Type']
                 else:
-                    
-                    content = f"""
-                    <!DOCTYPE html>
-                    <html>
-                    <head>
-                        <title>{arquivo.nome_original}</title>
-                        <style>
-                            body {{ font-family: Arial, sans-serif; text-align: center; padding: 50px; }}
-                            .container {{ max-width: 600px; margin: 0 auto; }}
-                            .btn {{ 
-                                display: inline-block; 
-                                padding: 10px 20px; 
-                                background: #4CAF50; 
-                                color: white; 
-                                text-decoration: none; 
-                                border-radius: 5px; 
-                                margin-top: 20px;
-                            }}
-                        </style>
-                    </head>
-                    <body>
-                        <div class="container">
-                            <h1>{arquivo.nome_original}</h1>
-                            <p>Tamanho: {round(arquivo.tamanho/(1024*1024), 2)} MB</p>
-                            <p>Tipo: {arquivo.tipo_mime}</p>
-                            <a href="/api/files/download-shared/{arquivo.id}?token={token}" class="btn">Baixar Arquivo</a>
-                        </div>
-                    </body>
-                    </html>
-                    """
-
-                response = make_response(content)
-                response.headers['Content-Type'] = 'text/html'
+                    _, corpo = obter_cache_paginas().obter(token, arquivo)
+                    response = make_response(corpo)
+                    response.headers['Content-Type'] = 'text/html; charset=utf-8'
+                response.set_etag(etag)
+                response.headers['Cache-Control'] = cache_control_pagina(compartilhamento)
                 return response
             
             return abort(403, description="Este arquivo é privado e não pode ser acessado através deste link")
@@ -978,30 +1335,35 @@ class FileDownloadSharedResource(Resource):
             if not token:
                 return abort(401, description="Token de acesso necessário")
 
-            compartilhamento = Compartilhamento.query.filter_by(
-                token=token,
-                id_arquivo=file_id,
-                ativo=True
-            ).first()
+            estado = obter_cache_compartilhamentos().resolver(token)
             
-            if not compartilhamento:
+            if not estado or estado[0].id_arquivo != file_id:
                 return abort(403, description="Acesso negado - token inválido")
 
-            arquivo = compartilhamento.arquivo
-            caminho_absoluto = os.path.abspath(arquivo.caminho_armazenamento)
+            compartilhamento, arquivo = estado
+            if compartilhamento.data_expiracao and compartilhamento.data_expiracao < datetime.now(timezone.utc):
+                return abort(403, description="Este link expirou")
+
+            disposicao = None if preview else 'attachment'
+            nome_arquivo = None if preview else arquivo.nome_original
+            nao_modificado = resposta_nao_modificada(
+                arquivo, publico=True, variante=variante_disposicao(disposicao, nome_arquivo)
+            )
+            if nao_modificado is not None:
+                return nao_modificado
             
-            if not os.path.exists(caminho_absoluto):
+            if not obter_driver().existe(arquivo.caminho_armazenamento):
                 return abort(404, description="Arquivo não encontrado no servidor")
 
-            compartilhamento.acessos += 1
-            db.session.commit()
+            if not requisicao_continuacao():
+                obter_contador_acessos().registrar(compartilhamento, reservar=False)
 
           
-            return send_file(
-                caminho_absoluto,
-                as_attachment=not preview,
-                download_name=arquivo.nome_original if not preview else None,
-                mimetype=arquivo.tipo_mime
+            return enviar_arquivo(
+                arquivo,
+                disposicao=disposicao,
+                nome_arquivo=nome_arquivo,
+                publico=True
             )
 
         except Exception as e:
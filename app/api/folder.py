@@ -15,6 +15,8 @@ import json
 import mimetypes
 from werkzeug.exceptions import abort
 import traceback 
+from app.zip_stream import entradas_pasta, enviar_zip
+from app.share_cache import invalidar_compartilhamentos
 
 folder_parser = reqparse.RequestParser()
 folder_parser.add_argument('nome', 
@@ -55,25 +57,6 @@ class FolderContentResource(Resource):
     @jwt_required()
     def get(self, folder_id=None):
         try:
-            def verificar_acesso(pasta_id, usuario_id):
-                    
-                    pasta_atual = Pasta.query.get(pasta_id)
-                    if str(pasta_atual.id_usuario) == str(usuario_id):
-                        return True
-                    
-                   
-                    if CompartilhamentoPasta.query.filter_by(
-                        id_pasta=pasta_id,
-                        id_usuario_compartilhado=usuario_id,
-                        ativo=True
-                    ).first():
-                        return True
-                    
-                    
-                    if pasta_atual.id_pasta_pai:
-                        return verificar_acesso(pasta_atual.id_pasta_pai, usuario_id)
-                    
-                    return False
             def pasta_tem_pai_compartilhado(pasta, usuario_id):
                 if not pasta.id_pasta_pai:
                     
@@ -163,7 +146,7 @@ class FolderContentResource(Resource):
                 
                 
 
-                if not verificar_acesso(folder_id, usuario_id):
+                if not verificar_acesso_pasta(folder_id, usuario_id):
                     return {'message': 'Acesso negado a esta pasta'}, 403
                 
                
@@ -225,6 +208,62 @@ class FolderContentResource(Resource):
             }, 500
 
 
+class FolderDownloadResource(Resource):
+    @jwt_required()
+    def get(self, folder_id):
+        """Baixa a pasta inteira (com subpastas) como um ZIP gerado em streaming"""
+        try:
+            usuario_id = get_jwt_identity()
+            usuario = Usuario.query.get(usuario_id)
+
+            if not usuario or usuario.conta_exclusao_solicitada:
+                return {'message': 'Usuário não encontrado'}, 404
+            if not usuario.termos_aceitos:
+                return {"error": "Termos não aceitos."}, 403
+
+            jti = get_jwt()["jti"]
+            sessao = Sessao.query.filter_by(
+                id_usuario=usuario_id,
+                jwt_token=jti,
+                dois_fatores_validado=True
+            ).first()
+            if not sessao:
+                return {"error": "Sessão não encontrada ou não verificada"}, 401
+
+            pasta = Pasta.query.filter_by(id=folder_id, excluida=False).first()
+            if not pasta:
+                return {'message': 'Pasta não encontrada'}, 404
+
+            # Mesma regra da listagem: quem enxerga a pasta enxerga toda a árvore abaixo dela
+            if not verificar_acesso_pasta(folder_id, usuario_id):
+                return {'message': 'Acesso negado a esta pasta'}, 403
+
+            diretorios, entradas = entradas_pasta(pasta)
+
+            registrar_log(
+                usuario_id=usuario_id,
+                categoria=LogCategoria.PASTA,
+                severidade=LogSeveridade.INFO,
+                acao='Download de pasta',
+                detalhe=f"Pasta: {pasta.nome}",
+                metadados={
+                    'pasta_id': str(pasta.id),
+                    'quantidade_arquivos': len(entradas),
+                    'tamanho_total': sum(arquivo.tamanho for arquivo, _ in entradas)
+                },
+                ip_origem=request.remote_addr
+            )
+
+            return enviar_zip(f"{pasta.nome}.zip", entradas, diretorios, usuario_id)
+
+        except Exception as e:
+            print(f"ERRO NO DOWNLOAD DA PASTA: {str(e)}")
+            return {
+                'message': 'Erro ao baixar pasta',
+                'error': str(e)
+            }, 500
+
+
 class FolderCreateResource(Resource):
     @jwt_required()
     def post(self):
@@ -377,6 +416,8 @@ class FolderDeleteResource(Resource):
                 },
                 ip_origem=request.remote_addr
             )
+            # registrar_log já fez o commit: os links dos arquivos da pasta deixam de valer
+            invalidar_compartilhamentos(id_usuario=usuario_id)
 
             return {
                 'message': 'Pasta e todo seu conteúdo marcados como excluídos com sucesso',
@@ -839,6 +880,25 @@ class FolderSharedWithMeResource(Resource):
 
 
 
+def verificar_acesso_pasta(pasta_id, usuario_id):
+    """Dono da pasta ou usuário com compartilhamento ativo nela ou em alguma pasta acima"""
+    pasta_atual = Pasta.query.get(pasta_id)
+    if str(pasta_atual.id_usuario) == str(usuario_id):
+        return True
+
+    if CompartilhamentoPasta.query.filter_by(
+        id_pasta=pasta_id,
+        id_usuario_compartilhado=usuario_id,
+        ativo=True
+    ).first():
+        return True
+
+    if pasta_atual.id_pasta_pai:
+        return verificar_acesso_pasta(pasta_atual.id_pasta_pai, usuario_id)
+
+    return False
+
+
 def registrar_log(usuario_id, categoria, severidade, acao, detalhe=None, metadados=None, ip_origem=None):
     
     if ip_origem is None:
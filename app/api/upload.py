@@ -0,0 +1,899 @@
+from flask_restful import Resource, reqparse
+from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
+from app.models import Usuario, Arquivo, Sessao, UploadSessao, LogCategoria, LogSeveridade
+from app.extensions import db
+from app.api.file import registrar_log, allowed_file, form_bool
+from app.blob_store import BlobStore, BlobWriter, BLOBS_TMP_DIR
+from app.quota import QuotaReservation
+from app.thumbnails import agendar_miniaturas
+from app.storage import (
+    HashingUploadStream,
+    QuotaExcedidaError,
+    calcular_hash_arquivo,
+    caminho_dados_sessao,
+    chunks_recebidos,
+    copiar_stream,
+    criar_sessao_upload,
+    finalizar_sessao_upload,
+    gravar_chunk,
+    marcar_chunk_recebido,
+    remover_sessao_upload,
+)
+from uuid import uuid4
+from datetime import datetime, timezone, timedelta
+from flask import request, current_app
+from werkzeug.formparser import parse_form_data
+from concurrent.futures import ThreadPoolExecutor
+import os
+import mimetypes
+import zipfile
+
+
+upload_session_parser = reqparse.RequestParser()
+upload_session_parser.add_argument('nome',
+                                   type=str,
+                                   location='json',
+                                   required=True,
+                                   help='Nome do arquivo é obrigatório')
+upload_session_parser.add_argument('tamanho',
+                                   type=int,
+                                   location='json',
+                                   required=True,
+                                   help='Tamanho total do arquivo é obrigatório')
+upload_session_parser.add_argument('tamanho_chunk',
+                                   type=int,
+                                   location='json',
+                                   required=False)
+upload_session_parser.add_argument('hash',
+                                   type=str,
+                                   location='json',
+                                   required=False,
+                                   help='SHA-256 do arquivo completo (opcional)')
+upload_session_parser.add_argument('folder_id',
+                                   type=str,
+                                   location='json')
+upload_session_parser.add_argument('is_public',
+                                   type=bool,
+                                   location='json',
+                                   default=False)
+upload_session_parser.add_argument('description',
+                                   type=str,
+                                   location='json')
+upload_session_parser.add_argument('tags',
+                                   type=str,
+                                   location='json')
+
+
+def buscar_sessao_upload(sessao_id, usuario_id):
+    sessao_upload = UploadSessao.query.filter_by(
+        id=sessao_id,
+        id_usuario=usuario_id,
+        status='ativa'
+    ).first()
+
+    if sessao_upload and sessao_upload.data_expiracao < datetime.now(timezone.utc):
+        return None
+    return sessao_upload
+
+
+def tamanho_esperado_chunk(sessao_upload, indice):
+    if indice < sessao_upload.total_chunks - 1:
+        return sessao_upload.tamanho_chunk
+    return sessao_upload.tamanho - sessao_upload.tamanho_chunk * (sessao_upload.total_chunks - 1)
+
+
+def estado_sessao_upload(sessao_upload):
+    recebidos = chunks_recebidos(sessao_upload.id)
+    bytes_recebidos = sum(tamanho_esperado_chunk(sessao_upload, i) for i in recebidos)
+
+    return {
+        'upload_id': str(sessao_upload.id),
+        'nome': sessao_upload.nome_original,
+        'tamanho': sessao_upload.tamanho,
+        'tamanho_chunk': sessao_upload.tamanho_chunk,
+        'total_chunks': sessao_upload.total_chunks,
+        'chunks_recebidos': recebidos,
+        'offsets_recebidos': [i * sessao_upload.tamanho_chunk for i in recebidos],
+        'chunks_pendentes': sorted(set(range(sessao_upload.total_chunks)) - set(recebidos)),
+        'bytes_recebidos': bytes_recebidos,
+        'status': sessao_upload.status,
+        'data_expiracao': sessao_upload.data_expiracao.isoformat()
+    }
+
+
+class UploadSessionCreateResource(Resource):
+    @jwt_required()
+    def post(self):
+        """Inicia um upload retomável em chunks"""
+        try:
+            usuario_id = get_jwt_identity()
+            usuario = Usuario.query.get(usuario_id)
+            if not usuario or usuario.conta_exclusao_solicitada:
+                return {'message': 'Usuário não encontrado'}, 404
+            if not usuario.termos_aceitos:
+                return {"error": "Termos não aceitos."}, 403
+
+            jti = get_jwt()["jti"]
+            sessao = Sessao.query.filter_by(
+                id_usuario=usuario_id,
+                jwt_token=jti,
+                dois_fatores_validado=True
+            ).first()
+            if not sessao:
+                return {"error": "Sessão não encontrada ou não verificada"}, 401
+
+            args = upload_session_parser.parse_args()
+            nome = args['nome']
+            tamanho = args['tamanho']
+            tamanho_chunk = args.get('tamanho_chunk') or current_app.config['UPLOAD_CHUNK_SIZE']
+
+            if not allowed_file(nome):
+                return {'message': 'Tipo de arquivo não permitido'}, 400
+
+            if tamanho < 0:
+                return {'message': 'Tamanho do arquivo inválido'}, 400
+
+            if tamanho_chunk <= 0 or tamanho_chunk > current_app.config['UPLOAD_CHUNK_MAX_SIZE']:
+                return {
+                    'message': 'Tamanho de chunk inválido',
+                    'max_chunk_size': current_app.config['UPLOAD_CHUNK_MAX_SIZE']
+                }, 400
+
+            if usuario.armazenamento_utilizado + tamanho > usuario.quota_armazenamento:
+                return {'message': 'Quota de armazenamento excedida'}, 400
+
+            existing_file = Arquivo.query.filter_by(
+                id_usuario=usuario_id,
+                nome_original=nome,
+                id_pasta=args.get('folder_id'),
+                excluido=False
+            ).first()
+
+            if existing_file:
+                return {
+                    'message': 'Já existe um arquivo com este nome na pasta de destino',
+                    'file_id': str(existing_file.id),
+                    'existing_file': True
+                }, 409
+
+            sessao_upload = UploadSessao(
+                id=uuid4(),
+                id_usuario=usuario.id,
+                nome_original=nome,
+                tamanho=tamanho,
+                tamanho_chunk=tamanho_chunk,
+                total_chunks=max(1, -(-tamanho // tamanho_chunk)),
+                hash_esperado=args['hash'].lower() if args.get('hash') else None,
+                publico=args['is_public'],
+                descricao=args.get('description'),
+                tags=args.get('tags'),
+                id_pasta=args.get('folder_id'),
+                status='ativa',
+                data_expiracao=datetime.now(timezone.utc) + timedelta(
+                    hours=current_app.config['UPLOAD_SESSION_EXPIRATION_HOURS']
+                )
+            )
+
+            criar_sessao_upload(sessao_upload.id, tamanho)
+            db.session.add(sessao_upload)
+            db.session.commit()
+
+            return estado_sessao_upload(sessao_upload), 201
+
+        except Exception as e:
+            db.session.rollback()
+            if 'sessao_upload' in locals():
+                remover_sessao_upload(sessao_upload.id)
+            print(f"ERRO AO INICIAR UPLOAD: {str(e)}")
+            return {
+                'message': 'Erro ao iniciar upload',
+                'error': str(e)
+            }, 500
+
+
+class UploadSessionResource(Resource):
+    @jwt_required()
+    def get(self, upload_id):
+        """Informa quais chunks/offsets já foram recebidos"""
+        try:
+            usuario_id = get_jwt_identity()
+            usuario = Usuario.query.get(usuario_id)
+            if not usuario or usuario.conta_exclusao_solicitada:
+                return {'message': 'Usuário não encontrado'}, 404
+            if not usuario.termos_aceitos:
+                return {"error": "Termos não aceitos."}, 403
+
+            jti = get_jwt()["jti"]
+            sessao = Sessao.query.filter_by(
+                id_usuario=usuario_id,
+                jwt_token=jti,
+                dois_fatores_validado=True
+            ).first()
+            if not sessao:
+                return {"error": "Sessão não encontrada ou não verificada"}, 401
+
+            sessao_upload = buscar_sessao_upload(upload_id, usuario_id)
+            if not sessao_upload:
+                return {'message': 'Upload não encontrado ou expirado'}, 404
+
+            return estado_sessao_upload(sessao_upload), 200
+
+        except Exception as e:
+            print(f"ERRO AO CONSULTAR UPLOAD: {str(e)}")
+            return {
+                'message': 'Erro ao consultar upload',
+                'error': str(e)
+            }, 500
+
+    @jwt_required()
+    def delete(self, upload_id):
+        """Cancela o upload e descarta os chunks recebidos"""
+        try:
+            usuario_id = get_jwt_identity()
+            usuario = Usuario.query.get(usuario_id)
+            if not usuario or usuario.conta_exclusao_solicitada:
+                return {'message': 'Usuário não encontrado'}, 404
+            if not usuario.termos_aceitos:
+                return {"error": "Termos não aceitos."}, 403
+
+            jti = get_jwt()["jti"]
+            sessao = Sessao.query.filter_by(
+                id_usuario=usuario_id,
+                jwt_token=jti,
+                dois_fatores_validado=True
+            ).first()
+            if not sessao:
+                return {"error": "Sessão não encontrada ou não verificada"}, 401
+
+            sessao_upload = buscar_sessao_upload(upload_id, usuario_id)
+            if not sessao_upload:
+                return {'message': 'Upload não encontrado ou expirado'}, 404
+
+            sessao_upload.status = 'cancelada'
+            db.session.commit()
+            remover_sessao_upload(sessao_upload.id)
+
+            return {'message': 'Upload cancelado', 'upload_id': str(sessao_upload.id)}, 200
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"ERRO AO CANCELAR UPLOAD: {str(e)}")
+            return {
+                'message': 'Erro ao cancelar upload',
+                'error': str(e)
+            }, 500
+
+
+class UploadChunkResource(Resource):
+    @jwt_required()
+    def put(self, upload_id, indice):
+        """Recebe um chunk numerado; o corpo é o conteúdo bruto e o header X-Chunk-SHA256 o seu hash"""
+        try:
+            usuario_id = get_jwt_identity()
+            usuario = Usuario.query.get(usuario_id)
+            if not usuario or usuario.conta_exclusao_solicitada:
+                return {'message': 'Usuário não encontrado'}, 404
+            if not usuario.termos_aceitos:
+                return {"error": "Termos não aceitos."}, 403
+
+            jti = get_jwt()["jti"]
+            sessao = Sessao.query.filter_by(
+                id_usuario=usuario_id,
+                jwt_token=jti,
+                dois_fatores_validado=True
+            ).first()
+            if not sessao:
+                return {"error": "Sessão não encontrada ou não verificada"}, 401
+
+            sessao_upload = buscar_sessao_upload(upload_id, usuario_id)
+            if not sessao_upload:
+                return {'message': 'Upload não encontrado ou expirado'}, 404
+
+            if indice < 0 or indice >= sessao_upload.total_chunks:
+                return {'message': 'Índice de chunk inválido'}, 400
+
+            checksum = request.headers.get('X-Chunk-SHA256')
+            if not checksum:
+                return {'message': 'Header X-Chunk-SHA256 é obrigatório'}, 400
+
+            tamanho_esperado = tamanho_esperado_chunk(sessao_upload, indice)
+            if request.content_length is not None and request.content_length != tamanho_esperado:
+                return {
+                    'message': 'Tamanho do chunk inválido',
+                    'tamanho_esperado': tamanho_esperado
+                }, 400
+
+            # Requisições paralelas do mesmo upload são seguras: cada chunk grava apenas o seu intervalo
+            recebido, chunk_hash = gravar_chunk(
+                sessao_upload.id,
+                indice,
+                indice * sessao_upload.tamanho_chunk,
+                request.stream,
+                tamanho_esperado
+            )
+
+            if recebido != tamanho_esperado:
+                return {
+                    'message': 'Tamanho do chunk inválido',
+                    'tamanho_esperado': tamanho_esperado,
+                    'tamanho_recebido': recebido
+                }, 400
+
+            if chunk_hash != checksum.strip().lower():
+                return {
+                    'message': 'Checksum do chunk não confere',
+                    'hash_recebido': chunk_hash
+                }, 400
+
+            marcar_chunk_recebido(sessao_upload.id, indice)
+
+            return {
+                'message': 'Chunk recebido',
+                'upload_id': str(sessao_upload.id),
+                'indice': indice,
+                'offset': indice * sessao_upload.tamanho_chunk,
+                'tamanho': recebido
+            }, 200
+
+        except Exception as e:
+            print(f"ERRO AO RECEBER CHUNK: {str(e)}")
+            return {
+                'message': 'Erro ao receber chunk',
+                'error': str(e)
+            }, 500
+
+
+class UploadSessionCompleteResource(Resource):
+    @jwt_required()
+    def post(self, upload_id):
+        """Monta o arquivo final a partir dos chunks e cria o registro em Arquivo"""
+        reserva = None
+        try:
+            usuario_id = get_jwt_identity()
+            usuario = Usuario.query.get(usuario_id)
+            if not usuario or usuario.conta_exclusao_solicitada:
+                return {'message': 'Usuário não encontrado'}, 404
+            if not usuario.termos_aceitos:
+                return {"error": "Termos não aceitos."}, 403
+
+            jti = get_jwt()["jti"]
+            sessao = Sessao.query.filter_by(
+                id_usuario=usuario_id,
+                jwt_token=jti,
+                dois_fatores_validado=True
+            ).first()
+            if not sessao:
+                return {"error": "Sessão não encontrada ou não verificada"}, 401
+
+            sessao_upload = buscar_sessao_upload(upload_id, usuario_id)
+            if not sessao_upload:
+                return {'message': 'Upload não encontrado ou expirado'}, 404
+
+            estado = estado_sessao_upload(sessao_upload)
+            if estado['chunks_pendentes']:
+                return {
+                    'message': 'Ainda existem chunks pendentes',
+                    'chunks_pendentes': estado['chunks_pendentes']
+                }, 409
+
+            existing_file = Arquivo.query.filter_by(
+                id_usuario=usuario_id,
+                nome_original=sessao_upload.nome_original,
+                id_pasta=sessao_upload.id_pasta,
+                excluido=False
+            ).first()
+
+            if existing_file:
+                return {
+                    'message': 'Já existe um arquivo com este nome na pasta de destino',
+                    'file_id': str(existing_file.id),
+                    'existing_file': True
+                }, 409
+
+            file_hash = calcular_hash_arquivo(caminho_dados_sessao(sessao_upload.id))
+
+            if sessao_upload.hash_esperado and file_hash != sessao_upload.hash_esperado:
+                return {
+                    'message': 'Hash do arquivo montado não confere com o informado',
+                    'hash_calculado': file_hash
+                }, 422
+
+            reserva = QuotaReservation(usuario.id)
+            if not reserva.reservar(sessao_upload.tamanho):
+                return {'message': 'Quota de armazenamento excedida'}, 400
+
+            file_ext = os.path.splitext(sessao_upload.nome_original)[1].lower()
+            unique_filename = f"{uuid4().hex}{file_ext}"
+            mime_type, _ = mimetypes.guess_type(sessao_upload.nome_original)
+            if not mime_type:
+                mime_type = 'application/octet-stream'
+
+            blob_store = BlobStore()
+            file_path, precisa_gravar = blob_store.adicionar_referencia(file_hash, sessao_upload.tamanho)
+            if precisa_gravar:
+                gravacao = finalizar_sessao_upload(sessao_upload.id, file_path, BlobWriter(), mime_type)
+                blob_store.registrar_gravacao(file_hash, file_path, gravacao)
+
+            new_file = Arquivo(
+                id=uuid4(),
+                id_usuario=usuario.id,
+                nome_criptografado=unique_filename,
+                nome_original=sessao_upload.nome_original,
+                caminho_armazenamento=file_path,
+                tamanho=sessao_upload.tamanho,
+                tipo_mime=mime_type,
+                publico=sessao_upload.publico,
+                descricao=sessao_upload.descricao,
+                tags=sessao_upload.tags,
+                hash_arquivo=file_hash,
+                id_pasta=sessao_upload.id_pasta
+            )
+
+            db.session.add(new_file)
+            sessao_upload.status = 'concluida'
+            sessao_upload.id_arquivo = new_file.id
+            db.session.commit()
+            reserva.confirmar()
+            remover_sessao_upload(sessao_upload.id)
+            agendar_miniaturas([new_file])
+
+            registrar_log(
+                usuario_id=usuario_id,
+                categoria=LogCategoria.ARQUIVO,
+                severidade=LogSeveridade.INFO,
+                acao='Upload retomável concluído',
+                detalhe=f"Arquivo: {new_file.nome_original}",
+                metadados={
+                    'file_id': str(new_file.id),
+                    'upload_id': str(sessao_upload.id),
+                    'file_size': new_file.tamanho,
+                    'chunks': sessao_upload.total_chunks
+                },
+                ip_origem=request.remote_addr
+            )
+
+            return {
+                'message': 'Upload realizado com sucesso',
+                'file_id': str(new_file.id),
+                'file_name': new_file.nome_original,
+                'file_size': new_file.tamanho,
+                'mime_type': mime_type
+            }, 201
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"ERRO AO FINALIZAR UPLOAD: {str(e)}")
+            return {
+                'message': 'Erro ao finalizar upload',
+                'error': str(e)
+            }, 500
+
+        finally:
+            if reserva:
+                reserva.liberar()
+
+
+upload_probe_parser = reqparse.RequestParser()
+upload_probe_parser.add_argument('nome',
+                                 type=str,
+                                 location='json',
+                                 required=True,
+                                 help='Nome do arquivo é obrigatório')
+upload_probe_parser.add_argument('tamanho',
+                                 type=int,
+                                 location='json',
+                                 required=True,
+                                 help='Tamanho do arquivo é obrigatório')
+upload_probe_parser.add_argument('hash',
+                                 type=str,
+                                 location='json',
+                                 required=True,
+                                 help='SHA-256 do arquivo é obrigatório')
+upload_probe_parser.add_argument('folder_id',
+                                 type=str,
+                                 location='json')
+upload_probe_parser.add_argument('is_public',
+                                 type=bool,
+                                 location='json',
+                                 default=False)
+upload_probe_parser.add_argument('description',
+                                 type=str,
+                                 location='json')
+upload_probe_parser.add_argument('tags',
+                                 type=str,
+                                 location='json')
+
+
+class FileUploadProbeResource(Resource):
+    @jwt_required()
+    def post(self):
+        """Cria o arquivo sem transferir o conteúdo quando o servidor já possui os mesmos bytes"""
+        reserva = None
+        try:
+            usuario_id = get_jwt_identity()
+            usuario = Usuario.query.get(usuario_id)
+            if not usuario or usuario.conta_exclusao_solicitada:
+                return {'message': 'Usuário não encontrado'}, 404
+            if not usuario.termos_aceitos:
+                return {"error": "Termos não aceitos."}, 403
+
+            jti = get_jwt()["jti"]
+            sessao = Sessao.query.filter_by(
+                id_usuario=usuario_id,
+                jwt_token=jti,
+                dois_fatores_validado=True
+            ).first()
+            if not sessao:
+                return {"error": "Sessão não encontrada ou não verificada"}, 401
+
+            args = upload_probe_parser.parse_args()
+            nome = args['nome']
+            tamanho = args['tamanho']
+            file_hash = args['hash'].strip().lower()
+
+            if not allowed_file(nome):
+                return {'message': 'Tipo de arquivo não permitido'}, 400
+
+            if len(file_hash) != 64 or any(c not in '0123456789abcdef' for c in file_hash):
+                return {'message': 'Hash SHA-256 inválido'}, 400
+
+            if tamanho < 0:
+                return {'message': 'Tamanho do arquivo inválido'}, 400
+
+            existing_file = Arquivo.query.filter_by(
+                id_usuario=usuario_id,
+                nome_original=nome,
+                id_pasta=args.get('folder_id'),
+                excluido=False
+            ).first()
+
+            if existing_file:
+                return {
+                    'message': 'Já existe um arquivo com este nome na pasta de destino',
+                    'file_id': str(existing_file.id),
+                    'existing_file': True
+                }, 409
+
+            # Por padrão só conteúdo do próprio usuário é reaproveitado, para não revelar o que outros armazenam
+            if current_app.config['UPLOAD_DEDUP_SCOPE'] != 'global':
+                conteudo_do_usuario = Arquivo.query.filter_by(
+                    id_usuario=usuario_id,
+                    hash_arquivo=file_hash,
+                    tamanho=tamanho,
+                    excluido=False
+                ).first()
+                if not conteudo_do_usuario:
+                    return {'upload_required': True}, 200
+
+            reserva = QuotaReservation(usuario.id)
+            if not reserva.reservar(tamanho):
+                return {'message': 'Quota de armazenamento excedida'}, 400
+
+            file_path = BlobStore().referenciar_existente(file_hash, tamanho)
+            if not file_path:
+                db.session.rollback()
+                return {'upload_required': True}, 200
+
+            mime_type, _ = mimetypes.guess_type(nome)
+            if not mime_type:
+                mime_type = 'application/octet-stream'
+
+            file_ext = os.path.splitext(nome)[1].lower()
+            new_file = Arquivo(
+                id=uuid4(),
+                id_usuario=usuario.id,
+                nome_criptografado=f"{uuid4().hex}{file_ext}",
+                nome_original=nome,
+                caminho_armazenamento=file_path,
+                tamanho=tamanho,
+                tipo_mime=mime_type,
+                publico=args['is_public'],
+                descricao=args.get('description'),
+                tags=args.get('tags'),
+                hash_arquivo=file_hash,
+                id_pasta=args.get('folder_id')
+            )
+
+            db.session.add(new_file)
+            db.session.commit()
+            reserva.confirmar()
+            agendar_miniaturas([new_file])
+
+            registrar_log(
+                usuario_id=usuario_id,
+                categoria=LogCategoria.ARQUIVO,
+                severidade=LogSeveridade.INFO,
+                acao='Upload deduplicado',
+                detalhe=f"Arquivo: {new_file.nome_original}",
+                metadados={
+                    'file_id': str(new_file.id),
+                    'file_size': new_file.tamanho
+                },
+                ip_origem=request.remote_addr
+            )
+
+            return {
+                'message': 'Upload realizado com sucesso',
+                'upload_required': False,
+                'file_id': str(new_file.id),
+                'file_name': new_file.nome_original,
+                'file_size': new_file.tamanho,
+                'mime_type': mime_type
+            }, 201
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"ERRO NA VERIFICAÇÃO DE UPLOAD: {str(e)}")
+            return {
+                'message': 'Erro ao verificar upload',
+                'error': str(e)
+            }, 500
+
+        finally:
+            if reserva:
+                reserva.liberar()
+
+
+def extrair_zip(abrir_zip, membros, trabalhadores, gravador):
+    """Descompacta os membros do zip em paralelo, calculando o hash e codificando cada um"""
+
+    def extrair(info):
+        stream = HashingUploadStream(
+            gravador,
+            BLOBS_TMP_DIR,
+            limite_bytes=info.file_size,
+            tipo_mime=mimetypes.guess_type(info.filename)[0]
+        )
+        try:
+            # Cada thread usa seu próprio handle: ZipFile não é seguro para leitura concorrente
+            with abrir_zip() as leitor_zip, zipfile.ZipFile(leitor_zip) as zf, zf.open(info) as origem:
+                copiar_stream(origem, stream)
+            stream.close()
+            return stream
+        except Exception:
+            stream.descartar()
+            raise
+
+    with ThreadPoolExecutor(max_workers=trabalhadores) as executor:
+        futuros = [(info, executor.submit(extrair, info)) for info in membros]
+
+    resultados = []
+    for info, futuro in futuros:
+        try:
+            resultados.append((os.path.basename(info.filename), futuro.result(), None))
+        except Exception as e:
+            resultados.append((os.path.basename(info.filename), None, str(e)))
+    return resultados
+
+
+class FileBatchUploadResource(Resource):
+    @jwt_required()
+    def post(self):
+        """Recebe vários arquivos (partes 'files' ou um zip em 'archive') em uma única requisição"""
+        streams = []
+        reserva = None
+        try:
+            if not request.content_type or not request.content_type.startswith('multipart/form-data'):
+                return {'message': 'Content-Type deve ser multipart/form-data'}, 415
+
+            usuario_id = get_jwt_identity()
+            usuario = Usuario.query.get(usuario_id)
+            if not usuario or usuario.conta_exclusao_solicitada:
+                return {'message': 'Usuário não encontrado'}, 404
+            if not usuario.termos_aceitos:
+                return {"error": "Termos não aceitos."}, 403
+
+            jti = get_jwt()["jti"]
+            sessao = Sessao.query.filter_by(
+                id_usuario=usuario_id,
+                jwt_token=jti,
+                dois_fatores_validado=True
+            ).first()
+            if not sessao:
+                return {"error": "Sessão não encontrada ou não verificada"}, 401
+
+            max_arquivos = current_app.config['UPLOAD_BATCH_MAX_FILES']
+            trabalhadores = current_app.config['UPLOAD_BATCH_WORKERS']
+
+            reserva = QuotaReservation(usuario.id)
+            if request.content_length:
+                reserva.reservar_disponivel(request.content_length)
+
+            # As threads não têm contexto da aplicação, então o gravador é criado aqui
+            gravador = BlobWriter()
+
+            # As partes chegam em sequência: a anterior é fechada ao abrir a próxima para não acumular descritores
+            def stream_factory(total_content_length, content_type, filename, content_length=None):
+                if streams:
+                    streams[-1].close()
+                stream = HashingUploadStream(
+                    gravador,
+                    BLOBS_TMP_DIR,
+                    reserva=reserva,
+                    tipo_mime=mimetypes.guess_type(filename or '')[0]
+                )
+                streams.append(stream)
+                return stream
+
+            try:
+                _, form, files = parse_form_data(
+                    request.environ,
+                    stream_factory=stream_factory,
+                    max_form_parts=max_arquivos + 10
+                )
+            except QuotaExcedidaError:
+                return {'message': 'Quota de armazenamento excedida'}, 400
+
+            for stream in streams:
+                stream.close()
+
+            folder_id = form.get('folder_id')
+            rejeitados = []
+            candidatos = []
+
+            for uploaded_file in files.getlist('files'):
+                if not uploaded_file.filename:
+                    continue
+                candidatos.append((uploaded_file.filename, uploaded_file.stream, None))
+
+            archive = files.get('archive')
+            if archive and archive.filename:
+                if not archive.filename.lower().endswith('.zip'):
+                    return {'message': 'Apenas arquivos .zip podem ser expandidos'}, 400
+
+                # O zip também chegou cifrado: é lido decifrando só os trechos necessários
+                abrir_zip = archive.stream.abrir_leitura
+                with abrir_zip() as leitor_zip:
+                    if not zipfile.is_zipfile(leitor_zip):
+                        return {'message': 'Arquivo zip inválido'}, 400
+
+                with abrir_zip() as leitor_zip, zipfile.ZipFile(leitor_zip) as zf:
+                    membros = []
+                    for info in zf.infolist():
+                        nome = os.path.basename(info.filename)
+                        if info.is_dir() or not nome or info.filename.startswith('__MACOSX/'):
+                            continue
+                        if not allowed_file(nome):
+                            rejeitados.append({'nome': nome, 'motivo': 'Tipo de arquivo não permitido'})
+                            continue
+                        membros.append(info)
+
+                if len(candidatos) + len(membros) > max_arquivos:
+                    return {'message': f'Máximo de {max_arquivos} arquivos por lote'}, 400
+
+                # O zip em si não é armazenado: a reserva passa a ser a dos arquivos avulsos mais o
+                # conteúdo descompactado, pelos tamanhos declarados no zip
+                try:
+                    reserva.ajustar(
+                        sum(stream.tamanho for _, stream, _ in candidatos) +
+                        sum(info.file_size for info in membros)
+                    )
+                except QuotaExcedidaError:
+                    return {'message': 'Quota de armazenamento excedida'}, 400
+
+                for nome, stream, erro in extrair_zip(abrir_zip, membros, trabalhadores, gravador):
+                    if stream:
+                        streams.append(stream)
+                    candidatos.append((nome, stream, erro))
+
+            if not candidatos:
+                return {'message': 'Nenhum arquivo recebido'}, 400
+
+            if len(candidatos) > max_arquivos:
+                return {'message': f'Máximo de {max_arquivos} arquivos por lote'}, 400
+
+            nomes = [nome for nome, _, _ in candidatos]
+            existentes = {
+                nome for (nome,) in db.session.query(Arquivo.nome_original).filter(
+                    Arquivo.id_usuario == usuario_id,
+                    Arquivo.id_pasta == folder_id,
+                    Arquivo.excluido == False,
+                    Arquivo.nome_original.in_(nomes)
+                )
+            }
+
+            aceitos = []
+            nomes_no_lote = set()
+            for nome, stream, erro in candidatos:
+                if erro:
+                    rejeitados.append({'nome': nome, 'motivo': erro})
+                elif not allowed_file(nome):
+                    rejeitados.append({'nome': nome, 'motivo': 'Tipo de arquivo não permitido'})
+                elif nome in existentes:
+                    rejeitados.append({'nome': nome, 'motivo': 'Já existe um arquivo com este nome na pasta de destino'})
+                elif nome in nomes_no_lote:
+                    rejeitados.append({'nome': nome, 'motivo': 'Nome repetido no lote'})
+                else:
+                    nomes_no_lote.add(nome)
+                    aceitos.append((nome, stream))
+
+            if not aceitos:
+                return {'message': 'Nenhum arquivo aceito', 'rejeitados': rejeitados}, 400
+
+            try:
+                reserva.ajustar(sum(stream.tamanho for _, stream in aceitos))
+            except QuotaExcedidaError:
+                reserva.liberar()
+                return {'message': 'Quota de armazenamento excedida'}, 400
+
+            conteudos = {}
+            for _, stream in aceitos:
+                tamanho, quantidade = conteudos.get(stream.hexdigest(), (stream.tamanho, 0))
+                conteudos[stream.hexdigest()] = (tamanho, quantidade + 1)
+            blob_store = BlobStore()
+            blobs = blob_store.adicionar_referencias(conteudos)
+
+            # Só o primeiro stream de cada conteúdo novo é publicado; fsync e envio ao armazenamento rodam no pool
+            a_gravar = {}
+            for nome, stream in aceitos:
+                caminho, precisa_gravar = blobs[stream.hexdigest()]
+                if precisa_gravar and stream.hexdigest() not in a_gravar:
+                    a_gravar[stream.hexdigest()] = (stream, caminho)
+
+            with ThreadPoolExecutor(max_workers=trabalhadores) as executor:
+                gravados = list(executor.map(lambda item: item[0].finalizar(item[1]), a_gravar.values()))
+            for (file_hash, (_, caminho)), gravacao in zip(a_gravar.items(), gravados):
+                blob_store.registrar_gravacao(file_hash, caminho, gravacao)
+
+            publico = form_bool(form.get('is_public', False))
+            novos = []
+            for nome, stream in aceitos:
+                mime_type, _ = mimetypes.guess_type(nome)
+                novos.append(Arquivo(
+                    id=uuid4(),
+                    id_usuario=usuario.id,
+                    nome_criptografado=f"{uuid4().hex}{os.path.splitext(nome)[1].lower()}",
+                    nome_original=nome,
+                    caminho_armazenamento=blobs[stream.hexdigest()][0],
+                    tamanho=stream.tamanho,
+                    tipo_mime=mime_type or 'application/octet-stream',
+                    publico=publico,
+                    descricao=form.get('description'),
+                    tags=form.get('tags'),
+                    hash_arquivo=stream.hexdigest(),
+                    id_pasta=folder_id
+                ))
+
+            db.session.add_all(novos)
+            db.session.commit()
+            reserva.confirmar()
+            agendar_miniaturas(novos)
+
+            registrar_log(
+                usuario_id=usuario_id,
+                categoria=LogCategoria.ARQUIVO,
+                severidade=LogSeveridade.INFO,
+                acao='Upload em lote',
+                detalhe=f"{len(novos)} arquivo(s) enviados",
+                metadados={
+                    'quantidade': len(novos),
+                    'rejeitados': len(rejeitados),
+                    'total_bytes': sum(a.tamanho for a in novos)
+                },
+                ip_origem=request.remote_addr
+            )
+
+            return {
+                'message': 'Upload em lote realizado com sucesso',
+                'arquivos': [{
+                    'file_id': str(a.id),
+                    'file_name': a.nome_original,
+                    'file_size': a.tamanho,
+                    'mime_type': a.tipo_mime
+                } for a in novos],
+                'rejeitados': rejeitados
+            }, 201
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"ERRO NO UPLOAD EM LOTE: {str(e)}")
+            return {
+                'message': 'Erro no processamento do lote',
+                'error': str(e)
+            }, 500
+
+        finally:
+            for stream in streams:
+                stream.descartar()
+            if reserva:
+                reserva.liberar()
@@ -0,0 +1,337 @@
+import io
+import os
+import json
+import tarfile
+import tempfile
+import zipfile
+from datetime import datetime, timezone
+from flask import current_app
+import py7zr
+from py7zr.exceptions import Bad7zFile
+from py7zr.io import Py7zIO, WriterFactory
+from app.storage import CHUNK_SIZE
+from app.blob_store import BLOBS_TMP_DIR, obter_blob
+from app.delivery import iterar_intervalo
+from app.derivatives import DerivativeCache
+
+
+TIPO_LISTAGEM = 'listagem-arquivo-v1'
+
+MIME_ARQUIVOS_COMPACTADOS = {
+    'application/zip',
+    'application/x-zip-compressed',
+    'application/x-tar',
+    'application/gzip',
+    'application/x-gzip',
+    'application/x-compressed-tar',
+    'application/x-bzip2',
+    'application/x-xz',
+    'application/x-7z-compressed',
+}
+
+ERROS_ARQUIVO_COMPACTADO = (zipfile.BadZipFile, tarfile.TarError, Bad7zFile, EOFError, NotImplementedError, ValueError)
+
+# Buffer das leituras por intervalo com seek: o suficiente para um cabeçalho de tar sem ler o
+# membro junto. Leituras sequenciais (tar.gz, conteúdo de membros) usam blocos de CHUNK_SIZE.
+TAMANHO_BUFFER_SEEK = 8 * 1024
+
+
+class LeitorArmazenado(io.RawIOBase):
+    """Arquivo só de leitura, com seek, sobre o conteúdo original no armazenamento.
+
+    Cada leitura vira uma leitura por intervalo no driver (descomprimindo/decifrando só o
+    trecho necessário), então zipfile/tarfile/py7zr leem diretório central e cabeçalhos
+    sem baixar o arquivo inteiro.
+    """
+
+    def __init__(self, arquivo, blob, driver, tamanho=None):
+        self.arquivo = arquivo
+        self.blob = blob
+        self.driver = driver
+        # Um tamanho menor que o do arquivo limita as leituras a um trecho inicial dele
+        self.tamanho = arquivo.tamanho if tamanho is None else tamanho
+        self.posicao = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.posicao
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.posicao
+        elif whence == io.SEEK_END:
+            offset += self.tamanho
+        if offset < 0:
+            raise ValueError('Posição negativa')
+        self.posicao = offset
+        return offset
+
+    def readinto(self, buffer):
+        fim = min(self.posicao + len(buffer), self.tamanho) - 1
+        if fim < self.posicao:
+            return 0
+
+        destino = memoryview(buffer).cast('B')
+        lidos = 0
+        for bloco in iterar_intervalo(self.arquivo, self.blob, self.driver, self.posicao, fim):
+            destino[lidos:lidos + len(bloco)] = bloco
+            lidos += len(bloco)
+        self.posicao += lidos
+        return lidos
+
+
+def tem_listagem(tipo_mime):
+    return tipo_mime in MIME_ARQUIVOS_COMPACTADOS
+
+
+def abrir_leitor(arquivo, driver, tamanho_buffer=TAMANHO_BUFFER_SEEK):
+    return io.BufferedReader(LeitorArmazenado(arquivo, obter_blob(arquivo), driver), tamanho_buffer)
+
+
+def detectar_formato(leitor):
+    """'zip', '7z', 'tar' (sem compressão, lido com seeks) ou 'tar-stream' (tar.gz/bz2/xz)"""
+    leitor.seek(0)
+    inicio = leitor.read(512)
+    leitor.seek(0)
+
+    if inicio.startswith((b'PK\x03\x04', b'PK\x05\x06')):
+        return 'zip'
+    if inicio.startswith(b"7z\xbc\xaf'\x1c"):
+        return '7z'
+    if inicio[257:262] == b'ustar':
+        return 'tar'
+    if inicio.startswith((b'\x1f\x8b', b'BZh', b'\xfd7zXZ\x00')):
+        return 'tar-stream'
+    # tar antigo (v7), sem a assinatura ustar
+    return 'tar'
+
+
+def _data_iso(data):
+    return data.isoformat() if data else None
+
+
+def _entrada_tar(membro, formato):
+    entrada = {
+        'nome': membro.name,
+        'tamanho': membro.size,
+        'tamanho_comprimido': membro.size if formato == 'tar' else None,
+        'diretorio': membro.isdir(),
+        'data_modificacao': _data_iso(datetime.fromtimestamp(membro.mtime, timezone.utc)) if membro.mtime else None
+    }
+    if formato == 'tar' and membro.isfile():
+        # tar sem compressão: o membro é um trecho contínuo, servido depois com uma leitura por intervalo
+        entrada['offset'] = membro.offset_data
+    return entrada
+
+
+def _membros_tar(tar):
+    """Itera os membros sem acumular TarInfo em tar.members (memória constante para tar enormes)"""
+    while True:
+        membro = tar.next()
+        if membro is None:
+            return
+        tar.members = []
+        yield membro
+
+
+def _listar(leitor, formato, maximo):
+    entradas = []
+    total = 0
+
+    if formato == 'zip':
+        with zipfile.ZipFile(leitor) as zip_arquivo:
+            for info in zip_arquivo.infolist():
+                total += 1
+                if len(entradas) < maximo:
+                    entradas.append({
+                        'nome': info.filename,
+                        'tamanho': info.file_size,
+                        'tamanho_comprimido': info.compress_size,
+                        'diretorio': info.is_dir(),
+                        'data_modificacao': _data_iso(datetime(*info.date_time)),
+                        'criptografado': bool(info.flag_bits & 0x1)
+                    })
+
+    elif formato == '7z':
+        with py7zr.SevenZipFile(leitor) as sete_zip:
+            for info in sete_zip.list():
+                total += 1
+                if len(entradas) < maximo:
+                    entradas.append({
+                        'nome': info.filename,
+                        'tamanho': info.uncompressed,
+                        'tamanho_comprimido': info.compressed,
+                        'diretorio': info.is_directory,
+                        'data_modificacao': _data_iso(info.creationtime)
+                    })
+
+    else:
+        modo = 'r:' if formato == 'tar' else 'r|*'
+        with tarfile.open(fileobj=leitor, mode=modo) as tar:
+            for membro in _membros_tar(tar):
+                total += 1
+                if len(entradas) < maximo:
+                    entradas.append(_entrada_tar(membro, formato))
+
+    return {
+        'formato': formato,
+        'total': total,
+        'truncado': total > len(entradas),
+        'entradas': entradas
+    }
+
+
+def listar_conteudo(arquivo, cache=None):
+    """Listagem (nomes, tamanhos, tamanhos comprimidos) do arquivo compactado, do cache ou montada agora.
+
+    zip e 7z têm o índice no fim do arquivo e tar sem compressão tem um cabeçalho antes de cada
+    membro: em todos eles só esses trechos são lidos. tar.gz/bz2/xz não permitem seek e são
+    lidos uma vez em streaming. A listagem fica no cache de derivados, por hash do conteúdo.
+    """
+    cache = cache or DerivativeCache()
+    derivado = cache.obter(arquivo.hash_arquivo, TIPO_LISTAGEM)
+    if derivado is not None:
+        return json.loads(cache.ler(derivado))
+
+    leitor = abrir_leitor(arquivo, cache.driver)
+    formato = detectar_formato(leitor)
+    if formato == 'tar-stream':
+        leitor = abrir_leitor(arquivo, cache.driver, CHUNK_SIZE)
+    listagem = _listar(leitor, formato, current_app.config['ARCHIVE_PREVIEW_MAX_ENTRIES'])
+
+    os.makedirs(BLOBS_TMP_DIR, exist_ok=True)
+    descritor, caminho = tempfile.mkstemp(dir=BLOBS_TMP_DIR, suffix='.json')
+    try:
+        with os.fdopen(descritor, 'w', encoding='utf-8') as saida:
+            json.dump(listagem, saida, ensure_ascii=False)
+        cache.gravar(arquivo.hash_arquivo, TIPO_LISTAGEM, caminho, 'application/json')
+    finally:
+        if os.path.exists(caminho):
+            os.remove(caminho)
+    return listagem
+
+
+def buscar_entrada(listagem, nome):
+    for entrada in listagem['entradas']:
+        if entrada['nome'] == nome:
+            return entrada
+    return None
+
+
+class _MembroTemporario(Py7zIO):
+    """Destino de um membro do 7z: em memória enquanto pequeno, em disco depois"""
+
+    def __init__(self):
+        self.arquivo = tempfile.SpooledTemporaryFile(max_size=CHUNK_SIZE * 8, dir=BLOBS_TMP_DIR)
+
+    def write(self, s):
+        return self.arquivo.write(s)
+
+    def read(self, size=None):
+        return self.arquivo.read(size)
+
+    def seek(self, offset, whence=0):
+        return self.arquivo.seek(offset, whence)
+
+    def flush(self):
+        self.arquivo.flush()
+
+    def size(self):
+        return self.arquivo.tell()
+
+
+class _FabricaMembro(WriterFactory):
+    def __init__(self):
+        self.membros = {}
+
+    def create(self, filename):
+        self.membros[filename] = _MembroTemporario()
+        return self.membros[filename]
+
+
+class _MembroAberto:
+    """Conteúdo de um membro já localizado; fechar fecha também o que foi aberto para lê-lo"""
+
+    def __init__(self, conteudo, *abertos):
+        self.conteudo = conteudo
+        self._abertos = abertos
+
+    def read(self, size=-1):
+        return self.conteudo.read(size)
+
+    def close(self):
+        for aberto in (self.conteudo, *self._abertos):
+            aberto.close()
+
+
+def _ler_blocos(entrada):
+    for bloco in iter(lambda: entrada.read(CHUNK_SIZE), b''):
+        yield bloco
+
+
+def abrir_membro(arquivo, nome, entrada=None, driver=None):
+    """Localiza e abre um único membro do arquivo compactado, sem extrair os demais.
+
+    Membros de tar sem compressão são lidos direto do trecho do arquivo (offset da listagem);
+    zip descomprime só o membro; 7z descomprime até o membro (em arquivos sólidos, o bloco
+    dele) para um temporário; tar.gz/bz2/xz são percorridos em streaming até o membro.
+    Levanta KeyError se o membro não existe e um de ERROS_ARQUIVO_COMPACTADO se o arquivo
+    não pode ser lido, antes de qualquer byte do membro ser entregue.
+    """
+    if entrada is not None and entrada.get('offset') is not None:
+        trecho = LeitorArmazenado(arquivo, obter_blob(arquivo), driver, entrada['offset'] + entrada['tamanho'])
+        trecho.seek(entrada['offset'])
+        return io.BufferedReader(trecho, CHUNK_SIZE)
+
+    leitor = abrir_leitor(arquivo, driver, CHUNK_SIZE)
+    formato = detectar_formato(leitor)
+
+    if formato == 'zip':
+        zip_arquivo = zipfile.ZipFile(leitor)
+        try:
+            return _MembroAberto(zip_arquivo.open(nome), zip_arquivo)
+        except RuntimeError as e:
+            # Membro protegido por senha fora da listagem truncada
+            zip_arquivo.close()
+            raise NotImplementedError(str(e))
+        except Exception:
+            zip_arquivo.close()
+            raise
+
+    if formato == '7z':
+        os.makedirs(BLOBS_TMP_DIR, exist_ok=True)
+        fabrica = _FabricaMembro()
+        with py7zr.SevenZipFile(leitor) as sete_zip:
+            sete_zip.extract(targets=[nome], factory=fabrica)
+        if nome not in fabrica.membros:
+            raise KeyError(nome)
+        membro = fabrica.membros[nome].arquivo
+        membro.seek(0)
+        return membro
+
+    modo = 'r:' if formato == 'tar' else 'r|*'
+    tar = tarfile.open(fileobj=leitor, mode=modo)
+    try:
+        for membro in _membros_tar(tar):
+            if membro.name == nome:
+                conteudo = tar.extractfile(membro)
+                if conteudo is None:
+                    raise KeyError(nome)
+                return _MembroAberto(conteudo, tar)
+        raise KeyError(nome)
+    except Exception:
+        tar.close()
+        raise
+
+
+def iterar_membro(membro):
+    """Gera o conteúdo de um membro aberto por abrir_membro e o fecha no fim"""
+    try:
+        yield from _ler_blocos(membro)
+    finally:
+        membro.close()
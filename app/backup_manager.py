@@ -10,6 +10,7 @@ from pydrive2.drive import GoogleDrive
 from dotenv import load_dotenv
 from app.extensions import db
 from app.models import Backup
+from app.storage import obter_driver
 from pathlib import Path
 from cryptography.fernet import Fernet
 import boto3
@@ -126,6 +127,9 @@ class BackupManager:
 
     def _create_files_archive(self):
         
+        driver = obter_driver()
+        if driver.caminho_local('uploads') is None:
+            return self._create_remote_files_archive(driver)
         
         if not os.path.exists(self.upload_folder):
             self.logger.warning(f"Pasta de uploads não encontrada: {self.upload_folder}")
@@ -148,6 +152,31 @@ class BackupManager:
             self.logger.error(f"Falha ao compactar uploads: {str(e)}")
             return None
 
+    def _create_remote_files_archive(self, driver):
+        """Compacta os objetos de um backend remoto lendo cada um em streaming"""
+        timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+        archive_name = f'uploads_{timestamp}.tar.gz'
+        temp_dir = tempfile.mkdtemp()
+        archive_path = os.path.join(temp_dir, archive_name)
+        
+        try:
+            total = 0
+            with tarfile.open(archive_path, 'w:gz') as tar:
+                for chave, tamanho in driver.listar('uploads/'):
+                    info = tarfile.TarInfo(name=chave)
+                    info.size = tamanho
+                    info.mtime = int(datetime.datetime.now().timestamp())
+                    with driver.abrir(chave) as origem:
+                        tar.addfile(info, origem)
+                    total += 1
+            if not total:
+                self.logger.warning("Nenhum objeto no armazenamento - criando backup vazio")
+            self.logger.info(f"Objetos do armazenamento compactados: {archive_path} ({total} objetos)")
+            return archive_path
+        except Exception as e:
+            self.logger.error(f"Falha ao compactar uploads: {str(e)}")
+            return None
+
     def _encrypt_file(self, file_path):
         
         try:
@@ -0,0 +1,145 @@
+import json
+import time
+import threading
+from flask import Response, current_app, request
+from app.throttle import TokenBucket
+
+
+MB = 1024 * 1024
+
+
+class BandwidthShaper:
+    """Limita a banda das entregas de arquivos por usuário e no total do processo.
+
+    Cada bloco enviado consome fichas do balde do usuário e do balde global (TokenBucket),
+    então quem abre muitos downloads paralelos divide a própria taxa entre eles em vez de
+    tomar a banda dos demais; o número de downloads simultâneos por usuário também é
+    limitado. Os limites valem por processo (com N workers, o total é N vezes o global).
+    """
+
+    def __init__(self, taxa_usuario=None, taxa_global=None, max_simultaneos=None):
+        self.taxa_usuario = taxa_usuario
+        self.max_simultaneos = max_simultaneos
+        self._global = TokenBucket(taxa_global) if taxa_global else None
+        self._usuarios = {}
+        self._lock = threading.Lock()
+        self._contadores = {
+            'downloads_iniciados': 0,
+            'downloads_concluidos': 0,
+            'downloads_recusados': 0,
+            'downloads_delegados': 0,
+            'bytes_enviados': 0,
+            'segundos_espera': 0.0,
+        }
+
+    def adquirir(self, chave):
+        """Reserva uma vaga de download para a chave; False se o limite simultâneo foi atingido"""
+        with self._lock:
+            estado = self._usuarios.get(chave)
+            if estado is None:
+                estado = {
+                    'balde': TokenBucket(self.taxa_usuario) if self.taxa_usuario else None,
+                    'ativos': 0,
+                    'bytes': 0
+                }
+                self._usuarios[chave] = estado
+            if self.max_simultaneos and estado['ativos'] >= self.max_simultaneos:
+                self._contadores['downloads_recusados'] += 1
+                return False
+            estado['ativos'] += 1
+            self._contadores['downloads_iniciados'] += 1
+            return True
+
+    def liberar(self, chave):
+        with self._lock:
+            estado = self._usuarios.get(chave)
+            if estado is None:
+                return
+            estado['ativos'] -= 1
+            self._contadores['downloads_concluidos'] += 1
+            if estado['ativos'] <= 0:
+                del self._usuarios[chave]
+
+    def _limitado(self, corpo, chave):
+        with self._lock:
+            balde = self._usuarios[chave]['balde']
+        for bloco in corpo:
+            # As fichas dos dois baldes são retiradas juntas e a espera é uma só, pela maior:
+            # esperar um balde e depois o outro deixaria a taxa abaixo dos dois limites
+            espera = max(
+                balde.reservar(len(bloco)) if balde is not None else 0.0,
+                self._global.reservar(len(bloco)) if self._global is not None else 0.0
+            )
+            if espera > 0:
+                time.sleep(espera)
+            with self._lock:
+                self._contadores['bytes_enviados'] += len(bloco)
+                self._contadores['segundos_espera'] += espera
+                estado = self._usuarios.get(chave)
+                if estado is not None:
+                    estado['bytes'] += len(bloco)
+            yield bloco
+
+    def limitar(self, response, chave):
+        """Aplica os limites ao corpo da resposta; retorna 429 se o usuário já está no limite simultâneo"""
+        if 'X-Accel-Redirect' in response.headers:
+            # O nginx envia o corpo; ele mesmo aplica a taxa por conexão indicada aqui
+            if self.taxa_usuario:
+                response.headers['X-Accel-Limit-Rate'] = str(int(self.taxa_usuario))
+            with self._lock:
+                self._contadores['downloads_delegados'] += 1
+            return response
+
+        if not self.adquirir(chave):
+            response.close()
+            recusada = Response(
+                json.dumps({'message': 'Limite de downloads simultâneos atingido, tente novamente em instantes'}),
+                status=429,
+                mimetype='application/json'
+            )
+            recusada.headers['Retry-After'] = '5'
+            return recusada
+
+        corpo = response.response
+        response.response = self._limitado(corpo, chave)
+        # Encerrada a resposta (fim do envio ou conexão interrompida) a vaga é devolvida
+        response.call_on_close(lambda: (corpo.close() if hasattr(corpo, 'close') else None, self.liberar(chave)))
+        return response
+
+    def metricas(self):
+        with self._lock:
+            return {
+                **self._contadores,
+                'segundos_espera': round(self._contadores['segundos_espera'], 1),
+                'downloads_ativos': sum(e['ativos'] for e in self._usuarios.values()),
+                'usuarios_ativos': len(self._usuarios),
+                'por_usuario': {
+                    chave: {'ativos': e['ativos'], 'bytes': e['bytes']}
+                    for chave, e in self._usuarios.items()
+                },
+                'limites': {
+                    'mb_por_segundo_usuario': self.taxa_usuario / MB if self.taxa_usuario else None,
+                    'mb_por_segundo_global': self._global.taxa / MB if self._global else None,
+                    'downloads_simultaneos_por_usuario': self.max_simultaneos or None
+                }
+            }
+
+
+def obter_limitador():
+    """Limitador do processo, criado a partir da configuração no primeiro uso"""
+    limitador = current_app.extensions.get('bandwidth_shaper')
+    if limitador is None:
+        config = current_app.config
+        limitador = BandwidthShaper(
+            taxa_usuario=int(config['DOWNLOAD_RATE_LIMIT_USER_MB'] * MB) or None,
+            taxa_global=int(config['DOWNLOAD_RATE_LIMIT_GLOBAL_MB'] * MB) or None,
+            max_simultaneos=config['DOWNLOAD_MAX_CONCURRENT_PER_USER'] or None
+        )
+        current_app.extensions['bandwidth_shaper'] = limitador
+    return limitador
+
+
+def limitar_resposta(response, usuario_id=None):
+    """Passa a resposta pelo limitador; downloads anônimos (links públicos) são agrupados por IP"""
+    chave = str(usuario_id) if usuario_id else f"ip:{request.remote_addr}"
+    return obter_limitador().limitar(response, chave)
@@ -0,0 +1,367 @@
+import io
+import os
+import time
+import tempfile
+from flask import current_app
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from app.extensions import db
+from app.models import Blob, Derivado, VerificacaoIntegridade
+from app.storage import CHUNK_SIZE, obter_driver
+from app.compression import CODIFICACAO_GZIP, CompressorPontos, deve_comprimir
+from app.encryption import (
+    ALGORITMO_AES_GCM,
+    TAMANHO_SEGMENTO,
+    CifradorSegmentos,
+    LeitorCifrado,
+    carregar_chave_mestra,
+)
+
+
+BLOBS_DIR = os.path.join('uploads', 'blobs')
+BLOBS_TMP_DIR = os.path.join(BLOBS_DIR, 'tmp')
+
+
+def limpar_temporarios(idade_minima_segundos, diretorio=BLOBS_TMP_DIR):
+    """Remove temporários órfãos (uploads, listagens, miniaturas) deixados por processos interrompidos.
+
+    Só apaga o que não é modificado há `idade_minima_segundos`: uploads em andamento continuam
+    escrevendo no seu .part e nunca ficam parados tanto tempo.
+    """
+    if not os.path.isdir(diretorio):
+        return 0
+
+    limite = time.time() - idade_minima_segundos
+    removidos = 0
+    for entrada in os.scandir(diretorio):
+        try:
+            if entrada.is_file(follow_symlinks=False) and entrada.stat().st_mtime < limite:
+                os.remove(entrada.path)
+                removidos += 1
+        except OSError:
+            pass
+
+    if removidos:
+        print(f"🧹 {removidos} temporários de upload órfãos removidos")
+    return removidos
+
+
+def caminho_blob(hash_arquivo, profundidade=None, largura=None):
+    if profundidade is None:
+        profundidade = current_app.config['UPLOAD_SHARD_DEPTH']
+    if largura is None:
+        largura = current_app.config['UPLOAD_SHARD_WIDTH']
+
+    niveis = [hash_arquivo[i * largura:(i + 1) * largura] for i in range(profundidade)]
+    return os.path.join(BLOBS_DIR, *niveis, hash_arquivo)
+
+
+def registrar_verificacao(caminho, hash_arquivo, carimbo, corrompido=False):
+    """Registra se o conteúdo em `caminho` confere com o hash enquanto tiver este carimbo"""
+    stmt = insert(VerificacaoIntegridade).values(
+        caminho_armazenamento=caminho,
+        hash_arquivo=hash_arquivo,
+        corrompido=corrompido,
+        data_verificacao=func.now(),
+        **carimbo
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[VerificacaoIntegridade.caminho_armazenamento],
+        set_={
+            'hash_arquivo': stmt.excluded.hash_arquivo,
+            'tamanho': stmt.excluded.tamanho,
+            'mtime_ns': stmt.excluded.mtime_ns,
+            'identificador': stmt.excluded.identificador,
+            'corrompido': stmt.excluded.corrompido,
+            'data_verificacao': stmt.excluded.data_verificacao
+        }
+    )
+    db.session.execute(stmt)
+
+
+def obter_blob(arquivo):
+    """Blob que guarda o conteúdo do Arquivo (None para arquivos anteriores ao armazenamento por conteúdo)"""
+    blob = db.session.get(Blob, arquivo.hash_arquivo)
+    if blob is None or blob.caminho_armazenamento != arquivo.caminho_armazenamento:
+        return None
+    return blob
+
+
+class _SaidaTemporaria:
+    """Temporário em BLOBS_TMP_DIR; com chave mestra, o que é escrito em `entrada` chega ao disco já cifrado"""
+
+    def __init__(self, diretorio, sufixo, chave_mestra):
+        descritor, self.caminho = tempfile.mkstemp(dir=diretorio, prefix='.upload-', suffix=sufixo)
+        self.arquivo = os.fdopen(descritor, 'wb', buffering=CHUNK_SIZE)
+        self.cifrador = CifradorSegmentos(self.arquivo, chave_mestra) if chave_mestra else None
+        self.entrada = self.cifrador or self.arquivo
+
+    def fechar(self):
+        """Fecha o temporário; retorna o tamanho gravado"""
+        if not self.arquivo.closed:
+            if self.cifrador is not None:
+                self.cifrador.close()
+            self.arquivo.close()
+        return os.path.getsize(self.caminho)
+
+    def remover(self):
+        self.arquivo.close()
+        try:
+            os.remove(self.caminho)
+        except OSError:
+            pass
+
+
+class GravacaoBlob:
+    """Conteúdo sendo gravado por um BlobWriter: cada bloco é comprimido e cifrado ao ser recebido.
+
+    Só a versão codificada chega ao disco (cifrada, quando há STORAGE_ENCRYPTION_KEY). Para
+    tipos comprimíveis as versões com e sem gzip são geradas juntas, e concluir() fica com a
+    comprimida apenas se ela economizar STORAGE_COMPRESSION_MIN_SAVING.
+    """
+
+    def __init__(self, gravador, diretorio, tipo_mime=None):
+        os.makedirs(diretorio, exist_ok=True)
+        self.gravador = gravador
+        self.tamanho = 0
+        self.gravacao = None
+        self._comprimido = None
+        self._compressor = None
+        self._bruto = _SaidaTemporaria(diretorio, '.part', gravador.chave_mestra)
+        try:
+            if gravador.compressao and deve_comprimir(tipo_mime):
+                self._comprimido = _SaidaTemporaria(diretorio, '.gz.part', gravador.chave_mestra)
+                self._compressor = CompressorPontos(self._comprimido.entrada, gravador.nivel_compressao)
+        except Exception:
+            self.descartar()
+            raise
+
+    def write(self, dados):
+        self.tamanho += len(dados)
+        self._bruto.entrada.write(dados)
+        if self._compressor is not None:
+            self._compressor.write(dados)
+        return len(dados)
+
+    def concluir(self):
+        """Fecha os temporários e escolhe a versão a publicar; retorna a descrição da gravação"""
+        if self.gravacao is not None:
+            return self.gravacao
+
+        gravacao = {'codificacao': None, 'criptografia': None, 'pontos_acesso': None}
+        gravacao['tamanho_armazenado'] = self._bruto.fechar()
+
+        if self._comprimido is not None:
+            self._compressor.close()
+            tamanho_comprimido = self._comprimido.entrada.tell()
+            tamanho_armazenado = self._comprimido.fechar()
+            economia_minima = self.gravador.economia_minima
+            if self.tamanho and tamanho_comprimido <= self.tamanho * (1 - economia_minima):
+                self._bruto.remover()
+                self._bruto = self._comprimido
+                gravacao.update({
+                    'codificacao': CODIFICACAO_GZIP,
+                    'pontos_acesso': self._compressor.pontos,
+                    'tamanho_armazenado': tamanho_armazenado
+                })
+            else:
+                self._comprimido.remover()
+            self._comprimido = None
+
+        if self.gravador.chave_mestra:
+            gravacao['criptografia'] = ALGORITMO_AES_GCM
+        self.gravacao = gravacao
+        return gravacao
+
+    def abrir_leitura(self):
+        """Leitor com seek do conteúdo recebido, para usá-lo sem publicar (ex.: expandir um zip)"""
+        gravacao = self.concluir()
+        if gravacao['codificacao']:
+            raise ValueError('A versão comprimida não permite leitura com seek')
+        if gravacao['criptografia']:
+            return io.BufferedReader(LeitorCifrado(self._bruto.caminho, self.gravador.chave_mestra), TAMANHO_SEGMENTO)
+        return open(self._bruto.caminho, 'rb')
+
+    def publicar(self, destino):
+        """Move a versão escolhida para `destino` no armazenamento; retorna a descrição da gravação"""
+        gravacao = self.concluir()
+        self.gravador.driver.salvar_arquivo(self._bruto.caminho, destino)
+        self._bruto = None
+        return gravacao
+
+    def descartar(self):
+        for saida in (self._bruto, self._comprimido):
+            if saida is not None:
+                saida.remover()
+        self._bruto = self._comprimido = None
+
+
+class BlobWriter:
+    """Grava conteúdo novo no armazenamento aplicando compressão e criptografia em repouso.
+
+    Uploads usam iniciar(): o conteúdo é codificado enquanto chega e nunca fica em claro no
+    disco. gravar() faz o mesmo para um arquivo local já pronto, lendo-o uma única vez.
+
+    Não usa a sessão do banco nem o contexto da aplicação, então pode ser usado pelas threads
+    do upload em lote; o resultado da gravação é registrado depois com BlobStore.registrar_gravacao.
+    """
+
+    def __init__(self, driver=None, config=None):
+        config = config or current_app.config
+        self.driver = driver or obter_driver()
+        self.compressao = config['STORAGE_COMPRESSION_ENABLED']
+        self.nivel_compressao = config['STORAGE_COMPRESSION_LEVEL']
+        self.economia_minima = config['STORAGE_COMPRESSION_MIN_SAVING']
+        self.chave_mestra = carregar_chave_mestra(config['STORAGE_ENCRYPTION_KEY'])
+
+    def iniciar(self, diretorio=BLOBS_TMP_DIR, tipo_mime=None):
+        return GravacaoBlob(self, diretorio, tipo_mime)
+
+    def gravar(self, caminho_local, destino, tipo_mime=None, manter_origem=False):
+        """Publica o arquivo local em `destino` e descreve como ele ficou armazenado"""
+        tamanho = os.path.getsize(caminho_local)
+        if not self.chave_mestra and not (self.compressao and tamanho and deve_comprimir(tipo_mime)):
+            # Nada a codificar: o próprio arquivo é publicado, sem cópia
+            self.driver.salvar_arquivo(caminho_local, destino, manter_origem=manter_origem)
+            return {'codificacao': None, 'criptografia': None, 'pontos_acesso': None, 'tamanho_armazenado': tamanho}
+
+        gravacao = self.iniciar(BLOBS_TMP_DIR, tipo_mime)
+        try:
+            with open(caminho_local, 'rb') as entrada:
+                for bloco in iter(lambda: entrada.read(CHUNK_SIZE), b''):
+                    gravacao.write(bloco)
+            resultado = gravacao.publicar(destino)
+        finally:
+            gravacao.descartar()
+
+        if not manter_origem:
+            os.remove(caminho_local)
+        return resultado
+
+
+class BlobStore:
+    """Armazenamento endereçado por conteúdo (SHA-256) com contagem de referências"""
+
+    def __init__(self, driver=None):
+        self.driver = driver or obter_driver()
+        self._remocoes_pendentes = []
+
+    def adicionar_referencia(self, hash_arquivo, tamanho):
+        """Registra mais uma referência ao blob e informa se o conteúdo ainda precisa ser gravado"""
+        return self.adicionar_referencias({hash_arquivo: (tamanho, 1)})[hash_arquivo]
+
+    def adicionar_referencias(self, conteudos):
+        """Registra referências a vários blobs em um único comando.
+
+        Recebe {hash: (tamanho, quantidade)} e retorna {hash: (caminho, precisa_gravar)}. As linhas
+        dos blobs ficam bloqueadas até o commit da transação, então remoções e uploads concorrentes
+        do mesmo conteúdo são serializados.
+        """
+        if not conteudos:
+            return {}
+
+        stmt = insert(Blob).values([
+            {
+                'hash_arquivo': hash_arquivo,
+                'caminho_armazenamento': caminho_blob(hash_arquivo),
+                'tamanho': tamanho,
+                'referencias': quantidade
+            }
+            for hash_arquivo, (tamanho, quantidade) in sorted(conteudos.items())
+        ])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Blob.hash_arquivo],
+            set_={'referencias': Blob.referencias + stmt.excluded.referencias}
+        ).returning(Blob.hash_arquivo, Blob.caminho_armazenamento, Blob.tamanho, Blob.referencias)
+
+        resultado = {}
+        for blob in db.session.execute(stmt):
+            tamanho, quantidade = conteudos[blob.hash_arquivo]
+            if blob.tamanho != tamanho:
+                raise ValueError(f"Blob {blob.hash_arquivo} já existe com tamanho diferente")
+
+            precisa_gravar = blob.referencias == quantidade or not self.driver.existe(blob.caminho_armazenamento)
+            resultado[blob.hash_arquivo] = (blob.caminho_armazenamento, precisa_gravar)
+        return resultado
+
+    def registrar_gravacao(self, hash_arquivo, caminho, gravacao):
+        """Anota no blob como o conteúdo ficou armazenado (resultado de BlobWriter.gravar).
+
+        O conteúdo acabou de ser gravado a partir de bytes com o hash conferido, então o carimbo
+        atual já vale como verificação de integridade.
+        """
+        Blob.query.filter_by(hash_arquivo=hash_arquivo).update(gravacao, synchronize_session=False)
+        registrar_verificacao(caminho, hash_arquivo, self.driver.carimbo(caminho))
+
+    def referenciar_existente(self, hash_arquivo, tamanho):
+        """Adiciona uma referência apenas se o conteúdo já estiver armazenado; retorna o caminho ou None"""
+        blob = Blob.query.filter_by(
+            hash_arquivo=hash_arquivo,
+            tamanho=tamanho
+        ).with_for_update().first()
+
+        if not blob or not self.driver.existe(blob.caminho_armazenamento):
+            return None
+
+        blob.referencias += 1
+        return blob.caminho_armazenamento
+
+    def liberar(self, arquivo):
+        """Remove a referência de um Arquivo ao seu conteúdo.
+
+        O arquivo físico só é apagado quando a última referência desaparece. A remoção é
+        preparada (renomeando o blob) e só se torna definitiva em concluir(), após o commit.
+        """
+        blob = Blob.query.filter_by(
+            hash_arquivo=arquivo.hash_arquivo,
+            caminho_armazenamento=arquivo.caminho_armazenamento
+        ).with_for_update().first()
+
+        if not blob:
+            # Arquivos gravados antes do armazenamento por conteúdo têm caminho exclusivo
+            self._preparar_remocao(arquivo.caminho_armazenamento)
+            self._preparar_remocao_derivados(arquivo.hash_arquivo)
+            return True
+
+        blob.referencias -= 1
+        if blob.referencias > 0:
+            return False
+
+        db.session.delete(blob)
+        self._preparar_remocao(blob.caminho_armazenamento)
+        self._preparar_remocao_derivados(blob.hash_arquivo)
+        return True
+
+    def _preparar_remocao(self, caminho):
+        if not caminho or not self.driver.existe(caminho):
+            return
+
+        VerificacaoIntegridade.query.filter_by(caminho_armazenamento=caminho).delete(synchronize_session=False)
+
+        lixeira = f"{caminho}.removendo"
+        self.driver.mover(caminho, lixeira)
+        self._remocoes_pendentes.append((lixeira, caminho))
+
+    def _preparar_remocao_derivados(self, hash_arquivo):
+        # Miniaturas e afins revelam o conteúdo: saem junto com ele
+        for derivado in Derivado.query.filter_by(hash_arquivo=hash_arquivo):
+            db.session.delete(derivado)
+            self._preparar_remocao(derivado.caminho_armazenamento)
+
+    def concluir(self):
+        """Apaga definitivamente os blobs liberados (chamar após o commit)"""
+        for lixeira, _ in self._remocoes_pendentes:
+            try:
+                self.driver.remover(lixeira)
+            except Exception:
+                pass
+        self._remocoes_pendentes = []
+
+    def desfazer(self):
+        """Restaura os blobs liberados (chamar após o rollback)"""
+        for lixeira, caminho in self._remocoes_pendentes:
+            try:
+                self.driver.mover(lixeira, caminho)
+            except Exception:
+                pass
+        self._remocoes_pendentes = []
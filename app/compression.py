@@ -0,0 +1,115 @@
+import gzip
+import zlib
+from app.storage import CHUNK_SIZE
+
+
+CODIFICACAO_GZIP = 'gzip'
+
+# Distância (no conteúdo original) entre pontos de acesso do gzip; ver CompressorPontos
+INTERVALO_PONTOS_ACESSO = 1024 * 1024
+
+MIME_COMPRIMIVEIS = {
+    'application/json',
+    'application/xml',
+    'application/javascript',
+    'application/x-javascript',
+    'application/x-ndjson',
+    'application/x-yaml',
+    'application/yaml',
+    'application/sql',
+    'application/x-sh',
+    'application/rtf',
+    'image/svg+xml',
+    'image/bmp',
+}
+
+
+def deve_comprimir(tipo_mime):
+    """Tipos textuais costumam encolher bastante; mídia e formatos já compactados não"""
+    if not tipo_mime:
+        return False
+    tipo_mime = tipo_mime.split(';')[0].strip().lower()
+    return tipo_mime.startswith('text/') or tipo_mime in MIME_COMPRIMIVEIS
+
+
+MIME_JA_COMPACTADOS = {
+    'application/zip',
+    'application/gzip',
+    'application/x-gzip',
+    'application/x-bzip2',
+    'application/x-xz',
+    'application/zstd',
+    'application/x-7z-compressed',
+    'application/x-rar-compressed',
+    'application/vnd.rar',
+    'application/pdf',
+    'application/epub+zip',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+    'application/vnd.oasis.opendocument.text',
+    'application/vnd.oasis.opendocument.spreadsheet',
+    'application/vnd.oasis.opendocument.presentation',
+}
+
+
+def ja_compactado(tipo_mime):
+    """Formatos que já carregam compressão própria: comprimir de novo só gasta CPU"""
+    if not tipo_mime:
+        return False
+    tipo_mime = tipo_mime.split(';')[0].strip().lower()
+    if tipo_mime in MIME_COMPRIMIVEIS:
+        return False
+    return tipo_mime.startswith(('image/', 'video/', 'audio/')) or tipo_mime in MIME_JA_COMPACTADOS
+
+
+class CompressorPontos:
+    """gzip em streaming, com pontos de acesso a cada `intervalo_pontos` bytes do original.
+
+    Em cada ponto é feito um full flush: o deflate fica alinhado em byte e sem referências ao
+    que veio antes, então a descompressão pode começar ali. Os pontos são pares [offset no
+    original, offset no comprimido]; `saida` precisa de write() e tell().
+    """
+
+    def __init__(self, saida, nivel=6, intervalo_pontos=INTERVALO_PONTOS_ACESSO):
+        self._saida = saida
+        # mtime fixo: o mesmo conteúdo gera sempre os mesmos bytes comprimidos
+        self._gzip = gzip.GzipFile(fileobj=saida, mode='wb', compresslevel=nivel, mtime=0)
+        self.intervalo_pontos = intervalo_pontos
+        self.pontos = []
+        self.lidos = 0
+        self._proximo_ponto = intervalo_pontos
+
+    def write(self, dados):
+        self._gzip.write(dados)
+        self.lidos += len(dados)
+        if self.lidos >= self._proximo_ponto:
+            self._gzip.flush(zlib.Z_FULL_FLUSH)
+            self.pontos.append([self.lidos, self._saida.tell()])
+            self._proximo_ponto = self.lidos + self.intervalo_pontos
+        return len(dados)
+
+    def close(self):
+        self._gzip.close()
+
+
+def descomprimir_blocos(blocos, bruto=False):
+    """Descomprime um iterável de blocos gzip sem carregar o conteúdo inteiro em memória.
+
+    Com `bruto`, os blocos começam em um ponto de acesso (deflate sem o cabeçalho gzip).
+    """
+    descompressor = zlib.decompressobj(wbits=-zlib.MAX_WBITS if bruto else 16 + zlib.MAX_WBITS)
+    for bloco in blocos:
+        dados = descompressor.decompress(bloco, CHUNK_SIZE)
+        if dados:
+            yield dados
+        while descompressor.unconsumed_tail:
+            dados = descompressor.decompress(descompressor.unconsumed_tail, CHUNK_SIZE)
+            if dados:
+                yield dados
+
+    restante = descompressor.flush()
+    if restante:
+        yield restante
+    if not descompressor.eof:
+        raise EOFError('Conteúdo comprimido truncado')
@@ -8,6 +8,82 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.getenv('SQLALCHEMY_DATABASE_URI')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER', 'uploads')
+    UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))
+    UPLOAD_CHUNK_MAX_SIZE = int(os.getenv('UPLOAD_CHUNK_MAX_SIZE', 64 * 1024 * 1024))
+    UPLOAD_SESSION_EXPIRATION_HOURS = int(os.getenv('UPLOAD_SESSION_EXPIRATION_HOURS', 24))
+    # 'usuario': só reaproveita conteúdo que o próprio usuário já enviou; 'global': qualquer blob armazenado
+    UPLOAD_DEDUP_SCOPE = os.getenv('UPLOAD_DEDUP_SCOPE', 'usuario')
+    # Fan-out dos diretórios de blobs: níveis e caracteres do hash por nível (ex.: 2 e 2 -> ab/cd/<hash>)
+    UPLOAD_SHARD_DEPTH = int(os.getenv('UPLOAD_SHARD_DEPTH', 2))
+    UPLOAD_SHARD_WIDTH = int(os.getenv('UPLOAD_SHARD_WIDTH', 2))
+    UPLOAD_BATCH_MAX_FILES = int(os.getenv('UPLOAD_BATCH_MAX_FILES', 2000))
+    UPLOAD_BATCH_WORKERS = int(os.getenv('UPLOAD_BATCH_WORKERS', 4))
+    # Temporários de upload parados há mais que isso são de processos interrompidos e são apagados
+    UPLOAD_TMP_MAX_AGE_MINUTES = int(os.getenv('UPLOAD_TMP_MAX_AGE_MINUTES', 60))
+    DOWNLOAD_BATCH_MAX_FILES = int(os.getenv('DOWNLOAD_BATCH_MAX_FILES', 1000))
+
+    # Backend do conteúdo dos arquivos: 'local' (disco) ou 's3' (AWS, MinIO ou compatível)
+    STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'local')
+    STORAGE_LOCAL_ROOT = os.getenv('STORAGE_LOCAL_ROOT', '')
+    STORAGE_S3_BUCKET = os.getenv('STORAGE_S3_BUCKET')
+    STORAGE_S3_ENDPOINT_URL = os.getenv('STORAGE_S3_ENDPOINT_URL')
+    STORAGE_S3_REGION = os.getenv('STORAGE_S3_REGION')
+    STORAGE_S3_ACCESS_KEY = os.getenv('STORAGE_S3_ACCESS_KEY')
+    STORAGE_S3_SECRET_KEY = os.getenv('STORAGE_S3_SECRET_KEY')
+
+    # Compressão em repouso para tipos MIME compressíveis; só é mantida se economizar ao menos a fração indicada
+    STORAGE_COMPRESSION_ENABLED = os.getenv('STORAGE_COMPRESSION_ENABLED', 'true').lower() in ('true', '1', 't')
+    STORAGE_COMPRESSION_LEVEL = int(os.getenv('STORAGE_COMPRESSION_LEVEL', 6))
+    STORAGE_COMPRESSION_MIN_SAVING = float(os.getenv('STORAGE_COMPRESSION_MIN_SAVING', 0.1))
+
+    # Chave mestra (32 bytes em base64) da criptografia em repouso; sem ela os blobs são gravados em claro
+    STORAGE_ENCRYPTION_KEY = os.getenv('STORAGE_ENCRYPTION_KEY')
+
+    # Verificação de integridade no download: 'always' (sempre recalcula o hash), 'periodic' (confia no
+    # carimbo tamanho/mtime/inode por INTEGRITY_CHECK_INTERVAL_HOURS) ou 'on-mismatch' (só quando o carimbo muda)
+    INTEGRITY_CHECK_POLICY = os.getenv('INTEGRITY_CHECK_POLICY', 'periodic')
+    INTEGRITY_CHECK_INTERVAL_HOURS = int(os.getenv('INTEGRITY_CHECK_INTERVAL_HOURS', 24 * 7))
+
+    # Entrega dos bytes: 'direct' (o próprio Flask envia), 'x-accel-redirect' (nginx) ou 'x-sendfile' (Apache/lighttpd)
+    FILE_DELIVERY_MODE = os.getenv('FILE_DELIVERY_MODE', 'direct')
+    FILE_DELIVERY_ACCEL_PREFIX = os.getenv('FILE_DELIVERY_ACCEL_PREFIX', '/protected/')
+
+    # Limites de banda dos downloads (MB/s, 0 = sem limite) e downloads simultâneos por usuário (0 = sem limite)
+    DOWNLOAD_RATE_LIMIT_USER_MB = float(os.getenv('DOWNLOAD_RATE_LIMIT_USER_MB', 0))
+    DOWNLOAD_RATE_LIMIT_GLOBAL_MB = float(os.getenv('DOWNLOAD_RATE_LIMIT_GLOBAL_MB', 0))
+    DOWNLOAD_MAX_CONCURRENT_PER_USER = int(os.getenv('DOWNLOAD_MAX_CONCURRENT_PER_USER', 0))
+    # Token exigido no header X-Metrics-Token por /api/downloads/metrics (sem ele o endpoint fica desativado)
+    DOWNLOAD_METRICS_TOKEN = os.getenv('DOWNLOAD_METRICS_TOKEN')
+
+    # Miniaturas de imagens: geração em segundo plano após o upload (senão só no primeiro pedido)
+    THUMBNAIL_PREGENERATE = os.getenv('THUMBNAIL_PREGENERATE', 'true').lower() in ('true', '1', 't')
+    THUMBNAIL_WORKERS = int(os.getenv('THUMBNAIL_WORKERS', 2))
+    # Espaço máximo do cache de derivados (miniaturas etc.); acima dele os menos acessados são despejados
+    DERIVATIVE_CACHE_MAX_MB = float(os.getenv('DERIVATIVE_CACHE_MAX_MB', 2048))
+
+    # Pré-visualização de texto: bytes máximos por resposta e linhas por página (padrão e máximo)
+    PREVIEW_TEXT_MAX_BYTES = int(os.getenv('PREVIEW_TEXT_MAX_BYTES', 1024 * 1024))
+    PREVIEW_TEXT_PAGE_LINES = int(os.getenv('PREVIEW_TEXT_PAGE_LINES', 200))
+    PREVIEW_TEXT_MAX_LINES = int(os.getenv('PREVIEW_TEXT_MAX_LINES', 5000))
+    # Itens guardados na listagem de arquivos compactados (zip/tar/7z); o total é sempre informado
+    ARCHIVE_PREVIEW_MAX_ENTRIES = int(os.getenv('ARCHIVE_PREVIEW_MAX_ENTRIES', 10000))
+
+    # Cache, por processo, da resolução dos links compartilhados (token -> link e arquivo)
+    SHARE_CACHE_MAX_ENTRIES = int(os.getenv('SHARE_CACHE_MAX_ENTRIES', 10000))
+    SHARE_CACHE_TTL_SECONDS = int(os.getenv('SHARE_CACHE_TTL_SECONDS', 30))
+    # Intervalo de gravação dos contadores de acesso dos links sem limite de acessos
+    SHARE_ACCESS_FLUSH_SECONDS = float(os.getenv('SHARE_ACCESS_FLUSH_SECONDS', 5))
+    # Páginas HTML dos links: quantas ficam renderizadas em memória e por quanto tempo o navegador as reutiliza
+    SHARE_PAGE_CACHE_MAX_ENTRIES = int(os.getenv('SHARE_PAGE_CACHE_MAX_ENTRIES', 1000))
+    SHARE_PAGE_MAX_AGE_SECONDS = int(os.getenv('SHARE_PAGE_MAX_AGE_SECONDS', 60))
+
+    # Links de download assinados (AES-GCM): validade e chave; sem chave própria usa SECRET_KEY
+    DOWNLOAD_SIGNED_URL_TTL_SECONDS = int(os.getenv('DOWNLOAD_SIGNED_URL_TTL_SECONDS', 300))
+    DOWNLOAD_SIGNED_URL_KEY = os.getenv('DOWNLOAD_SIGNED_URL_KEY')
+    # Janela de revogação: um link ainda válido volta a conferir arquivo (excluído, trocado, privado)
+    # e sessão no banco no máximo a cada tantos segundos, por processo
+    DOWNLOAD_SIGNED_URL_REVALIDATE_SECONDS = int(os.getenv('DOWNLOAD_SIGNED_URL_REVALIDATE_SECONDS', 30))
+    DOWNLOAD_SIGNED_URL_CACHE_MAX_ENTRIES = int(os.getenv('DOWNLOAD_SIGNED_URL_CACHE_MAX_ENTRIES', 10000))
     SECRET_KEY = os.getenv('SECRET_KEY')
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY')
     JWT_TOKEN_LOCATION = ["headers"]
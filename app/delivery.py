@@ -0,0 +1,330 @@
+import os
+import hashlib
+from bisect import bisect_right
+from uuid import uuid4
+from urllib.parse import quote
+from flask import Response, current_app, request, send_file, stream_with_context
+from app.storage import obter_driver
+from app.blob_store import obter_blob
+from app.compression import CODIFICACAO_GZIP, descomprimir_blocos
+from app.encryption import carregar_chave_mestra, decifrar_intervalo, tamanho_plano
+from app.bandwidth import limitar_resposta
+
+
+MODO_DIRETO = 'direct'
+MODO_X_ACCEL = 'x-accel-redirect'
+MODO_X_SENDFILE = 'x-sendfile'
+
+# Acima disso o header Range é ignorado e o arquivo vai inteiro (proteção contra pedidos abusivos)
+MAX_INTERVALOS = 16
+
+
+def cabecalho_disposicao(disposicao, nome_arquivo):
+    """Monta o Content-Disposition, com filename* (RFC 5987) para nomes fora do ASCII"""
+    if not nome_arquivo:
+        return disposicao
+
+    try:
+        nome_arquivo.encode('ascii')
+        nome_seguro = nome_arquivo.replace('\\', '\\\\').replace('"', '\\"')
+        return f'{disposicao}; filename="{nome_seguro}"'
+    except UnicodeEncodeError:
+        return f"{disposicao}; filename*=UTF-8''{quote(nome_arquivo, safe='')}"
+
+
+def tamanho_codificado(blob):
+    """Tamanho da representação codificada do blob (comprimida, já sem a criptografia)"""
+    if blob.criptografia:
+        return tamanho_plano(blob.tamanho_armazenado)
+    return blob.tamanho_armazenado
+
+
+def iterar_armazenado(arquivo, blob=None, driver=None, inicio=0, fim=None):
+    """Gera os bytes como foram codificados (decifrando segmento a segmento quando necessário)"""
+    driver = driver or obter_driver()
+    if blob is not None and blob.criptografia:
+        return decifrar_intervalo(
+            driver,
+            arquivo.caminho_armazenamento,
+            blob.tamanho_armazenado,
+            carregar_chave_mestra(current_app.config['STORAGE_ENCRYPTION_KEY']),
+            inicio,
+            fim
+        )
+    return driver.iterar(arquivo.caminho_armazenamento, inicio, fim)
+
+
+def iterar_conteudo(arquivo, blob=None, driver=None):
+    """Gera o conteúdo original do Arquivo em blocos, desfazendo a codificação em repouso"""
+    if blob is None:
+        blob = obter_blob(arquivo)
+
+    blocos = iterar_armazenado(arquivo, blob, driver)
+    if blob is not None and blob.codificacao == CODIFICACAO_GZIP:
+        return descomprimir_blocos(blocos)
+    return blocos
+
+
+def ler_conteudo(arquivo):
+    return b''.join(iterar_conteudo(arquivo))
+
+
+def iterar_intervalo(arquivo, blob, driver, inicio, fim):
+    """Gera o trecho [inicio, fim] (inclusivo) do conteúdo original"""
+    if blob is None or blob.codificacao is None:
+        # Conteúdo em claro ou só cifrado: o driver/decifrador lê apenas o trecho pedido
+        yield from iterar_armazenado(arquivo, blob, driver, inicio, fim)
+        return
+
+    # Conteúdo comprimido: descomprime a partir do ponto de acesso mais próximo antes de `inicio`
+    # (ou do começo, para blobs sem pontos) e descarta o que vem antes
+    pontos = getattr(blob, 'pontos_acesso', None) or []
+    indice = bisect_right([ponto[0] for ponto in pontos], inicio) - 1
+    if indice >= 0:
+        posicao, offset = pontos[indice]
+        blocos = descomprimir_blocos(iterar_armazenado(arquivo, blob, driver, offset), bruto=True)
+    else:
+        posicao = 0
+        blocos = iterar_conteudo(arquivo, blob, driver)
+
+    for bloco in blocos:
+        proxima = posicao + len(bloco)
+        if proxima > inicio:
+            yield bloco[max(inicio - posicao, 0):fim - posicao + 1]
+        if proxima > fim:
+            return
+        posicao = proxima
+
+
+def variante_disposicao(disposicao, nome_arquivo):
+    """Variante de uma resposta com Content-Disposition: renomear muda a ETag, não só o conteúdo"""
+    return cabecalho_disposicao(disposicao, nome_arquivo) if disposicao else None
+
+
+def etag_arquivo(arquivo, variante=None):
+    """ETag forte de uma representação do arquivo.
+
+    O hash identifica o conteúdo original; `variante` distingue as demais representações do
+    mesmo conteúdo (nome no Content-Disposition, prévias truncadas, janelas, itens de um zip),
+    que não podem compartilhar o validador do corpo completo.
+    """
+    if not variante:
+        return arquivo.hash_arquivo
+    return f"{arquivo.hash_arquivo}-{hashlib.sha256(variante.encode()).hexdigest()[:16]}"
+
+
+def aplicar_validadores(response, arquivo, codificacao=None, publico=False, variante=None):
+    """ETag forte (por representação), Last-Modified e revalidação obrigatória pelo cliente"""
+    etag = etag_arquivo(arquivo, variante)
+    response.set_etag(f"{etag}-{codificacao}" if codificacao else etag)
+    if arquivo.data_modificacao is not None:
+        response.last_modified = arquivo.data_modificacao
+    response.headers['Cache-Control'] = 'public, no-cache' if publico else 'private, no-cache'
+    return response
+
+
+def resposta_nao_modificada(arquivo, publico=False, variante=None):
+    """304 quando o cliente já tem a representação atual; decidido só com dados do banco, sem ler o arquivo"""
+    etag = etag_arquivo(arquivo, variante)
+    if request.if_none_match:
+        # Qualquer codificação (original ou comprimida) da mesma representação está atualizada
+        if not (
+            request.if_none_match.star_tag
+            or request.if_none_match.contains_weak(etag)
+            or request.if_none_match.contains_weak(f"{etag}-{CODIFICACAO_GZIP}")
+        ):
+            return None
+    elif request.if_modified_since is None or arquivo.data_modificacao is None:
+        return None
+    elif int(arquivo.data_modificacao.timestamp()) > int(request.if_modified_since.timestamp()):
+        return None
+
+    response = Response(status=304)
+    del response.headers['Content-Type']
+    return aplicar_validadores(response, arquivo, publico=publico, variante=variante)
+
+
+def _if_range_valido(arquivo, variante=None):
+    valor = request.headers.get('If-Range', '').strip()
+    if not valor:
+        return True
+    if valor.startswith('"'):
+        # Só validadores fortes servem para If-Range
+        return valor.strip('"') == etag_arquivo(arquivo, variante)
+
+    data = request.if_range.date
+    return data is not None and arquivo.data_modificacao is not None and \
+        int(arquivo.data_modificacao.timestamp()) == int(data.timestamp())
+
+
+def intervalos_solicitados(arquivo, variante=None):
+    """Interpreta o header Range sobre o conteúdo original.
+
+    Retorna None quando a resposta deve ser completa (sem Range, If-Range divergente ou header
+    inválido/abusivo), a lista de intervalos (inicio, fim) inclusivos, ou [] se nenhum intervalo
+    for satisfatível (416).
+    """
+    valor = request.headers.get('Range')
+    if not valor or not _if_range_valido(arquivo, variante):
+        return None
+
+    unidade, _, especificacao = valor.partition('=')
+    if unidade.strip().lower() != 'bytes':
+        return None
+
+    partes = [p.strip() for p in especificacao.split(',') if p.strip()]
+    if not partes or len(partes) > MAX_INTERVALOS:
+        return None
+
+    tamanho = arquivo.tamanho
+    intervalos = []
+    for parte in partes:
+        inicio, separador, fim = parte.partition('-')
+        if not separador:
+            return None
+        try:
+            if not inicio:
+                sufixo = int(fim)
+                if sufixo <= 0:
+                    continue
+                intervalos.append((max(tamanho - sufixo, 0), tamanho - 1))
+                continue
+
+            inicio = int(inicio)
+            fim = int(fim) if fim else None
+        except ValueError:
+            return None
+        if fim is not None and inicio > fim:
+            return None
+        if inicio < tamanho:
+            intervalos.append((inicio, tamanho - 1 if fim is None else min(fim, tamanho - 1)))
+
+    return intervalos
+
+
+def resposta_delegada(modo, arquivo, driver):
+    """Resposta vazia com o redirecionamento interno para o proxy entregar o arquivo do disco"""
+    response = Response(mimetype=arquivo.tipo_mime)
+    if modo == MODO_X_ACCEL:
+        prefixo = current_app.config['FILE_DELIVERY_ACCEL_PREFIX'].rstrip('/')
+        response.headers['X-Accel-Redirect'] = quote(f"{prefixo}/{arquivo.caminho_armazenamento}")
+    else:
+        response.headers['X-Sendfile'] = os.path.abspath(driver.caminho_local(arquivo.caminho_armazenamento))
+    return response
+
+
+def requisicao_continuacao():
+    """Range que não começa no byte 0: continuação/seek de um download já contabilizado"""
+    valor = request.headers.get('Range')
+    return bool(valor) and not valor.replace(' ', '').startswith('bytes=0-')
+
+
+def resposta_parcial(arquivo, blob, driver, intervalos):
+    """Resposta 206 com um intervalo ou multipart/byteranges com vários"""
+    tamanho = arquivo.tamanho
+
+    if len(intervalos) == 1:
+        inicio, fim = intervalos[0]
+        response = Response(
+            stream_with_context(iterar_intervalo(arquivo, blob, driver, inicio, fim)),
+            status=206,
+            mimetype=arquivo.tipo_mime,
+            direct_passthrough=True
+        )
+        response.content_length = fim - inicio + 1
+        response.headers['Content-Range'] = f"bytes {inicio}-{fim}/{tamanho}"
+        return response
+
+    separador = uuid4().hex
+    cabecalhos = [
+        (
+            f"--{separador}\r\n"
+            f"Content-Type: {arquivo.tipo_mime}\r\n"
+            f"Content-Range: bytes {inicio}-{fim}/{tamanho}\r\n\r\n"
+        ).encode()
+        for inicio, fim in intervalos
+    ]
+    fechamento = f"\r\n--{separador}--\r\n".encode()
+
+    def gerar():
+        for indice, (inicio, fim) in enumerate(intervalos):
+            yield (b"\r\n" if indice else b"") + cabecalhos[indice]
+            yield from iterar_intervalo(arquivo, blob, driver, inicio, fim)
+        yield fechamento
+
+    response = Response(
+        stream_with_context(gerar()),
+        status=206,
+        content_type=f"multipart/byteranges; boundary={separador}",
+        direct_passthrough=True
+    )
+    response.content_length = (
+        sum(len(c) for c in cabecalhos)
+        + 2 * (len(intervalos) - 1)
+        + sum(fim - inicio + 1 for inicio, fim in intervalos)
+        + len(fechamento)
+    )
+    return response
+
+
+def cliente_aceita(codificacao):
+    return request.accept_encodings[codificacao] > 0
+
+
+def enviar_arquivo(arquivo, disposicao=None, nome_arquivo=None, publico=False, blob=None, usuario_id=None):
+    """Resposta com o conteúdo de um Arquivo lido do driver de armazenamento configurado.
+
+    Conteúdo comprimido em repouso vai como está (Content-Encoding) para clientes que aceitam
+    a codificação e é descomprimido em streaming para os demais; blobs cifrados são decifrados
+    segmento a segmento. Só arquivos locais sem criptografia são entregues por send_file.
+    Requisições com Range (e If-Range) recebem 206 com um ou vários intervalos. Com
+    FILE_DELIVERY_MODE de proxy, arquivos locais em claro são entregues pelo nginx/Apache.
+    `blob` já conhecido (ex.: vindo de um link assinado) dispensa a consulta ao banco. O corpo
+    passa pelo limitador de banda do usuário (ou do IP, sem `usuario_id`).
+    """
+    driver = obter_driver()
+    if blob is None:
+        blob = obter_blob(arquivo)
+    codificacao = blob.codificacao if blob is not None else None
+    criptografado = blob is not None and blob.criptografia is not None
+    variante = variante_disposicao(disposicao, nome_arquivo)
+    intervalos = intervalos_solicitados(arquivo, variante)
+    # Intervalos sempre se referem ao conteúdo original, então respostas parciais não usam Content-Encoding
+    enviar_codificado = codificacao is not None and intervalos is None and cliente_aceita(codificacao)
+    caminho_local = driver.caminho_local(arquivo.caminho_armazenamento)
+    modo = current_app.config['FILE_DELIVERY_MODE']
+
+    if modo != MODO_DIRETO and caminho_local is not None and not criptografado and not codificacao:
+        # Os bytes no disco são exatamente o corpo da resposta: o proxy entrega e trata Range/If-Range
+        response = resposta_delegada(modo, arquivo, driver)
+    elif intervalos == []:
+        response = Response(status=416)
+        response.headers['Content-Range'] = f"bytes */{arquivo.tamanho}"
+    elif intervalos:
+        response = resposta_parcial(arquivo, blob, driver, intervalos)
+    elif caminho_local is not None and not criptografado and (enviar_codificado or not codificacao):
+        response = send_file(caminho_local, mimetype=arquivo.tipo_mime, conditional=False, etag=False)
+    elif enviar_codificado:
+        response = Response(
+            stream_with_context(iterar_armazenado(arquivo, blob, driver)),
+            mimetype=arquivo.tipo_mime,
+            direct_passthrough=True
+        )
+        response.content_length = tamanho_codificado(blob)
+    else:
+        response = Response(
+            stream_with_context(iterar_conteudo(arquivo, blob, driver)),
+            mimetype=arquivo.tipo_mime,
+            direct_passthrough=True
+        )
+        response.content_length = arquivo.tamanho
+
+    response.headers['Accept-Ranges'] = 'bytes'
+    aplicar_validadores(response, arquivo, codificacao if enviar_codificado else None, publico, variante)
+    if enviar_codificado:
+        response.headers['Content-Encoding'] = codificacao
+    if codificacao:
+        response.vary.add('Accept-Encoding')
+    if disposicao:
+        response.headers['Content-Disposition'] = cabecalho_disposicao(disposicao, nome_arquivo)
+    return limitar_resposta(response, usuario_id)
@@ -0,0 +1,110 @@
+import os
+from datetime import datetime, timezone, timedelta
+from flask import current_app
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from app.extensions import db
+from app.models import Derivado
+from app.storage import obter_driver
+from app.blob_store import BlobWriter
+from app.delivery import iterar_conteudo
+
+
+DERIVADOS_DIR = 'derivados'
+
+# data_acesso só é renovada depois desse intervalo, para que leituras não virem escritas a cada pedido
+RENOVACAO_ACESSO = timedelta(hours=1)
+
+# O despejo libera espaço até essa fração do limite, evitando despejar a cada nova gravação
+FRACAO_APOS_DESPEJO = 0.9
+
+LOTE_DESPEJO = 100
+
+
+def chave_derivado(hash_arquivo, tipo):
+    return f"{DERIVADOS_DIR}/{hash_arquivo[:2]}/{hash_arquivo}/{tipo}"
+
+
+class DerivativeCache:
+    """Cache de derivados do conteúdo (miniaturas, índices, listagens) no armazenamento.
+
+    Derivados são identificados pelo hash do conteúdo de origem, então servem a todos os
+    Arquivos com o mesmo conteúdo e nunca ficam desatualizados. São gravados com a mesma
+    compressão/criptografia em repouso dos blobs e despejados pelo acesso mais antigo (LRU)
+    quando o total passa de DERIVATIVE_CACHE_MAX_MB.
+    """
+
+    def __init__(self, driver=None, limite_bytes=None):
+        self.driver = driver or obter_driver()
+        if limite_bytes is None:
+            limite_bytes = int(current_app.config['DERIVATIVE_CACHE_MAX_MB'] * 1024 * 1024)
+        self.limite_bytes = limite_bytes
+
+    def obter(self, hash_arquivo, tipo):
+        derivado = db.session.get(Derivado, (hash_arquivo, tipo))
+        if derivado is None:
+            return None
+
+        agora = datetime.now(timezone.utc)
+        if derivado.data_acesso + RENOVACAO_ACESSO < agora:
+            derivado.data_acesso = agora
+            db.session.commit()
+        return derivado
+
+    def gravar(self, hash_arquivo, tipo, caminho_local, tipo_mime):
+        """Publica o arquivo local como derivado (o arquivo local é consumido)"""
+        chave = chave_derivado(hash_arquivo, tipo)
+        tamanho = os.path.getsize(caminho_local)
+        gravacao = BlobWriter(self.driver).gravar(caminho_local, chave, tipo_mime)
+
+        valores = {
+            'caminho_armazenamento': chave,
+            'tipo_mime': tipo_mime,
+            'tamanho': tamanho,
+            **gravacao,
+            'data_acesso': datetime.now(timezone.utc)
+        }
+        stmt = insert(Derivado).values(hash_arquivo=hash_arquivo, tipo=tipo, **valores)
+        stmt = stmt.on_conflict_do_update(index_elements=['hash_arquivo', 'tipo'], set_=valores)
+        db.session.execute(stmt)
+        db.session.commit()
+
+        self.despejar()
+        return db.session.get(Derivado, (hash_arquivo, tipo), populate_existing=True)
+
+    def iterar(self, derivado):
+        return iterar_conteudo(derivado, derivado, self.driver)
+
+    def ler(self, derivado):
+        return b''.join(self.iterar(derivado))
+
+    def despejar(self):
+        """Remove os derivados acessados há mais tempo até o total voltar abaixo do limite"""
+        total = db.session.query(func.coalesce(func.sum(Derivado.tamanho_armazenado), 0)).scalar()
+        excesso = total - int(self.limite_bytes * FRACAO_APOS_DESPEJO)
+        if total <= self.limite_bytes:
+            return 0
+
+        removidos = 0
+        while excesso > 0:
+            lote = Derivado.query.order_by(Derivado.data_acesso).limit(LOTE_DESPEJO).all()
+            if not lote:
+                break
+
+            chaves = []
+            for derivado in lote:
+                if excesso <= 0:
+                    break
+                excesso -= derivado.tamanho_armazenado
+                chaves.append(derivado.caminho_armazenamento)
+                db.session.delete(derivado)
+            db.session.commit()
+
+            # O registro sai antes do arquivo: ninguém encontra um derivado já sem conteúdo
+            for chave in chaves:
+                self.driver.remover(chave)
+            removidos += len(chaves)
+
+        if removidos:
+            print(f"🧹 {removidos} derivados despejados do cache")
+        return removidos
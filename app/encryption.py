@@ -0,0 +1,220 @@
+import io
+import os
+import base64
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+
+ALGORITMO_AES_GCM = 'aes-256-gcm'
+
+# Formato v1: MAGIC + salt, seguido de segmentos de até 64 KiB cifrados com AES-GCM (cada um com sua tag)
+MAGIC = b'NVE1'
+TAMANHO_SALT = 16
+TAMANHO_CABECALHO = len(MAGIC) + TAMANHO_SALT
+TAMANHO_SEGMENTO = 64 * 1024
+TAMANHO_TAG = 16
+
+
+class ConteudoCorrompidoError(Exception):
+    pass
+
+
+def carregar_chave_mestra(valor):
+    """Decodifica a chave mestra (32 bytes em base64) configurada em STORAGE_ENCRYPTION_KEY"""
+    if not valor:
+        return None
+    chave = base64.urlsafe_b64decode(valor)
+    if len(chave) != 32:
+        raise ValueError('STORAGE_ENCRYPTION_KEY deve ter 32 bytes codificados em base64')
+    return chave
+
+
+def _derivar_chave(chave_mestra, salt):
+    # Cada blob tem sua própria chave, então o nonce pode ser apenas a posição do segmento
+    return HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=salt,
+        info=b'nuvem-blob-v1'
+    ).derive(chave_mestra)
+
+
+def _nonce(indice, ultimo):
+    # O marcador de último segmento impede que um arquivo truncado seja aceito como completo
+    return indice.to_bytes(11, 'big') + (b'\x01' if ultimo else b'\x00')
+
+
+def _total_segmentos(tamanho_plano):
+    return max(1, -(-tamanho_plano // TAMANHO_SEGMENTO))
+
+
+def tamanho_cifrado(tamanho_plano):
+    return TAMANHO_CABECALHO + tamanho_plano + TAMANHO_TAG * _total_segmentos(tamanho_plano)
+
+
+def tamanho_plano(tamanho_cifrado):
+    corpo = tamanho_cifrado - TAMANHO_CABECALHO
+    segmentos = -(-corpo // (TAMANHO_SEGMENTO + TAMANHO_TAG))
+    return corpo - TAMANHO_TAG * segmentos
+
+
+class CifradorSegmentos:
+    """Cifra em streaming no formato v1: recebe o conteúdo em blocos de qualquer tamanho e grava em `saida`.
+
+    O último segmento só é cifrado em close(), porque o nonce marca qual segmento é o último.
+    """
+
+    def __init__(self, saida, chave_mestra):
+        salt = os.urandom(TAMANHO_SALT)
+        self._aes = AESGCM(_derivar_chave(chave_mestra, salt))
+        self._saida = saida
+        self._pendente = bytearray()
+        self._indice = 0
+        self._recebidos = 0
+        self.fechado = False
+        saida.write(MAGIC + salt)
+
+    def write(self, dados):
+        self._pendente += dados
+        self._recebidos += len(dados)
+
+        # Um segmento cheio só é cifrado quando já chegou algo depois dele
+        inicio = 0
+        while len(self._pendente) - inicio > TAMANHO_SEGMENTO:
+            self._cifrar(bytes(self._pendente[inicio:inicio + TAMANHO_SEGMENTO]), False)
+            inicio += TAMANHO_SEGMENTO
+        if inicio:
+            del self._pendente[:inicio]
+        return len(dados)
+
+    def tell(self):
+        """Bytes em claro recebidos até agora"""
+        return self._recebidos
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if not self.fechado:
+            self._cifrar(bytes(self._pendente), True)
+            self._pendente = bytearray()
+            self.fechado = True
+
+    def _cifrar(self, segmento, ultimo):
+        self._saida.write(self._aes.encrypt(_nonce(self._indice, ultimo), segmento, None))
+        self._indice += 1
+
+
+def _ler_exato(origem, tamanho):
+    partes = []
+    while tamanho > 0:
+        dados = origem.read(tamanho)
+        if not dados:
+            break
+        partes.append(dados)
+        tamanho -= len(dados)
+    return b''.join(partes)
+
+
+def decifrar_intervalo(driver, chave, tamanho_armazenado, chave_mestra, inicio=0, fim=None):
+    """Gera os bytes decifrados de [inicio, fim] (fim inclusivo), lendo apenas os segmentos necessários"""
+    tamanho = tamanho_plano(tamanho_armazenado)
+    fim = tamanho - 1 if fim is None else min(fim, tamanho - 1)
+    if inicio > fim:
+        return
+
+    with driver.abrir(chave, 0, TAMANHO_CABECALHO - 1) as origem:
+        cabecalho = _ler_exato(origem, TAMANHO_CABECALHO)
+    if cabecalho[:len(MAGIC)] != MAGIC:
+        raise ConteudoCorrompidoError('Cabeçalho de criptografia inválido')
+    aes = AESGCM(_derivar_chave(chave_mestra, cabecalho[len(MAGIC):]))
+
+    total = _total_segmentos(tamanho)
+    primeiro = inicio // TAMANHO_SEGMENTO
+    ultimo = fim // TAMANHO_SEGMENTO
+    tamanho_bloco = TAMANHO_SEGMENTO + TAMANHO_TAG
+    offset_inicio = TAMANHO_CABECALHO + primeiro * tamanho_bloco
+    offset_fim = min(TAMANHO_CABECALHO + (ultimo + 1) * tamanho_bloco, tamanho_armazenado) - 1
+
+    with driver.abrir(chave, offset_inicio, offset_fim) as origem:
+        for indice in range(primeiro, ultimo + 1):
+            bloco = _ler_exato(origem, tamanho_bloco)
+            try:
+                segmento = aes.decrypt(_nonce(indice, indice == total - 1), bloco, None)
+            except Exception:
+                raise ConteudoCorrompidoError(f"Falha de autenticação no segmento {indice}")
+
+            base = indice * TAMANHO_SEGMENTO
+            a = inicio - base if indice == primeiro else 0
+            b = fim - base + 1 if indice == ultimo else len(segmento)
+            yield segmento[a:b]
+
+
+class LeitorCifrado(io.RawIOBase):
+    """Arquivo local no formato v1 lido como o conteúdo original, com seek.
+
+    Decifra só os segmentos lidos (guardando o último), para que zipfile e afins leiam um
+    temporário cifrado sem que ele seja decifrado inteiro para o disco.
+    """
+
+    def __init__(self, caminho, chave_mestra):
+        self._arquivo = open(caminho, 'rb')
+        cabecalho = _ler_exato(self._arquivo, TAMANHO_CABECALHO)
+        if cabecalho[:len(MAGIC)] != MAGIC:
+            self._arquivo.close()
+            raise ConteudoCorrompidoError('Cabeçalho de criptografia inválido')
+        self._aes = AESGCM(_derivar_chave(chave_mestra, cabecalho[len(MAGIC):]))
+        self.tamanho = tamanho_plano(os.path.getsize(caminho))
+        self._total = _total_segmentos(self.tamanho)
+        self._segmento = (None, b'')
+        self.posicao = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.posicao
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.posicao
+        elif whence == io.SEEK_END:
+            offset += self.tamanho
+        if offset < 0:
+            raise ValueError('Posição negativa')
+        self.posicao = offset
+        return offset
+
+    def readinto(self, buffer):
+        if self.posicao >= self.tamanho:
+            return 0
+
+        indice = self.posicao // TAMANHO_SEGMENTO
+        segmento = self._ler_segmento(indice)
+        inicio = self.posicao - indice * TAMANHO_SEGMENTO
+        dados = segmento[inicio:inicio + len(buffer)]
+        memoryview(buffer).cast('B')[:len(dados)] = dados
+        self.posicao += len(dados)
+        return len(dados)
+
+    def _ler_segmento(self, indice):
+        if self._segmento[0] == indice:
+            return self._segmento[1]
+
+        tamanho_bloco = TAMANHO_SEGMENTO + TAMANHO_TAG
+        self._arquivo.seek(TAMANHO_CABECALHO + indice * tamanho_bloco)
+        bloco = _ler_exato(self._arquivo, tamanho_bloco)
+        try:
+            segmento = self._aes.decrypt(_nonce(indice, indice == self._total - 1), bloco, None)
+        except Exception:
+            raise ConteudoCorrompidoError(f"Falha de autenticação no segmento {indice}")
+        self._segmento = (indice, segmento)
+        return segmento
+
+    def close(self):
+        self._arquivo.close()
+        super().close()
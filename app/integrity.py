@@ -0,0 +1,80 @@
+import hashlib
+import zlib
+from datetime import datetime, timezone, timedelta
+from flask import current_app
+from app.extensions import db
+from app.models import VerificacaoIntegridade
+from app.storage import obter_driver
+from app.blob_store import registrar_verificacao
+from app.delivery import iterar_conteudo
+from app.encryption import ConteudoCorrompidoError
+
+
+POLITICA_SEMPRE = 'always'
+POLITICA_PERIODICA = 'periodic'
+POLITICA_DIVERGENCIA = 'on-mismatch'
+
+# Falhas de autenticação (GCM) ou de descompressão também indicam conteúdo corrompido
+ERROS_CONTEUDO = (ConteudoCorrompidoError, zlib.error, EOFError)
+
+
+def calcular_hash_conteudo(arquivo, blob=None, driver=None, limitador=None):
+    """SHA-256 do conteúdo original do Arquivo; retorna (hash, bytes lidos)"""
+    file_hash = hashlib.sha256()
+    total = 0
+    for bloco in iterar_conteudo(arquivo, blob, driver):
+        if limitador is not None:
+            limitador.consumir(len(bloco))
+        file_hash.update(bloco)
+        total += len(bloco)
+    return file_hash.hexdigest(), total
+
+
+def mesmo_carimbo(registro, carimbo):
+    return (registro.tamanho, registro.mtime_ns, registro.identificador) == (
+        carimbo['tamanho'], carimbo['mtime_ns'], carimbo['identificador']
+    )
+
+
+class IntegrityCache:
+    """Evita recalcular o SHA-256 do arquivo inteiro a cada download.
+
+    Cada verificação guarda o carimbo (tamanho, mtime e inode/ETag) do arquivo armazenado;
+    enquanto o carimbo não mudar, o resultado é reaproveitado conforme a política. Conteúdo
+    marcado como corrompido (aqui ou pela varredura) é recusado sem ser lido.
+    """
+
+    def __init__(self, politica=None, intervalo_horas=None, driver=None):
+        self.politica = politica or current_app.config['INTEGRITY_CHECK_POLICY']
+        if intervalo_horas is None:
+            intervalo_horas = current_app.config['INTEGRITY_CHECK_INTERVAL_HOURS']
+        self.intervalo = timedelta(hours=intervalo_horas)
+        self.driver = driver or obter_driver()
+
+    def verificar(self, arquivo, blob=None):
+        """Retorna True se o conteúdo armazenado confere com arquivo.hash_arquivo"""
+        carimbo = self.driver.carimbo(arquivo.caminho_armazenamento)
+        registro = db.session.get(VerificacaoIntegridade, arquivo.caminho_armazenamento)
+
+        if registro is not None and registro.hash_arquivo == arquivo.hash_arquivo and mesmo_carimbo(registro, carimbo):
+            if registro.corrompido:
+                return False
+            if self._dentro_da_politica(registro):
+                return True
+
+        try:
+            file_hash, _ = calcular_hash_conteudo(arquivo, blob, self.driver)
+            corrompido = file_hash != arquivo.hash_arquivo
+        except ERROS_CONTEUDO:
+            corrompido = True
+
+        registrar_verificacao(arquivo.caminho_armazenamento, arquivo.hash_arquivo, carimbo, corrompido)
+        db.session.commit()
+        return not corrompido
+
+    def _dentro_da_politica(self, registro):
+        if self.politica == POLITICA_SEMPRE:
+            return False
+        if self.politica == POLITICA_PERIODICA:
+            return registro.data_verificacao + self.intervalo > datetime.now(timezone.utc)
+        return True
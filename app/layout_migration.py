@@ -0,0 +1,208 @@
+import os
+import time
+import argparse
+from collections import deque
+from app.extensions import db
+from app.models import Arquivo, Blob, VerificacaoIntegridade
+from app.blob_store import BlobStore, BLOBS_DIR, caminho_blob
+from app.storage import calcular_hash_arquivo, obter_driver
+
+
+class LayoutMigrator:
+    """Migra arquivos para o layout particionado de blobs em lotes, com o serviço no ar.
+
+    O conteúdo é publicado no novo caminho via hard link antes de o banco ser atualizado, e o
+    caminho antigo só é apagado depois de um período de carência, para que requisições que já
+    leram o caminho antigo do banco continuem encontrando o arquivo.
+    """
+
+    def __init__(self, tamanho_lote=500, pausa=0.0, carencia=60, verificar_hash=True):
+        self.tamanho_lote = tamanho_lote
+        self.pausa = pausa
+        self.carencia = carencia
+        self.verificar_hash = verificar_hash
+        self.driver = obter_driver()
+        if self.driver.caminho_local(BLOBS_DIR) is None:
+            raise RuntimeError('A migração de layout depende de hard links e só funciona com STORAGE_BACKEND=local')
+        self.blob_store = BlobStore(self.driver)
+        self._remocoes = deque()
+        self.migrados = 0
+        self.relocados = 0
+        self.falhas = 0
+
+    def executar(self):
+        inicio = time.monotonic()
+
+        self._migrar_arquivos_legados()
+        self._relocar_blobs()
+        self._processar_remocoes(forcar=True)
+
+        resumo = {
+            'migrados': self.migrados,
+            'relocados': self.relocados,
+            'falhas': self.falhas,
+            'duracao_segundos': round(time.monotonic() - inicio, 1)
+        }
+        print(f"📦 Migração de layout concluída: {resumo}")
+        return resumo
+
+    def _migrar_arquivos_legados(self):
+        """Arquivos gravados em uploads/<usuario>/ passam para o armazenamento por conteúdo"""
+        prefixo_blobs = BLOBS_DIR + os.sep
+        ultimo_id = None
+
+        while True:
+            consulta = Arquivo.query.filter(~Arquivo.caminho_armazenamento.startswith(prefixo_blobs))
+            if ultimo_id is not None:
+                consulta = consulta.filter(Arquivo.id > ultimo_id)
+            lote = consulta.order_by(Arquivo.id).limit(self.tamanho_lote).all()
+            if not lote:
+                break
+            ultimo_id = lote[-1].id
+
+            antigos = []
+            for arquivo in lote:
+                antigo = self._migrar_arquivo(arquivo)
+                if antigo:
+                    antigos.append(antigo)
+
+            db.session.commit()
+            self._agendar_remocao(antigos)
+            self._processar_remocoes()
+            print(f"   Arquivos migrados: {self.migrados} (falhas: {self.falhas})")
+
+            if self.pausa:
+                time.sleep(self.pausa)
+
+    def _migrar_arquivo(self, arquivo):
+        origem = arquivo.caminho_armazenamento
+        if not self.driver.existe(origem):
+            self._registrar_falha(arquivo.id, 'arquivo físico não encontrado')
+            return None
+
+        if self.verificar_hash and calcular_hash_arquivo(self.driver.caminho_local(origem)) != arquivo.hash_arquivo:
+            self._registrar_falha(arquivo.id, 'hash não confere')
+            return None
+
+        try:
+            with db.session.begin_nested():
+                destino, precisa_gravar = self.blob_store.adicionar_referencia(
+                    arquivo.hash_arquivo,
+                    arquivo.tamanho
+                )
+                if precisa_gravar:
+                    self._publicar(origem, destino)
+                arquivo.caminho_armazenamento = destino
+        except Exception as e:
+            self._registrar_falha(arquivo.id, str(e))
+            return None
+
+        self.migrados += 1
+        return origem
+
+    def _relocar_blobs(self):
+        """Move blobs gravados com outro fan-out para o caminho do layout configurado"""
+        ultimo_hash = None
+
+        while True:
+            consulta = Blob.query
+            if ultimo_hash is not None:
+                consulta = consulta.filter(Blob.hash_arquivo > ultimo_hash)
+            lote = consulta.order_by(Blob.hash_arquivo).limit(self.tamanho_lote).with_for_update().all()
+            if not lote:
+                db.session.commit()
+                break
+            ultimo_hash = lote[-1].hash_arquivo
+
+            antigos = []
+            for blob in lote:
+                antigo = blob.caminho_armazenamento
+                destino = caminho_blob(blob.hash_arquivo)
+                if antigo == destino:
+                    continue
+                if not self.driver.existe(antigo):
+                    self._registrar_falha(blob.hash_arquivo, 'blob não encontrado')
+                    continue
+
+                try:
+                    with db.session.begin_nested():
+                        self._publicar(antigo, destino)
+                        Arquivo.query.filter_by(caminho_armazenamento=antigo).update(
+                            {'caminho_armazenamento': destino},
+                            synchronize_session=False
+                        )
+                        # Hard link preserva inode e mtime, então a verificação continua válida
+                        VerificacaoIntegridade.query.filter_by(caminho_armazenamento=antigo).update(
+                            {'caminho_armazenamento': destino},
+                            synchronize_session=False
+                        )
+                        blob.caminho_armazenamento = destino
+                except Exception as e:
+                    self._registrar_falha(blob.hash_arquivo, str(e))
+                    continue
+
+                antigos.append(antigo)
+                self.relocados += 1
+
+            db.session.commit()
+            self._agendar_remocao(antigos)
+            self._processar_remocoes()
+
+            if self.pausa:
+                time.sleep(self.pausa)
+
+    def _publicar(self, origem, destino):
+        origem = self.driver.caminho_local(origem)
+        destino = self.driver.caminho_local(destino)
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        temporario = f"{destino}.migrando"
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        os.link(origem, temporario)
+        os.replace(temporario, destino)
+
+    def _agendar_remocao(self, caminhos):
+        agora = time.monotonic()
+        for caminho in caminhos:
+            self._remocoes.append((agora, caminho))
+
+    def _processar_remocoes(self, forcar=False):
+        while self._remocoes:
+            instante, caminho = self._remocoes[0]
+            espera = instante + self.carencia - time.monotonic()
+            if espera > 0:
+                if not forcar:
+                    return
+                time.sleep(espera)
+
+            self._remocoes.popleft()
+            caminho = self.driver.caminho_local(caminho)
+            try:
+                os.remove(caminho)
+                os.rmdir(os.path.dirname(caminho))
+            except OSError:
+                pass
+
+    def _registrar_falha(self, identificador, motivo):
+        self.falhas += 1
+        print(f"⚠️ Não foi possível migrar {identificador}: {motivo}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Migra os arquivos armazenados para o layout particionado de blobs')
+    parser.add_argument('--lote', type=int, default=500, help='Quantidade de registros por transação')
+    parser.add_argument('--pausa', type=float, default=0.0, help='Segundos de pausa entre lotes')
+    parser.add_argument('--carencia', type=int, default=60, help='Segundos até apagar os caminhos antigos')
+    parser.add_argument('--sem-verificacao', action='store_true', help='Não recalcula o hash antes de migrar')
+    args = parser.parse_args()
+
+    from app import create_app
+
+    app = create_app()
+    with app.app_context():
+        LayoutMigrator(
+            tamanho_lote=args.lote,
+            pausa=args.pausa,
+            carencia=args.carencia,
+            verificar_hash=not args.sem_verificacao
+        ).executar()
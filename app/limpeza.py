@@ -1,6 +1,9 @@
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from app.extensions import db
-from app.models import Usuario, Arquivo, Pasta
+from app.models import Usuario, Arquivo, Pasta, UploadSessao
+from app.storage import remover_sessao_upload
+from flask import current_app
+from app.blob_store import BlobStore, limpar_temporarios
 
 class DeletionManager:
     def __init__(self, retention_minutes=None):
@@ -10,31 +13,62 @@ class DeletionManager:
     def delete_old_records(self):
         cutoff_date = datetime.utcnow() - timedelta(minutes=self.retention_minutes)
         total_deletados = 0
+        blob_store = BlobStore()
+        arquivos_removidos = {}
 
-        usuarios = Usuario.query.filter(
-            Usuario.conta_exclusao_solicitada == True,
-            Usuario.conta_exclusao_data <= cutoff_date
-        ).all()
-        for u in usuarios:
-            db.session.delete(u)
-            total_deletados += 1
-
-        pastas = Pasta.query.filter(
-            Pasta.excluida == True,
-            Pasta.data_exclusao <= cutoff_date
-        ).all()
-        for p in pastas:
-            db.session.delete(p)
-            total_deletados += 1
-
-        arquivos = Arquivo.query.filter(
-            Arquivo.excluido == True,
-            Arquivo.data_exclusao <= cutoff_date
-        ).all()
-        for a in arquivos:
-            db.session.delete(a)
-            total_deletados += 1
-
-        db.session.commit()
+        try:
+            usuarios = Usuario.query.filter(
+                Usuario.conta_exclusao_solicitada == True,
+                Usuario.conta_exclusao_data <= cutoff_date
+            ).all()
+            for u in usuarios:
+                for a in u.arquivos:
+                    arquivos_removidos[a.id] = a
+                db.session.delete(u)
+                total_deletados += 1
+
+            pastas = Pasta.query.filter(
+                Pasta.excluida == True,
+                Pasta.data_exclusao <= cutoff_date
+            ).all()
+            for p in pastas:
+                for a in p.arquivos:
+                    arquivos_removidos[a.id] = a
+                db.session.delete(p)
+                total_deletados += 1
+
+            arquivos = Arquivo.query.filter(
+                Arquivo.excluido == True,
+                Arquivo.data_exclusao <= cutoff_date
+            ).all()
+            for a in arquivos:
+                arquivos_removidos[a.id] = a
+                db.session.delete(a)
+                total_deletados += 1
+
+            # O conteúdo físico só é apagado quando nenhum outro arquivo referencia o mesmo blob
+            for a in arquivos_removidos.values():
+                blob_store.liberar(a)
+
+            # Uploads retomáveis abandonados ou já encerrados
+            sessoes_upload = UploadSessao.query.filter(
+                db.or_(
+                    UploadSessao.data_expiracao <= datetime.now(timezone.utc),
+                    UploadSessao.status != 'ativa'
+                )
+            ).all()
+            for s in sessoes_upload:
+                remover_sessao_upload(s.id)
+                db.session.delete(s)
+                total_deletados += 1
+
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            blob_store.desfazer()
+            raise
+
+        blob_store.concluir()
+        limpar_temporarios(current_app.config['UPLOAD_TMP_MAX_AGE_MINUTES'] * 60)
         print(f"🧹 Exclusão concluída. Registros apagados: {total_deletados}")
         return total_deletados > 0
@@ -152,6 +152,91 @@ class Arquivo(db.Model):
     usuario = relationship("Usuario", back_populates="arquivos")
     compartilhamentos = relationship("Compartilhamento", back_populates="arquivo", cascade="all, delete")
 
+# TABELA: blobs
+# -----------------------------------------------------------------------------------------------
+class Blob(db.Model):
+    __tablename__ = "blobs"
+
+    hash_arquivo = Column(Text, primary_key=True)  # SHA-256 do conteúdo
+    caminho_armazenamento = Column(Text, nullable=False)
+    tamanho = Column(BigInteger, nullable=False)
+    referencias = Column(BigInteger, nullable=False, default=0)
+    codificacao = Column(String(20))  # Compressão em repouso (None = conteúdo original)
+    criptografia = Column(String(20))  # Algoritmo da criptografia em repouso (None = sem criptografia)
+    tamanho_armazenado = Column(BigInteger)  # Bytes ocupados no armazenamento, após compressão e criptografia
+    pontos_acesso = Column(JSONB)  # [[offset original, offset comprimido], ...] onde a descompressão pode começar
+    data_criacao = Column(DateTime(timezone=True), server_default=func.now())
+
+# TABELA: derivados
+# -----------------------------------------------------------------------------------------------
+class Derivado(db.Model):
+    __tablename__ = "derivados"
+
+    hash_arquivo = Column(Text, primary_key=True)  # Conteúdo de origem
+    tipo = Column(Text, primary_key=True)  # Ex.: miniatura-320.webp
+    caminho_armazenamento = Column(Text, nullable=False)
+    tipo_mime = Column(Text, nullable=False)
+    tamanho = Column(BigInteger, nullable=False)
+    codificacao = Column(String(20))
+    criptografia = Column(String(20))
+    tamanho_armazenado = Column(BigInteger, nullable=False)
+    pontos_acesso = Column(JSONB)
+    data_criacao = Column(DateTime(timezone=True), server_default=func.now())
+    data_acesso = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), index=True)  # Ordem de despejo (LRU)
+
+# TABELA: verificacoes_integridade
+# -----------------------------------------------------------------------------------------------
+class VerificacaoIntegridade(db.Model):
+    __tablename__ = "verificacoes_integridade"
+
+    caminho_armazenamento = Column(Text, primary_key=True)
+    hash_arquivo = Column(Text, nullable=False)
+    tamanho = Column(BigInteger, nullable=False)  # Carimbo do arquivo armazenado no momento da verificação
+    mtime_ns = Column(BigInteger, nullable=False)
+    identificador = Column(Text)  # inode (local) ou ETag (S3)
+    corrompido = Column(Boolean, nullable=False, default=False)  # Hash não confere com este carimbo
+    data_verificacao = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+# TABELA: varreduras_integridade
+# -----------------------------------------------------------------------------------------------
+class VarreduraIntegridade(db.Model):
+    __tablename__ = "varreduras_integridade"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    status = Column(Text, nullable=False, default='em_andamento')  # em_andamento, concluida
+    ultimo_id_arquivo = Column(UUID(as_uuid=True), nullable=True)  # Ponto de retomada
+    arquivos_verificados = Column(BigInteger, nullable=False, default=0)
+    corrompidos = Column(BigInteger, nullable=False, default=0)
+    ausentes = Column(BigInteger, nullable=False, default=0)
+    bytes_lidos = Column(BigInteger, nullable=False, default=0)
+    segundos = Column(Numeric(12, 1), nullable=False, default=0)  # Tempo efetivo de varredura
+    data_inicio = Column(DateTime(timezone=True), server_default=func.now())
+    data_fim = Column(DateTime(timezone=True), nullable=True)
+
+# TABELA: upload_sessoes
+# -----------------------------------------------------------------------------------------------
+class UploadSessao(db.Model):
+    __tablename__ = "upload_sessoes"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id_usuario = Column(UUID(as_uuid=True), ForeignKey("usuarios.id", ondelete="CASCADE"))
+    nome_original = Column(Text, nullable=False)
+    tamanho = Column(BigInteger, nullable=False)
+    tamanho_chunk = Column(BigInteger, nullable=False)
+    total_chunks = Column(BigInteger, nullable=False)
+    hash_esperado = Column(Text, nullable=True)  # SHA-256 informado pelo cliente (opcional)
+    publico = Column(Boolean, default=False)
+    descricao = Column(Text, nullable=True)
+    tags = Column(JSONB, nullable=True)
+    id_pasta = Column(UUID(as_uuid=True), ForeignKey("pastas.id", ondelete="CASCADE"), nullable=True)
+    status = Column(Text, nullable=False, default='ativa')  # ativa, concluida, cancelada
+    data_criacao = Column(DateTime(timezone=True), server_default=func.now())
+    data_expiracao = Column(DateTime(timezone=True), nullable=False)
+    id_arquivo = Column(UUID(as_uuid=True), ForeignKey("arquivos.id", ondelete="SET NULL"), nullable=True)
+
+    usuario = relationship("Usuario")
+    arquivo = relationship("Arquivo")
+
 # TABELA: compartilhamentos
 
 # -----------------------------------------------------------------------------------------------
@@ -0,0 +1,100 @@
+from sqlalchemy import update, func
+from app.extensions import db
+from app.models import Usuario
+from app.storage import QuotaExcedidaError
+
+
+RESERVA_BLOCO = 64 * 1024 * 1024
+
+
+class QuotaReservation:
+    """Reserva de quota feita com UPDATE condicional atômico.
+
+    Cada reserva é confirmada imediatamente em transação própria, então a linha do usuário
+    não fica bloqueada durante a gravação do arquivo e uploads paralelos da mesma conta
+    nunca ultrapassam a quota.
+    """
+
+    def __init__(self, usuario_id, bloco=RESERVA_BLOCO):
+        self.usuario_id = usuario_id
+        self.bloco = bloco
+        self.reservado = 0
+        self.consumido = 0
+
+    def reservar(self, tamanho):
+        if tamanho <= 0:
+            return True
+
+        resultado = db.session.execute(
+            update(Usuario)
+            .where(
+                Usuario.id == self.usuario_id,
+                Usuario.armazenamento_utilizado + tamanho <= Usuario.quota_armazenamento
+            )
+            .values(armazenamento_utilizado=Usuario.armazenamento_utilizado + tamanho)
+            .returning(Usuario.armazenamento_utilizado)
+            .execution_options(synchronize_session=False)
+        ).first()
+
+        if resultado is None:
+            db.session.rollback()
+            return False
+
+        db.session.commit()
+        self.reservado += tamanho
+        return True
+
+    def reservar_disponivel(self, tamanho):
+        """Reserva até `tamanho`, limitado ao que ainda cabe na quota; retorna o valor reservado.
+
+        Para limites superiores como o Content-Length de um multipart, que inclui delimitadores
+        e outros campos: o restante é reservado por consumir() conforme os bytes chegam.
+        """
+        livre = db.session.query(
+            Usuario.quota_armazenamento - Usuario.armazenamento_utilizado
+        ).filter(Usuario.id == self.usuario_id).scalar() or 0
+        parcela = max(min(tamanho, livre), 0)
+        # Se um upload paralelo ocupou a quota nesse meio tempo, consumir() decide depois
+        if parcela and not self.reservar(parcela):
+            return 0
+        return parcela
+
+    def consumir(self, tamanho):
+        """Contabiliza bytes recebidos, ampliando a reserva em blocos quando necessário"""
+        self.consumido += tamanho
+        if self.consumido <= self.reservado:
+            return
+
+        falta = self.consumido - self.reservado
+        if not (self.reservar(max(falta, self.bloco)) or self.reservar(falta)):
+            raise QuotaExcedidaError('Quota de armazenamento excedida')
+
+    def ajustar(self, tamanho_final):
+        """Faz a reserva corresponder exatamente ao tamanho final, devolvendo o excedente"""
+        if tamanho_final > self.reservado:
+            if not self.reservar(tamanho_final - self.reservado):
+                raise QuotaExcedidaError('Quota de armazenamento excedida')
+        elif tamanho_final < self.reservado:
+            self._devolver(self.reservado - tamanho_final)
+            self.reservado = tamanho_final
+
+    def confirmar(self):
+        """A reserva passa a ser uso definitivo (chamar após o commit do arquivo)"""
+        self.reservado = 0
+        self.consumido = 0
+
+    def liberar(self):
+        """Devolve tudo o que ainda estiver reservado"""
+        if self.reservado:
+            self._devolver(self.reservado)
+        self.reservado = 0
+        self.consumido = 0
+
+    def _devolver(self, tamanho):
+        db.session.execute(
+            update(Usuario)
+            .where(Usuario.id == self.usuario_id)
+            .values(armazenamento_utilizado=func.greatest(Usuario.armazenamento_utilizado - tamanho, 0))
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
@@ -0,0 +1,192 @@
+import time
+import argparse
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from sqlalchemy import func
+from app.extensions import db
+from app.models import Arquivo, VerificacaoIntegridade, VarreduraIntegridade
+from app.storage import obter_driver
+from app.blob_store import registrar_verificacao
+from app.integrity import ERROS_CONTEUDO, calcular_hash_conteudo, mesmo_carimbo
+from app.throttle import TokenBucket
+
+
+class IntegrityScrubber:
+    """Varredura de integridade em segundo plano: recalcula o hash dos arquivos armazenados.
+
+    Percorre os Arquivos em lotes (por id), calculando o hash de cada conteúdo físico uma única
+    vez em um pool de threads, com a leitura limitada por um balde de fichas. O resultado vai
+    para verificacoes_integridade, de onde os downloads recusam conteúdo corrompido sem lê-lo.
+    O progresso fica em varreduras_integridade, então uma varredura interrompida é retomada.
+    """
+
+    def __init__(self, tamanho_lote=200, trabalhadores=4, limite_bytes_segundo=None,
+                 reiniciar=False, intervalo_relatorio=30):
+        self.tamanho_lote = tamanho_lote
+        self.trabalhadores = trabalhadores
+        self.limitador = TokenBucket(limite_bytes_segundo) if limite_bytes_segundo else None
+        self.reiniciar = reiniciar
+        self.intervalo_relatorio = intervalo_relatorio
+        self.driver = obter_driver()
+
+    def executar(self):
+        app = current_app._get_current_object()
+        varredura = self._obter_varredura()
+        inicio_varredura = varredura.data_inicio
+        total_bytes = self._total_bytes()
+
+        inicio = time.monotonic()
+        segundos_anteriores = float(varredura.segundos or 0)
+        ultimo_relatorio = inicio
+
+        with ThreadPoolExecutor(max_workers=self.trabalhadores) as executor:
+            while True:
+                consulta = Arquivo.query
+                if varredura.ultimo_id_arquivo is not None:
+                    consulta = consulta.filter(Arquivo.id > varredura.ultimo_id_arquivo)
+                lote = consulta.order_by(Arquivo.id).limit(self.tamanho_lote).all()
+                if not lote:
+                    break
+
+                # Conteúdo deduplicado é compartilhado por vários Arquivos: um hash por caminho
+                por_caminho = {}
+                for arquivo in lote:
+                    por_caminho.setdefault(arquivo.caminho_armazenamento, arquivo)
+
+                registros = {
+                    r.caminho_armazenamento: r
+                    for r in VerificacaoIntegridade.query.filter(
+                        VerificacaoIntegridade.caminho_armazenamento.in_(list(por_caminho))
+                    )
+                }
+
+                resultados = executor.map(
+                    lambda arquivo: self._verificar(app, arquivo, registros.get(arquivo.caminho_armazenamento), inicio_varredura),
+                    list(por_caminho.values())
+                )
+                for arquivo, resultado in zip(por_caminho.values(), resultados):
+                    self._registrar_resultado(varredura, arquivo, resultado)
+
+                varredura.ultimo_id_arquivo = lote[-1].id
+                varredura.segundos = round(segundos_anteriores + time.monotonic() - inicio, 1)
+                db.session.commit()
+
+                if time.monotonic() - ultimo_relatorio >= self.intervalo_relatorio:
+                    self._relatorio(varredura, total_bytes)
+                    ultimo_relatorio = time.monotonic()
+
+        varredura.status = 'concluida'
+        varredura.data_fim = datetime.now(timezone.utc)
+        varredura.segundos = round(segundos_anteriores + time.monotonic() - inicio, 1)
+        db.session.commit()
+        return self._relatorio(varredura, total_bytes, final=True)
+
+    def _obter_varredura(self):
+        varredura = VarreduraIntegridade.query.filter_by(status='em_andamento').order_by(
+            VarreduraIntegridade.data_inicio.desc()
+        ).first()
+
+        if varredura and self.reiniciar:
+            varredura.status = 'concluida'
+            varredura.data_fim = datetime.now(timezone.utc)
+            varredura = None
+
+        if varredura:
+            print(f"🔁 Retomando varredura {varredura.id} após {varredura.arquivos_verificados} arquivos")
+        else:
+            varredura = VarreduraIntegridade()
+            db.session.add(varredura)
+        db.session.commit()
+        return varredura
+
+    def _total_bytes(self):
+        conteudos = db.session.query(Arquivo.caminho_armazenamento, Arquivo.tamanho).distinct().subquery()
+        return db.session.query(func.coalesce(func.sum(conteudos.c.tamanho), 0)).scalar()
+
+    def _verificar(self, app, arquivo, registro, inicio_varredura):
+        """Executado nas threads do pool; não altera o banco"""
+        with app.app_context():
+            caminho = arquivo.caminho_armazenamento
+            if not self.driver.existe(caminho):
+                return {'status': 'ausente'}
+
+            carimbo = self.driver.carimbo(caminho)
+            if (
+                registro is not None
+                and registro.hash_arquivo == arquivo.hash_arquivo
+                and mesmo_carimbo(registro, carimbo)
+                and registro.data_verificacao >= inicio_varredura
+            ):
+                # Já verificado nesta varredura (conteúdo repetido em outro lote ou retomada)
+                return {'status': 'pulado'}
+
+            try:
+                file_hash, lidos = calcular_hash_conteudo(arquivo, driver=self.driver, limitador=self.limitador)
+                corrompido = file_hash != arquivo.hash_arquivo
+            except ERROS_CONTEUDO:
+                lidos, corrompido = 0, True
+
+            return {
+                'status': 'corrompido' if corrompido else 'ok',
+                'carimbo': carimbo,
+                'bytes': lidos
+            }
+
+    def _registrar_resultado(self, varredura, arquivo, resultado):
+        status = resultado['status']
+        if status == 'pulado':
+            return
+
+        varredura.arquivos_verificados += 1
+        if status == 'ausente':
+            varredura.ausentes += 1
+            print(f"⚠️ Conteúdo ausente: {arquivo.caminho_armazenamento} (arquivo {arquivo.id})")
+            return
+
+        varredura.bytes_lidos += resultado['bytes']
+        corrompido = status == 'corrompido'
+        if corrompido:
+            varredura.corrompidos += 1
+            print(f"❌ Conteúdo corrompido: {arquivo.caminho_armazenamento} (arquivo {arquivo.id})")
+
+        registrar_verificacao(arquivo.caminho_armazenamento, arquivo.hash_arquivo, resultado['carimbo'], corrompido)
+
+    def _relatorio(self, varredura, total_bytes, final=False):
+        segundos = float(varredura.segundos) or 1.0
+        bytes_por_segundo = varredura.bytes_lidos / segundos
+        resumo = {
+            'varredura': str(varredura.id),
+            'arquivos_verificados': varredura.arquivos_verificados,
+            'corrompidos': varredura.corrompidos,
+            'ausentes': varredura.ausentes,
+            'mb_lidos': round(varredura.bytes_lidos / (1024 * 1024), 1),
+            'mb_por_segundo': round(bytes_por_segundo / (1024 * 1024), 2),
+            'arquivos_por_segundo': round(varredura.arquivos_verificados / segundos, 1),
+            'duracao_segundos': round(segundos, 1),
+            # Tempo estimado para uma varredura completa do armazenamento neste ritmo
+            'estimativa_completa_horas': round(total_bytes / bytes_por_segundo / 3600, 1) if bytes_por_segundo else None
+        }
+        titulo = 'Varredura de integridade concluída' if final else 'Varredura de integridade em andamento'
+        print(f"🔍 {titulo}: {resumo}")
+        return resumo
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Verifica a integridade dos arquivos armazenados em segundo plano')
+    parser.add_argument('--lote', type=int, default=200, help='Quantidade de arquivos por lote')
+    parser.add_argument('--trabalhadores', type=int, default=4, help='Threads calculando hashes em paralelo')
+    parser.add_argument('--limite-mb', type=float, default=None, help='Limite de leitura em MB/s (padrão: sem limite)')
+    parser.add_argument('--reiniciar', action='store_true', help='Descarta a varredura em andamento e começa do início')
+    args = parser.parse_args()
+
+    from app import create_app
+
+    app = create_app()
+    with app.app_context():
+        IntegrityScrubber(
+            tamanho_lote=args.lote,
+            trabalhadores=args.trabalhadores,
+            limite_bytes_segundo=int(args.limite_mb * 1024 * 1024) if args.limite_mb else None,
+            reiniciar=args.reiniciar
+        ).executar()
@@ -0,0 +1,94 @@
+import threading
+import time
+from collections import OrderedDict
+from types import SimpleNamespace
+from flask import current_app
+from app.extensions import db
+from app.models import Arquivo, Compartilhamento
+
+
+def _copiar(modelo):
+    """Cópia desacoplada da sessão: só as colunas, segura para compartilhar entre requisições"""
+    return SimpleNamespace(**{coluna.key: getattr(modelo, coluna.key) for coluna in modelo.__table__.columns})
+
+
+class ShareCache:
+    """Cache LRU, com TTL, de token -> (compartilhamento, arquivo) para os links públicos.
+
+    Guarda também tokens inexistentes/inativos (como None), para que links inválidos muito
+    acessados também não custem consultas. É por processo: invalidar() limpa só o processo
+    atual, e nos demais workers a entrada antiga vale no máximo SHARE_CACHE_TTL_SECONDS.
+    """
+
+    def __init__(self, capacidade, ttl):
+        self.capacidade = capacidade
+        self.ttl = ttl
+        self._entradas = OrderedDict()
+        self._trava = threading.Lock()
+        # Incrementada a cada invalidação: uma consulta que começou antes dela não é guardada
+        self._geracao = 0
+
+    def resolver(self, token):
+        """(compartilhamento, arquivo) do link ativo, de arquivo não excluído, ou None"""
+        agora = time.monotonic()
+        with self._trava:
+            entrada = self._entradas.get(token)
+            if entrada is not None and entrada[0] > agora:
+                self._entradas.move_to_end(token)
+                return entrada[1]
+            geracao = self._geracao
+
+        estado = self._carregar(token)
+
+        with self._trava:
+            if geracao == self._geracao and self.capacidade > 0:
+                self._entradas[token] = (agora + self.ttl, estado)
+                self._entradas.move_to_end(token)
+                while len(self._entradas) > self.capacidade:
+                    self._entradas.popitem(last=False)
+        return estado
+
+    def _carregar(self, token):
+        resultado = db.session.query(Compartilhamento, Arquivo).join(
+            Arquivo, Compartilhamento.id_arquivo == Arquivo.id
+        ).filter(
+            Compartilhamento.token == token,
+            Compartilhamento.ativo == True,
+            Arquivo.excluido == False
+        ).first()
+        if resultado is None:
+            return None
+        compartilhamento, arquivo = resultado
+        return _copiar(compartilhamento), _copiar(arquivo)
+
+    def invalidar(self, token=None, id_arquivo=None, id_usuario=None):
+        """Descarta as entradas do token, do arquivo ou de todos os arquivos do usuário"""
+        with self._trava:
+            self._geracao += 1
+            if token is not None:
+                self._entradas.pop(token, None)
+            if id_arquivo is None and id_usuario is None:
+                return
+
+            for chave, (_, estado) in list(self._entradas.items()):
+                if estado is None:
+                    continue
+                _, arquivo = estado
+                if (id_arquivo is not None and str(arquivo.id) == str(id_arquivo)) or \
+                        (id_usuario is not None and str(arquivo.id_usuario) == str(id_usuario)):
+                    del self._entradas[chave]
+
+
+def obter_cache_compartilhamentos():
+    cache = current_app.extensions.get('share_cache')
+    if cache is None:
+        cache = ShareCache(
+            current_app.config['SHARE_CACHE_MAX_ENTRIES'],
+            current_app.config['SHARE_CACHE_TTL_SECONDS']
+        )
+        current_app.extensions['share_cache'] = cache
+    return cache
+
+
+def invalidar_compartilhamentos(token=None, id_arquivo=None, id_usuario=None):
+    obter_cache_compartilhamentos().invalidar(token=token, id_arquivo=id_arquivo, id_usuario=id_usuario)
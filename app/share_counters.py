@@ -0,0 +1,108 @@
+import atexit
+import threading
+from flask import current_app
+from sqlalchemy import update, func
+from app.extensions import db
+from app.models import Compartilhamento
+
+
+class ShareAccessCounter:
+    """Contadores de acesso dos links compartilhados, gravados em lote (write-behind).
+
+    Acessos de links sem limite só somam em memória e uma thread grava o acumulado a cada
+    SHARE_ACCESS_FLUSH_SECONDS com `acessos = acessos + n`: sem ler e regravar a linha e sem
+    uma transação por acesso. Links com max_acessos reservam o acesso na hora, com um UPDATE
+    condicional, para que o limite valha mesmo com vários workers ao mesmo tempo.
+    """
+
+    def __init__(self, app, intervalo):
+        self.app = app
+        self.intervalo = intervalo
+        self._pendentes = {}
+        self._trava = threading.Lock()
+        self._parar = threading.Event()
+        self._thread = None
+
+    def registrar(self, compartilhamento, reservar=True):
+        """Conta um acesso; False quando o limite do link já foi atingido (nada é contado)"""
+        if reservar and compartilhamento.max_acessos:
+            acessos = db.session.execute(
+                update(Compartilhamento)
+                .where(
+                    Compartilhamento.id == compartilhamento.id,
+                    func.coalesce(Compartilhamento.acessos, 0) < Compartilhamento.max_acessos
+                )
+                .values(acessos=func.coalesce(Compartilhamento.acessos, 0) + 1)
+                .returning(Compartilhamento.acessos)
+            ).scalar()
+            db.session.commit()
+            if acessos is None:
+                compartilhamento.acessos = compartilhamento.max_acessos
+                return False
+            # Atualiza a cópia em cache: as próximas requisições já rejeitam sem ir ao banco
+            compartilhamento.acessos = acessos
+            return True
+
+        with self._trava:
+            self._pendentes[compartilhamento.id] = self._pendentes.get(compartilhamento.id, 0) + 1
+            if self._thread is None:
+                self._iniciar()
+        return True
+
+    def _iniciar(self):
+        self._thread = threading.Thread(target=self._executar, name='contadores-compartilhamento', daemon=True)
+        self._thread.start()
+        atexit.register(self.parar)
+
+    def _executar(self):
+        while not self._parar.wait(self.intervalo):
+            self._descarregar_em_contexto()
+
+    def _descarregar_em_contexto(self):
+        with self.app.app_context():
+            try:
+                self.descarregar()
+            except Exception as e:
+                print(f"ERRO AO GRAVAR CONTADORES DE COMPARTILHAMENTO: {str(e)}")
+            finally:
+                db.session.remove()
+
+    def descarregar(self):
+        """Grava os acessos acumulados; em caso de erro eles voltam para a próxima rodada"""
+        with self._trava:
+            pendentes, self._pendentes = self._pendentes, {}
+        if not pendentes:
+            return 0
+
+        try:
+            # Ordem fixa das linhas: workers gravando ao mesmo tempo não entram em deadlock
+            for compartilhamento_id in sorted(pendentes, key=str):
+                db.session.execute(
+                    update(Compartilhamento)
+                    .where(Compartilhamento.id == compartilhamento_id)
+                    .values(acessos=func.coalesce(Compartilhamento.acessos, 0) + pendentes[compartilhamento_id])
+                )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            with self._trava:
+                for compartilhamento_id, quantidade in pendentes.items():
+                    self._pendentes[compartilhamento_id] = self._pendentes.get(compartilhamento_id, 0) + quantidade
+            raise
+        return sum(pendentes.values())
+
+    def parar(self):
+        """Para a thread e grava o que ainda estiver pendente (chamado na saída do processo)"""
+        self._parar.set()
+        self._descarregar_em_contexto()
+
+
+def obter_contador_acessos():
+    contador = current_app.extensions.get('share_access_counter')
+    if contador is None:
+        contador = ShareAccessCounter(
+            current_app._get_current_object(),
+            current_app.config['SHARE_ACCESS_FLUSH_SECONDS']
+        )
+        current_app.extensions['share_access_counter'] = contador
+    return contador
@@ -0,0 +1,96 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from urllib.parse import quote
+from flask import current_app, render_template
+
+
+TEMPLATE_VISUALIZACAO = 'compartilhamento/visualizacao.html'
+TEMPLATE_DOWNLOAD = 'compartilhamento/download.html'
+
+TIPOS_VISUALIZAVEIS = {
+    'image/jpeg', 'image/png', 'image/gif', 'image/webp',
+    'application/pdf',
+    'text/plain', 'text/html', 'text/css',
+    'application/json'
+}
+
+
+def precompilar_paginas(app):
+    """Compila os templates na inicialização: o primeiro acesso a um link não paga a compilação"""
+    for nome in (TEMPLATE_VISUALIZACAO, TEMPLATE_DOWNLOAD):
+        app.jinja_env.get_template(nome)
+
+
+def versao_pagina(token, arquivo):
+    """Identifica o HTML gerado: muda com o link e com qualquer dado do arquivo exibido na página"""
+    partes = (
+        token, arquivo.id, arquivo.hash_arquivo, arquivo.nome_original,
+        arquivo.tipo_mime, arquivo.tamanho, arquivo.data_modificacao
+    )
+    return hashlib.sha256('|'.join(str(parte) for parte in partes).encode()).hexdigest()[:32]
+
+
+def _renderizar(token, arquivo):
+    url_download = f"/api/files/download-shared/{arquivo.id}?token={quote(token, safe='')}"
+    contexto = {
+        'arquivo': arquivo,
+        'tamanho_mb': round(arquivo.tamanho / (1024 * 1024), 2),
+        'url_download': url_download,
+        'url_visualizacao': f"{url_download}&preview=true",
+        'imagem': arquivo.tipo_mime.startswith('image/'),
+        'pdf': arquivo.tipo_mime == 'application/pdf'
+    }
+    template = TEMPLATE_VISUALIZACAO if arquivo.tipo_mime in TIPOS_VISUALIZAVEIS else TEMPLATE_DOWNLOAD
+    return render_template(template, **contexto).encode('utf-8')
+
+
+class SharePageCache:
+    """HTML já renderizado das páginas de links compartilhados, por (token, versão do arquivo).
+
+    A chave inclui a versão, então uma entrada nunca fica desatualizada: renomear ou trocar
+    o conteúdo gera outra chave e a antiga sai pelo LRU.
+    """
+
+    def __init__(self, capacidade):
+        self.capacidade = capacidade
+        self._paginas = OrderedDict()
+        self._trava = threading.Lock()
+
+    def obter(self, token, arquivo):
+        """(etag, corpo) da página do link"""
+        versao = versao_pagina(token, arquivo)
+        with self._trava:
+            corpo = self._paginas.get(versao)
+            if corpo is not None:
+                self._paginas.move_to_end(versao)
+                return versao, corpo
+
+        corpo = _renderizar(token, arquivo)
+        with self._trava:
+            if self.capacidade > 0:
+                self._paginas[versao] = corpo
+                while len(self._paginas) > self.capacidade:
+                    self._paginas.popitem(last=False)
+        return versao, corpo
+
+
+def obter_cache_paginas():
+    cache = current_app.extensions.get('share_page_cache')
+    if cache is None:
+        cache = SharePageCache(current_app.config['SHARE_PAGE_CACHE_MAX_ENTRIES'])
+        current_app.extensions['share_page_cache'] = cache
+    return cache
+
+
+def cache_control_pagina(compartilhamento):
+    """Cache curto no navegador; links com limite de acessos revalidam sempre, para cada visita contar"""
+    if compartilhamento.max_acessos:
+        return 'private, no-cache'
+
+    max_age = current_app.config['SHARE_PAGE_MAX_AGE_SECONDS']
+    if compartilhamento.data_expiracao:
+        restante = (compartilhamento.data_expiracao - datetime.now(timezone.utc)).total_seconds()
+        max_age = max(0, min(max_age, int(restante)))
+    return f'private, max-age={max_age}'
@@ -0,0 +1,182 @@
+import os
+import json
+import time
+import base64
+import threading
+from uuid import UUID
+from collections import OrderedDict
+from types import SimpleNamespace
+from datetime import datetime, timezone
+from flask import current_app
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from app.extensions import db
+from app.models import Arquivo, Sessao
+
+
+TAMANHO_NONCE = 12
+
+
+class AssinaturaInvalidaError(Exception):
+    pass
+
+
+class LinkExpiradoError(Exception):
+    pass
+
+
+def _b64(dados):
+    return base64.urlsafe_b64encode(dados).rstrip(b'=').decode()
+
+
+def _de_b64(texto):
+    return base64.urlsafe_b64decode(texto + '=' * (-len(texto) % 4))
+
+
+def _chave():
+    chave = current_app.config['DOWNLOAD_SIGNED_URL_KEY'] or current_app.config['SECRET_KEY']
+    if not chave:
+        raise RuntimeError('Configure DOWNLOAD_SIGNED_URL_KEY (ou SECRET_KEY) para assinar links de download')
+    return chave.encode()
+
+
+def _cifra():
+    # Chave própria para os links, derivada do segredo: o mesmo valor nunca cifra outra coisa
+    return AESGCM(HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=None,
+        info=b'nuvem-link-download-v1'
+    ).derive(_chave()))
+
+
+def assinar_download(arquivo, blob, usuario_id, disposicao, validade=None, jti=None):
+    """Gera o token de um link de download; retorna (token, expiração).
+
+    O token carrega tudo o que a entrega precisa (caminho, tamanho, tipo, hash e codificação
+    em repouso), então o download é servido sem ler o arquivo no banco; só o estado dele e da
+    sessão `jti` que gerou o link é reconferido, com cache curto (ver SignedLinkCache). Os dados vão
+    cifrados com AES-GCM: quem tem o link não vê caminho, hash, dono nem nome do arquivo, e a
+    tag do GCM faz o papel da assinatura.
+    """
+    if validade is None:
+        validade = current_app.config['DOWNLOAD_SIGNED_URL_TTL_SECONDS']
+    expira = int(time.time()) + validade
+
+    dados = {
+        'a': str(arquivo.id),
+        'u': str(usuario_id),
+        's': jti,
+        'd': disposicao,
+        'e': expira,
+        'c': arquivo.caminho_armazenamento,
+        'h': arquivo.hash_arquivo,
+        't': arquivo.tamanho,
+        'm': arquivo.tipo_mime,
+        'n': arquivo.nome_original,
+        'md': int(arquivo.data_modificacao.timestamp()) if arquivo.data_modificacao else None,
+        'b': [blob.codificacao, blob.criptografia, blob.tamanho_armazenado] if blob is not None else None
+    }
+    nonce = os.urandom(TAMANHO_NONCE)
+    carga = _cifra().encrypt(nonce, json.dumps(dados, separators=(',', ':'), ensure_ascii=False).encode(), None)
+    return _b64(nonce + carga), datetime.fromtimestamp(expira, timezone.utc)
+
+
+def validar_download(token):
+    """Decifra o token e confere autenticidade e validade; retorna os dados do link"""
+    bruto = _de_b64(token)
+    if len(bruto) <= TAMANHO_NONCE:
+        raise AssinaturaInvalidaError('Assinatura inválida')
+    try:
+        carga = _cifra().decrypt(bruto[:TAMANHO_NONCE], bruto[TAMANHO_NONCE:], None)
+    except InvalidTag:
+        raise AssinaturaInvalidaError('Assinatura inválida')
+
+    dados = json.loads(carga)
+    if dados['e'] <= time.time():
+        raise LinkExpiradoError('Link expirado')
+    return dados
+
+
+def arquivo_assinado(dados):
+    """Reconstrói (arquivo, blob) a partir dos dados do token, no formato usado por enviar_arquivo"""
+    arquivo = SimpleNamespace(
+        id=dados['a'],
+        caminho_armazenamento=dados['c'],
+        hash_arquivo=dados['h'],
+        tamanho=dados['t'],
+        tipo_mime=dados['m'],
+        nome_original=dados['n'],
+        data_modificacao=datetime.fromtimestamp(dados['md'], timezone.utc) if dados['md'] is not None else None
+    )
+    # Arquivos anteriores ao armazenamento por conteúdo: em claro e sem compressão
+    codificacao, criptografia, tamanho_armazenado = dados['b'] or (None, None, dados['t'])
+    blob = SimpleNamespace(
+        codificacao=codificacao,
+        criptografia=criptografia,
+        tamanho_armazenado=tamanho_armazenado
+    )
+    return arquivo, blob
+
+
+class SignedLinkCache:
+    """Revalidação, por processo e com TTL, dos links assinados ainda dentro da validade.
+
+    Um link deixa de funcionar quando o arquivo é excluído, tem o conteúdo trocado ou deixa de
+    estar acessível ao usuário (não é dele e não é mais público), ou quando a sessão que o
+    gerou é encerrada. Cada combinação (arquivo, usuário, sessão, hash) custa no máximo duas
+    consultas por DOWNLOAD_SIGNED_URL_REVALIDATE_SECONDS, que é também o atraso máximo da revogação.
+    """
+
+    def __init__(self, capacidade, ttl):
+        self.capacidade = capacidade
+        self.ttl = ttl
+        self._entradas = OrderedDict()
+        self._trava = threading.Lock()
+
+    def valido(self, dados):
+        chave = (dados['a'], dados['u'], dados.get('s'), dados['h'])
+        agora = time.monotonic()
+        with self._trava:
+            entrada = self._entradas.get(chave)
+            if entrada is not None and entrada[0] > agora:
+                self._entradas.move_to_end(chave)
+                return entrada[1]
+
+        valido = self._carregar(dados)
+
+        with self._trava:
+            if self.capacidade > 0:
+                self._entradas[chave] = (agora + self.ttl, valido)
+                self._entradas.move_to_end(chave)
+                while len(self._entradas) > self.capacidade:
+                    self._entradas.popitem(last=False)
+        return valido
+
+    def _carregar(self, dados):
+        arquivo = db.session.query(
+            Arquivo.id_usuario, Arquivo.publico, Arquivo.excluido, Arquivo.hash_arquivo
+        ).filter(Arquivo.id == UUID(dados['a'])).first()
+        if arquivo is None or arquivo.excluido or arquivo.hash_arquivo != dados['h']:
+            return False
+        if str(arquivo.id_usuario) != dados['u'] and not arquivo.publico:
+            return False
+
+        return db.session.query(Sessao.id).filter(
+            Sessao.id_usuario == UUID(dados['u']),
+            Sessao.jwt_token == dados.get('s'),
+            Sessao.dois_fatores_validado == True
+        ).first() is not None
+
+
+def obter_cache_links_assinados():
+    cache = current_app.extensions.get('signed_link_cache')
+    if cache is None:
+        cache = SignedLinkCache(
+            current_app.config['DOWNLOAD_SIGNED_URL_CACHE_MAX_ENTRIES'],
+            current_app.config['DOWNLOAD_SIGNED_URL_REVALIDATE_SECONDS']
+        )
+        current_app.extensions['signed_link_cache'] = cache
+    return cache
@@ -0,0 +1,373 @@
+import os
+import hashlib
+import shutil
+from uuid import uuid4
+from flask import current_app
+import boto3
+from botocore.exceptions import ClientError
+
+
+CHUNK_SIZE = 1024 * 1024
+SESSOES_UPLOAD_DIR = os.path.join('uploads', '.sessoes')
+
+
+class QuotaExcedidaError(Exception):
+    pass
+
+
+class HashingUploadStream:
+    """Recebe um upload calculando SHA-256 e tamanho enquanto os bytes chegam.
+
+    Cada bloco segue direto para a gravação do BlobWriter (compressão e criptografia em
+    repouso), então com chave configurada o conteúdo nunca fica em claro no disco.
+    """
+
+    def __init__(self, gravador, diretorio, limite_bytes=None, reserva=None, tipo_mime=None):
+        self._gravacao = gravador.iniciar(diretorio, tipo_mime)
+        self._hash = hashlib.sha256()
+        self.limite_bytes = limite_bytes
+        self.reserva = reserva
+        self.tamanho = 0
+
+    def write(self, data):
+        self.tamanho += len(data)
+        if self.limite_bytes is not None and self.tamanho > self.limite_bytes:
+            raise QuotaExcedidaError('Quota de armazenamento excedida')
+        if self.reserva is not None:
+            self.reserva.consumir(len(data))
+
+        self._hash.update(data)
+        return self._gravacao.write(data)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        # O parser de multipart volta ao início ao fim de cada parte; o conteúdo é lido com abrir_leitura()
+        return 0
+
+    def tell(self):
+        return self.tamanho
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self._gravacao.concluir()
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+    def abrir_leitura(self):
+        return self._gravacao.abrir_leitura()
+
+    def finalizar(self, destino):
+        """Publica o conteúdo recebido sob a chave `destino` (ver GravacaoBlob.publicar)"""
+        return self._gravacao.publicar(destino)
+
+    def descartar(self):
+        self._gravacao.descartar()
+
+
+def copiar_stream(origem, destino, tamanho_bloco=CHUNK_SIZE):
+    """Copia um stream para outro em blocos de tamanho fixo"""
+    total = 0
+    while True:
+        bloco = origem.read(tamanho_bloco)
+        if not bloco:
+            break
+        destino.write(bloco)
+        total += len(bloco)
+    return total
+
+
+def calcular_hash_arquivo(caminho, tamanho_bloco=CHUNK_SIZE):
+    file_hash = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(tamanho_bloco), b''):
+            file_hash.update(bloco)
+    return file_hash.hexdigest()
+
+
+def diretorio_sessao_upload(sessao_id):
+    return os.path.join(SESSOES_UPLOAD_DIR, str(sessao_id))
+
+
+def caminho_dados_sessao(sessao_id):
+    return os.path.join(diretorio_sessao_upload(sessao_id), 'dados.part')
+
+
+def caminho_marcador_chunk(sessao_id, indice):
+    return os.path.join(diretorio_sessao_upload(sessao_id), f"{indice:08d}.chunk")
+
+
+def criar_sessao_upload(sessao_id, tamanho):
+    """Reserva o arquivo de dados da sessão (esparso) com o tamanho final"""
+    os.makedirs(diretorio_sessao_upload(sessao_id), exist_ok=True)
+    with open(caminho_dados_sessao(sessao_id), 'wb') as f:
+        f.truncate(tamanho)
+
+
+def gravar_chunk(sessao_id, indice, offset, origem, tamanho_esperado):
+    """Grava um chunk na sua posição do arquivo de dados, retornando (bytes recebidos, sha256)"""
+    marcador = caminho_marcador_chunk(sessao_id, indice)
+    if os.path.exists(marcador):
+        os.remove(marcador)
+
+    chunk_hash = hashlib.sha256()
+    total = 0
+    with open(caminho_dados_sessao(sessao_id), 'r+b', buffering=CHUNK_SIZE) as f:
+        f.seek(offset)
+        while True:
+            restante = tamanho_esperado - total
+            bloco = origem.read(min(CHUNK_SIZE, restante) if restante > 0 else 1)
+            if not bloco:
+                break
+            total += len(bloco)
+            if total > tamanho_esperado:
+                break
+            chunk_hash.update(bloco)
+            f.write(bloco)
+
+        f.flush()
+        os.fsync(f.fileno())
+
+    return total, chunk_hash.hexdigest()
+
+
+def marcar_chunk_recebido(sessao_id, indice):
+    with open(caminho_marcador_chunk(sessao_id, indice), 'wb'):
+        pass
+
+
+def chunks_recebidos(sessao_id):
+    """Lista os índices dos chunks já gravados e verificados da sessão"""
+    diretorio = diretorio_sessao_upload(sessao_id)
+    if not os.path.isdir(diretorio):
+        return []
+
+    indices = []
+    for nome in os.listdir(diretorio):
+        base, ext = os.path.splitext(nome)
+        if ext == '.chunk' and base.isdigit():
+            indices.append(int(base))
+    return sorted(indices)
+
+
+def finalizar_sessao_upload(sessao_id, destino, gravador, tipo_mime=None):
+    """Publica os dados da sessão no armazenamento, mantendo a sessão intacta até o commit"""
+    return gravador.gravar(caminho_dados_sessao(sessao_id), destino, tipo_mime, manter_origem=True)
+
+
+def remover_sessao_upload(sessao_id):
+    diretorio = diretorio_sessao_upload(sessao_id)
+    if os.path.isdir(diretorio):
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+
+class LeitorLimitado:
+    """Envolve um stream aberto limitando a leitura a `tamanho` bytes"""
+
+    def __init__(self, arquivo, tamanho):
+        self._arquivo = arquivo
+        self._restante = tamanho
+
+    def read(self, size=-1):
+        if self._restante <= 0:
+            return b''
+        if size is None or size < 0 or size > self._restante:
+            size = self._restante
+        dados = self._arquivo.read(size)
+        self._restante -= len(dados)
+        return dados
+
+    def close(self):
+        self._arquivo.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class StorageDriver:
+    """Interface dos backends onde o conteúdo dos arquivos é armazenado.
+
+    As chaves são os valores de caminho_armazenamento (ex.: uploads/blobs/ab/cd/<hash>).
+    """
+
+    def salvar_arquivo(self, caminho_local, chave, manter_origem=False):
+        raise NotImplementedError
+
+    def abrir(self, chave, inicio=0, fim=None):
+        """Abre a chave para leitura em streaming; `fim` é inclusivo, como no header Range"""
+        raise NotImplementedError
+
+    def existe(self, chave):
+        raise NotImplementedError
+
+    def tamanho(self, chave):
+        raise NotImplementedError
+
+    def remover(self, chave):
+        raise NotImplementedError
+
+    def mover(self, origem, destino):
+        raise NotImplementedError
+
+    def listar(self, prefixo):
+        """Gera pares (chave, tamanho) de todos os objetos sob o prefixo"""
+        raise NotImplementedError
+
+    def caminho_local(self, chave):
+        """Caminho no sistema de arquivos local, quando o backend tiver um"""
+        return None
+
+    def carimbo(self, chave):
+        """Tamanho, mtime e identidade do objeto armazenado, para detectar alterações sem lê-lo"""
+        raise NotImplementedError
+
+    def iterar(self, chave, inicio=0, fim=None, tamanho_bloco=CHUNK_SIZE):
+        with self.abrir(chave, inicio, fim) as origem:
+            for bloco in iter(lambda: origem.read(tamanho_bloco), b''):
+                yield bloco
+
+
+class LocalStorageDriver(StorageDriver):
+    def __init__(self, raiz=''):
+        self.raiz = raiz
+
+    def caminho_local(self, chave):
+        return os.path.join(self.raiz, chave) if self.raiz else chave
+
+    def salvar_arquivo(self, caminho_local, chave, manter_origem=False):
+        destino = self.caminho_local(chave)
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+
+        with open(caminho_local, 'rb+') as f:
+            os.fsync(f.fileno())
+
+        if manter_origem:
+            # Hard link + rename: o destino aparece de forma atômica e a origem continua válida
+            temporario = f"{destino}.{uuid4().hex}.part"
+            os.link(caminho_local, temporario)
+            os.replace(temporario, destino)
+        else:
+            os.replace(caminho_local, destino)
+
+    def abrir(self, chave, inicio=0, fim=None):
+        arquivo = open(self.caminho_local(chave), 'rb')
+        if inicio:
+            arquivo.seek(inicio)
+        if fim is None:
+            return arquivo
+        return LeitorLimitado(arquivo, fim - inicio + 1)
+
+    def existe(self, chave):
+        return os.path.exists(self.caminho_local(chave))
+
+    def tamanho(self, chave):
+        return os.path.getsize(self.caminho_local(chave))
+
+    def carimbo(self, chave):
+        st = os.stat(self.caminho_local(chave))
+        return {'tamanho': st.st_size, 'mtime_ns': st.st_mtime_ns, 'identificador': f"{st.st_dev}:{st.st_ino}"}
+
+    def remover(self, chave):
+        try:
+            os.remove(self.caminho_local(chave))
+        except FileNotFoundError:
+            pass
+
+    def mover(self, origem, destino):
+        caminho_destino = self.caminho_local(destino)
+        os.makedirs(os.path.dirname(caminho_destino), exist_ok=True)
+        os.replace(self.caminho_local(origem), caminho_destino)
+
+    def listar(self, prefixo):
+        base = self.caminho_local(prefixo)
+        for diretorio, _, nomes in os.walk(base):
+            for nome in nomes:
+                caminho = os.path.join(diretorio, nome)
+                chave = os.path.relpath(caminho, self.raiz) if self.raiz else caminho
+                yield chave, os.path.getsize(caminho)
+
+
+class S3StorageDriver(StorageDriver):
+    """Backend compatível com S3 (AWS, MinIO, Ceph...), selecionado por STORAGE_BACKEND=s3"""
+
+    def __init__(self, bucket, endpoint_url=None, region=None, access_key=None, secret_key=None):
+        self.bucket = bucket
+        self.client = boto3.client(
+            's3',
+            endpoint_url=endpoint_url,
+            region_name=region,
+            aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key
+        )
+
+    def salvar_arquivo(self, caminho_local, chave, manter_origem=False):
+        # upload_file faz upload multipart em streaming para arquivos grandes
+        self.client.upload_file(caminho_local, self.bucket, chave)
+        if not manter_origem:
+            os.remove(caminho_local)
+
+    def abrir(self, chave, inicio=0, fim=None):
+        parametros = {'Bucket': self.bucket, 'Key': chave}
+        if inicio or fim is not None:
+            parametros['Range'] = f"bytes={inicio}-{'' if fim is None else fim}"
+        resposta = self.client.get_object(**parametros)
+        return LeitorLimitado(resposta['Body'], resposta['ContentLength'])
+
+    def existe(self, chave):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=chave)
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def tamanho(self, chave):
+        return self.client.head_object(Bucket=self.bucket, Key=chave)['ContentLength']
+
+    def carimbo(self, chave):
+        objeto = self.client.head_object(Bucket=self.bucket, Key=chave)
+        return {
+            'tamanho': objeto['ContentLength'],
+            'mtime_ns': int(objeto['LastModified'].timestamp() * 1_000_000_000),
+            'identificador': objeto['ETag']
+        }
+
+    def remover(self, chave):
+        self.client.delete_object(Bucket=self.bucket, Key=chave)
+
+    def mover(self, origem, destino):
+        # Cópia no próprio servidor, sem trafegar o conteúdo pela aplicação
+        self.client.copy({'Bucket': self.bucket, 'Key': origem}, self.bucket, destino)
+        self.client.delete_object(Bucket=self.bucket, Key=origem)
+
+    def listar(self, prefixo):
+        paginator = self.client.get_paginator('list_objects_v2')
+        for pagina in paginator.paginate(Bucket=self.bucket, Prefix=prefixo):
+            for objeto in pagina.get('Contents', []):
+                yield objeto['Key'], objeto['Size']
+
+
+def criar_driver(config):
+    if config.get('STORAGE_BACKEND') == 's3':
+        return S3StorageDriver(
+            bucket=config['STORAGE_S3_BUCKET'],
+            endpoint_url=config.get('STORAGE_S3_ENDPOINT_URL'),
+            region=config.get('STORAGE_S3_REGION'),
+            access_key=config.get('STORAGE_S3_ACCESS_KEY'),
+            secret_key=config.get('STORAGE_S3_SECRET_KEY')
+        )
+    return LocalStorageDriver(config.get('STORAGE_LOCAL_ROOT', ''))
+
+
+def obter_driver():
+    """Driver configurado para a aplicação atual (criado uma única vez)"""
+    driver = current_app.extensions.get('storage_driver')
+    if driver is None:
+        driver = criar_driver(current_app.config)
+        current_app.extensions['storage_driver'] = driver
+    return driver
@@ -0,0 +1,201 @@
+import os
+import re
+import struct
+import tempfile
+from itertools import islice
+from flask import current_app
+from app.blob_store import BLOBS_TMP_DIR, obter_blob
+from app.delivery import iterar_conteudo, iterar_intervalo
+from app.derivatives import DerivativeCache
+
+
+TIPO_INDICE_LINHAS = 'indice-linhas-v1'
+
+# Cabeçalho do índice: assinatura, intervalo entre entradas, total de linhas e tamanho do conteúdo.
+# Depois dele vêm, em '<Q', os offsets do início das linhas 0, K, 2K, ...
+CABECALHO_INDICE = struct.Struct('<4sIQQ')
+ASSINATURA_INDICE = b'NLI1'
+ENTRADA_INDICE = struct.Struct('<Q')
+
+# Uma entrada a cada K linhas: ir à linha N custa ler uma entrada e pular no máximo K-1 linhas
+INTERVALO_INDICE = 1000
+
+
+class IndiceLinhas:
+    """Índice esparso de linhas de um conteúdo, guardado no cache de derivados.
+
+    É construído uma única vez por hash (na primeira pré-visualização por linhas) lendo o
+    conteúdo em blocos, e consultado com leituras de intervalo: o cabeçalho e uma entrada
+    de 8 bytes, sem carregar o índice inteiro.
+    """
+
+    def __init__(self, derivado, cache):
+        self.derivado = derivado
+        self.cache = cache
+        assinatura, self.intervalo, self.total_linhas, self.tamanho = CABECALHO_INDICE.unpack(
+            self._ler(0, CABECALHO_INDICE.size)
+        )
+        if assinatura != ASSINATURA_INDICE:
+            raise ValueError('Índice de linhas inválido')
+
+    def _ler(self, inicio, tamanho):
+        return b''.join(iterar_intervalo(
+            self.derivado, self.derivado, self.cache.driver, inicio, inicio + tamanho - 1
+        ))
+
+    def entrada(self, linha):
+        """(primeira linha da entrada, offset dela) para a entrada que cobre `linha` (0-based)"""
+        numero = linha // self.intervalo
+        (offset,) = ENTRADA_INDICE.unpack(
+            self._ler(CABECALHO_INDICE.size + numero * ENTRADA_INDICE.size, ENTRADA_INDICE.size)
+        )
+        return numero * self.intervalo, offset
+
+
+def construir_indice(arquivo, blob, cache, intervalo=INTERVALO_INDICE):
+    """Percorre o conteúdo uma vez e grava o índice esparso de linhas como derivado"""
+    os.makedirs(BLOBS_TMP_DIR, exist_ok=True)
+    descritor, caminho = tempfile.mkstemp(dir=BLOBS_TMP_DIR, suffix='.idx')
+    try:
+        with os.fdopen(descritor, 'wb') as saida:
+            saida.write(b'\0' * CABECALHO_INDICE.size)
+            saida.write(ENTRADA_INDICE.pack(0))
+
+            quebras = 0
+            proxima = intervalo  # a linha `proxima` começa logo depois da quebra de número `proxima`
+            posicao = 0
+            ultimo = b''
+            for bloco in iterar_conteudo(arquivo, blob, cache.driver):
+                n = bloco.count(b'\n')
+                if quebras + n >= proxima:
+                    encontradas = re.finditer(b'\n', bloco)
+                    vistas = quebras
+                    while quebras + n >= proxima:
+                        quebra = next(islice(encontradas, proxima - vistas - 1, None))
+                        vistas = proxima
+                        saida.write(ENTRADA_INDICE.pack(posicao + quebra.end()))
+                        proxima += intervalo
+                quebras += n
+                posicao += len(bloco)
+                ultimo = bloco[-1:] or ultimo
+
+            # Uma última linha sem quebra no fim também conta
+            total_linhas = quebras + (1 if ultimo and ultimo != b'\n' else 0)
+            saida.seek(0)
+            saida.write(CABECALHO_INDICE.pack(ASSINATURA_INDICE, intervalo, total_linhas, posicao))
+
+        return cache.gravar(arquivo.hash_arquivo, TIPO_INDICE_LINHAS, caminho, 'application/octet-stream')
+    finally:
+        if os.path.exists(caminho):
+            os.remove(caminho)
+
+
+def obter_indice(arquivo, blob, cache=None):
+    cache = cache or DerivativeCache()
+    derivado = cache.obter(arquivo.hash_arquivo, TIPO_INDICE_LINHAS)
+    if derivado is None:
+        derivado = construir_indice(arquivo, blob, cache)
+    return IndiceLinhas(derivado, cache)
+
+
+def janela_linhas(arquivo, linha, quantidade, max_bytes=None, driver=None):
+    """Até `quantidade` linhas a partir de `linha` (1-based), limitadas a `max_bytes` no total.
+
+    Usa o índice para ir direto ao bloco de K linhas que contém `linha`; a memória usada
+    fica limitada a `max_bytes`, não importa o tamanho do arquivo. Uma linha que passe do
+    limite é cortada (`truncado`) e a próxima página começa na linha seguinte.
+    """
+    max_bytes = max_bytes or current_app.config['PREVIEW_TEXT_MAX_BYTES']
+    blob = obter_blob(arquivo)
+    cache = DerivativeCache(driver)
+    indice = obter_indice(arquivo, blob, cache)
+
+    janela = {
+        'linha_inicial': linha,
+        'total_linhas': indice.total_linhas,
+        'tamanho_total': indice.tamanho,
+        'conteudo': '',
+        'inicio': None,
+        'fim': None,
+        'proxima_linha': None,
+        'truncado': False
+    }
+    if linha > indice.total_linhas or quantidade <= 0:
+        return janela
+
+    atual, offset = indice.entrada(linha - 1)
+    atual += 1
+    partes = []
+    lidos = 0
+    servidas = 0
+    inicio = None
+
+    for bloco in iterar_intervalo(arquivo, blob, cache.driver, offset, indice.tamanho - 1):
+        cursor = 0
+        # Pula as linhas entre a entrada do índice e a linha pedida
+        while atual < linha:
+            quebra = bloco.find(b'\n', cursor)
+            if quebra < 0:
+                cursor = len(bloco)
+                break
+            cursor = quebra + 1
+            atual += 1
+        offset += cursor
+        if atual < linha:
+            continue
+        if inicio is None:
+            inicio = offset
+
+        # Junta as linhas pedidas até o limite de linhas ou de bytes
+        pedaco = bloco[cursor:]
+        fim_pedaco = 0
+        while servidas < quantidade:
+            quebra = pedaco.find(b'\n', fim_pedaco)
+            if quebra < 0:
+                fim_pedaco = len(pedaco)
+                break
+            fim_pedaco = quebra + 1
+            servidas += 1
+        pedaco = pedaco[:fim_pedaco]
+
+        if lidos + len(pedaco) > max_bytes:
+            pedaco = pedaco[:max_bytes - lidos]
+            janela['truncado'] = True
+        partes.append(pedaco)
+        lidos += len(pedaco)
+        offset += len(bloco) - cursor
+        if servidas >= quantidade or janela['truncado']:
+            break
+
+    conteudo = b''.join(partes)
+    servidas = conteudo.count(b'\n')
+    if conteudo and not conteudo.endswith(b'\n'):
+        # Linha cortada pelo limite de bytes ou última linha sem quebra no fim
+        servidas += 1
+
+    proxima = linha + servidas
+    janela.update({
+        'conteudo': conteudo.decode('utf-8', errors='replace'),
+        'inicio': inicio,
+        'fim': inicio + len(conteudo) - 1 if conteudo else None,
+        'proxima_linha': proxima if proxima <= indice.total_linhas else None
+    })
+    return janela
+
+
+def janela_bytes(arquivo, inicio, fim=None, max_bytes=None, driver=None):
+    """O trecho [inicio, fim] do conteúdo, limitado a `max_bytes`, como texto"""
+    max_bytes = max_bytes or current_app.config['PREVIEW_TEXT_MAX_BYTES']
+    fim = min(arquivo.tamanho - 1, inicio + max_bytes - 1 if fim is None else fim, inicio + max_bytes - 1)
+
+    conteudo = b''
+    if arquivo.tamanho and inicio <= fim:
+        conteudo = b''.join(iterar_intervalo(arquivo, obter_blob(arquivo), driver, inicio, fim))
+
+    return {
+        'conteudo': conteudo.decode('utf-8', errors='replace'),
+        'inicio': inicio,
+        'fim': inicio + len(conteudo) - 1 if conteudo else None,
+        'proximo_inicio': inicio + len(conteudo) if inicio + len(conteudo) < arquivo.tamanho else None,
+        'tamanho_total': arquivo.tamanho
+    }
@@ -0,0 +1,31 @@
+import time
+import threading
+
+
+class TokenBucket:
+    """Balde de fichas para limitar taxa (ex.: bytes por segundo), seguro entre threads"""
+
+    def __init__(self, taxa, capacidade=None):
+        self.taxa = float(taxa)
+        self.capacidade = float(capacidade if capacidade is not None else taxa)
+        self._fichas = self.capacidade
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _repor(self, agora):
+        self._fichas = min(self.capacidade, self._fichas + (agora - self._ultimo) * self.taxa)
+        self._ultimo = agora
+
+    def reservar(self, quantidade):
+        """Retira fichas sem bloquear; retorna quanto tempo o chamador deve esperar antes de usá-las"""
+        with self._lock:
+            self._repor(time.monotonic())
+            self._fichas -= quantidade
+            return -self._fichas / self.taxa if self._fichas < 0 else 0
+
+    def consumir(self, quantidade):
+        """Retira fichas, bloqueando o tempo necessário para respeitar a taxa; retorna a espera em segundos"""
+        espera = self.reservar(quantidade)
+        if espera > 0:
+            time.sleep(espera)
+        return espera
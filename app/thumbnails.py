@@ -0,0 +1,151 @@
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from PIL import Image, ImageOps
+from app.extensions import db
+from app.models import Arquivo
+from app.blob_store import BLOBS_TMP_DIR
+from app.delivery import iterar_conteudo
+from app.derivatives import DerivativeCache
+
+
+# Lado maior de cada miniatura, em pixels (grade, lista ampliada e visualização)
+TAMANHOS_MINIATURA = (160, 320, 1024)
+
+FORMATOS_MINIATURA = {
+    'webp': ('WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'image/jpeg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+FORMATO_PADRAO = 'webp'
+
+MIME_COM_MINIATURA = {
+    'image/jpeg',
+    'image/png',
+    'image/gif',
+    'image/webp',
+    'image/bmp',
+    'image/tiff',
+}
+
+# Imagens pequenas são decodificadas em memória; maiores passam por disco
+LIMITE_MEMORIA_ORIGEM = 16 * 1024 * 1024
+
+ERROS_IMAGEM = (OSError, ValueError, Image.DecompressionBombError)
+
+
+def tem_miniatura(tipo_mime):
+    return tipo_mime in MIME_COM_MINIATURA
+
+
+def tipo_miniatura(tamanho, formato):
+    return f"miniatura-{tamanho}.{formato}"
+
+
+def _normalizar(imagem):
+    # Paleta, CMYK, 16 bits etc. viram RGB(A) antes de reduzir, para a reamostragem LANCZOS valer
+    transparente = imagem.mode in ('RGBA', 'LA', 'PA') or 'transparency' in imagem.info
+    return imagem.convert('RGBA' if transparente else 'RGB')
+
+
+def _preparar_modo(imagem, formato):
+    if formato == 'webp' or imagem.mode == 'RGB':
+        return imagem
+    # JPEG não tem canal alfa: compõe sobre fundo branco
+    fundo = Image.new('RGB', imagem.size, (255, 255, 255))
+    fundo.paste(imagem, mask=imagem.getchannel('A'))
+    return fundo
+
+
+def gerar_miniaturas(arquivo, formatos=(FORMATO_PADRAO,), tamanhos=TAMANHOS_MINIATURA, cache=None):
+    """Decodifica a imagem uma única vez e grava as miniaturas pedidas no cache de derivados.
+
+    Retorna {(tamanho, formato): Derivado}. Cada tamanho é reduzido a partir do anterior, e
+    JPEGs já são decodificados em escala reduzida (draft), o que evita montar a imagem inteira
+    em memória para fotos grandes.
+    """
+    cache = cache or DerivativeCache()
+    os.makedirs(BLOBS_TMP_DIR, exist_ok=True)
+    gerados = {}
+
+    with tempfile.SpooledTemporaryFile(max_size=LIMITE_MEMORIA_ORIGEM, dir=BLOBS_TMP_DIR) as origem:
+        for bloco in iterar_conteudo(arquivo, driver=cache.driver):
+            origem.write(bloco)
+        origem.seek(0)
+
+        with Image.open(origem) as imagem:
+            maior = max(tamanhos)
+            imagem.draft('RGB', (maior, maior))
+            imagem = _normalizar(ImageOps.exif_transpose(imagem))
+
+            for tamanho in sorted(tamanhos, reverse=True):
+                imagem.thumbnail((tamanho, tamanho), Image.LANCZOS)
+                for formato in formatos:
+                    formato_pil, tipo_mime, opcoes = FORMATOS_MINIATURA[formato]
+                    descritor, caminho = tempfile.mkstemp(dir=BLOBS_TMP_DIR, suffix=f".{formato}")
+                    try:
+                        with os.fdopen(descritor, 'wb') as saida:
+                            _preparar_modo(imagem, formato).save(saida, formato_pil, **opcoes)
+                        gerados[(tamanho, formato)] = cache.gravar(
+                            arquivo.hash_arquivo, tipo_miniatura(tamanho, formato), caminho, tipo_mime
+                        )
+                    finally:
+                        if os.path.exists(caminho):
+                            os.remove(caminho)
+
+    return gerados
+
+
+def obter_miniatura(arquivo, tamanho, formato, cache=None):
+    """Miniatura do cache ou gerada na hora (junto com os demais tamanhos do mesmo formato)"""
+    cache = cache or DerivativeCache()
+    derivado = cache.obter(arquivo.hash_arquivo, tipo_miniatura(tamanho, formato))
+    if derivado is not None:
+        return derivado
+
+    try:
+        return gerar_miniaturas(arquivo, formatos=(formato,), cache=cache).get((tamanho, formato))
+    except ERROS_IMAGEM as e:
+        print(f"⚠️ Miniatura indisponível para o arquivo {arquivo.id}: {str(e)}")
+        return None
+
+
+def _executor():
+    executor = current_app.extensions.get('thumbnail_executor')
+    if executor is None:
+        executor = ThreadPoolExecutor(
+            max_workers=current_app.config['THUMBNAIL_WORKERS'],
+            thread_name_prefix='miniaturas'
+        )
+        current_app.extensions['thumbnail_executor'] = executor
+    return executor
+
+
+def agendar_miniaturas(arquivos):
+    """Gera em segundo plano as miniaturas dos Arquivos recém-enviados (chamar após o commit)"""
+    if not current_app.config['THUMBNAIL_PREGENERATE']:
+        return
+
+    app = current_app._get_current_object()
+    for arquivo in arquivos:
+        if tem_miniatura(arquivo.tipo_mime):
+            _executor().submit(_gerar_em_segundo_plano, app, arquivo.id)
+
+
+def _gerar_em_segundo_plano(app, arquivo_id):
+    with app.app_context():
+        try:
+            arquivo = db.session.get(Arquivo, arquivo_id)
+            if arquivo is None or arquivo.excluido:
+                return
+
+            # Conteúdo deduplicado pode já ter miniaturas de um upload anterior
+            cache = DerivativeCache()
+            if cache.obter(arquivo.hash_arquivo, tipo_miniatura(max(TAMANHOS_MINIATURA), FORMATO_PADRAO)):
+                return
+            gerar_miniaturas(arquivo, cache=cache)
+        except Exception as e:
+            db.session.rollback()
+            print(f"ERRO AO GERAR MINIATURAS DO ARQUIVO {arquivo_id}: {str(e)}")
+        finally:
+            db.session.remove()
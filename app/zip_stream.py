@@ -0,0 +1,215 @@
+import io
+import zipfile
+from types import SimpleNamespace
+from flask import Response, stream_with_context
+from app.models import Arquivo, Pasta, Blob, VerificacaoIntegridade
+from app.storage import obter_driver
+from app.compression import ja_compactado
+from app.delivery import cabecalho_disposicao, iterar_conteudo
+from app.bandwidth import limitar_resposta
+
+
+# Consultas com IN são feitas em fatias para não montar um único comando gigante
+TAMANHO_FATIA = 1000
+
+# Margem para o deflate de conteúdo incompressível, que pode crescer um pouco
+MARGEM_ZIP64 = 1.01
+
+
+class _SaidaStream(io.RawIOBase):
+    """Destino sem seek para o ZipFile: guarda só o que foi escrito desde a última drenagem.
+
+    Sem tell()/seek() o zipfile grava tamanhos e CRC em data descriptors após cada membro,
+    então nada precisa ser reescrito e o arquivo sai em uma única passada.
+    """
+
+    def __init__(self):
+        self._partes = []
+
+    def writable(self):
+        return True
+
+    def write(self, dados):
+        self._partes.append(bytes(dados))
+        return len(dados)
+
+    def drenar(self):
+        """Gera o que já foi escrito (nada, se o compressor ainda está acumulando)"""
+        if self._partes:
+            dados = b''.join(self._partes)
+            self._partes = []
+            yield dados
+
+
+def _fatias(valores):
+    valores = list(valores)
+    for i in range(0, len(valores), TAMANHO_FATIA):
+        yield valores[i:i + TAMANHO_FATIA]
+
+
+def _nome_seguro(nome):
+    nome = (nome or '').replace('/', '_').replace('\\', '_').strip()
+    return nome if nome not in ('', '.', '..') else '_'
+
+
+def _nome_unico(nome, usados):
+    """Evita dois membros com o mesmo caminho no ZIP (ex.: 'foto.jpg' e 'foto (2).jpg')"""
+    candidato, contador = nome, 1
+    base, ponto, extensao = nome.rpartition('.')
+    while candidato.lower() in usados:
+        contador += 1
+        candidato = f"{base} ({contador}).{extensao}" if ponto and base else f"{nome} ({contador})"
+    usados.add(candidato.lower())
+    return candidato
+
+
+def _data_zip(arquivo):
+    data = arquivo.data_modificacao or arquivo.data_upload
+    if data is None or data.year < 1980:
+        return (1980, 1, 1, 0, 0, 0)
+    return data.timetuple()[:6]
+
+
+def _desacoplar(arquivo):
+    """Cópia só com as colunas usadas no ZIP.
+
+    O commit do log de download expira as instâncias do ORM, e cada atributo lido depois
+    durante o streaming viraria um SELECT por arquivo.
+    """
+    return SimpleNamespace(
+        id=arquivo.id,
+        nome_original=arquivo.nome_original,
+        caminho_armazenamento=arquivo.caminho_armazenamento,
+        hash_arquivo=arquivo.hash_arquivo,
+        tamanho=arquivo.tamanho,
+        tipo_mime=arquivo.tipo_mime,
+        data_upload=arquivo.data_upload,
+        data_modificacao=arquivo.data_modificacao
+    )
+
+
+def entradas_pasta(pasta):
+    """Percorre a árvore da pasta nível a nível, retornando (diretórios, [(arquivo, caminho no ZIP)]).
+
+    Só metadados são carregados, em cópias desacopladas da sessão; o conteúdo é lido sob
+    demanda por gerar_zip.
+    """
+    raiz = _nome_seguro(pasta.nome)
+    caminhos = {pasta.id: raiz}
+    diretorios = [raiz]
+    nivel = [pasta.id]
+
+    while nivel:
+        filhas = []
+        for fatia in _fatias(nivel):
+            filhas.extend(
+                Pasta.query.filter(Pasta.id_pasta_pai.in_(fatia), Pasta.excluida == False)
+                .order_by(Pasta.nome).all()
+            )
+        usados = {}
+        for filha in filhas:
+            nome = _nome_unico(_nome_seguro(filha.nome), usados.setdefault(filha.id_pasta_pai, set()))
+            caminhos[filha.id] = f"{caminhos[filha.id_pasta_pai]}/{nome}"
+            diretorios.append(caminhos[filha.id])
+        nivel = [filha.id for filha in filhas]
+
+    arquivos = []
+    for fatia in _fatias(caminhos):
+        arquivos.extend(
+            Arquivo.query.filter(Arquivo.id_pasta.in_(fatia), Arquivo.excluido == False)
+            .order_by(Arquivo.nome_original).all()
+        )
+
+    # Nomes de subpastas e arquivos dividem o mesmo espaço dentro de cada diretório
+    usados = {}
+    for caminho in diretorios:
+        pai, _, nome = caminho.rpartition('/')
+        usados.setdefault(pai, set()).add(nome.lower())
+
+    entradas = []
+    for arquivo in arquivos:
+        diretorio = caminhos[arquivo.id_pasta]
+        nome = _nome_unico(_nome_seguro(arquivo.nome_original), usados.setdefault(diretorio, set()))
+        entradas.append((_desacoplar(arquivo), f"{diretorio}/{nome}"))
+    return diretorios, entradas
+
+
+def entradas_arquivos(arquivos):
+    """Arquivos soltos (seleção múltipla) na raiz do ZIP, com nomes repetidos desambiguados"""
+    usados = set()
+    return [(_desacoplar(arquivo), _nome_unico(_nome_seguro(arquivo.nome_original), usados)) for arquivo in arquivos]
+
+
+def _carregar_blobs(arquivos):
+    """Carrega os Blobs de uma vez; obter_blob passa a encontrá-los no identity map da sessão"""
+    hashes = {arquivo.hash_arquivo for arquivo in arquivos}
+    blobs = {}
+    for fatia in _fatias(hashes):
+        for blob in Blob.query.filter(Blob.hash_arquivo.in_(fatia)):
+            blobs[blob.hash_arquivo] = blob
+    return blobs
+
+
+def _caminhos_corrompidos(arquivos):
+    caminhos = {arquivo.caminho_armazenamento for arquivo in arquivos}
+    corrompidos = set()
+    for fatia in _fatias(caminhos):
+        corrompidos.update(
+            r.caminho_armazenamento for r in VerificacaoIntegridade.query.filter(
+                VerificacaoIntegridade.caminho_armazenamento.in_(fatia),
+                VerificacaoIntegridade.corrompido == True
+            )
+        )
+    return corrompidos
+
+
+def gerar_zip(entradas, diretorios=()):
+    """Gera o ZIP em blocos a partir de [(arquivo, caminho no ZIP)], com memória constante.
+
+    Formatos já compactados (mídia, PDF, ZIP...) entram sem compressão (stored); os demais
+    com deflate. Conteúdo marcado como corrompido pela verificação de integridade é omitido.
+    """
+    driver = obter_driver()
+    arquivos = [arquivo for arquivo, _ in entradas]
+    # Referência mantida durante todo o streaming para os Blobs não saírem do identity map
+    blobs = _carregar_blobs(arquivos)
+    corrompidos = _caminhos_corrompidos(arquivos)
+    saida = _SaidaStream()
+
+    with zipfile.ZipFile(saida, 'w', allowZip64=True) as zip_saida:
+        for diretorio in diretorios:
+            info = zipfile.ZipInfo(f"{diretorio}/")
+            info.external_attr = (0o40755 << 16) | 0x10
+            zip_saida.writestr(info, b'')
+        yield from saida.drenar()
+
+        for arquivo, caminho in entradas:
+            if arquivo.caminho_armazenamento in corrompidos:
+                print(f"⚠️ Arquivo {arquivo.id} omitido do ZIP: conteúdo corrompido")
+                continue
+
+            info = zipfile.ZipInfo(caminho, date_time=_data_zip(arquivo))
+            info.external_attr = 0o644 << 16
+            info.compress_type = zipfile.ZIP_STORED if ja_compactado(arquivo.tipo_mime) else zipfile.ZIP_DEFLATED
+            # Sem seek não dá para promover o membro a ZIP64 depois: decide-se pelo tamanho conhecido
+            zip64 = arquivo.tamanho * MARGEM_ZIP64 >= zipfile.ZIP64_LIMIT
+
+            with zip_saida.open(info, 'w', force_zip64=zip64) as destino:
+                for bloco in iterar_conteudo(arquivo, driver=driver):
+                    destino.write(bloco)
+                    yield from saida.drenar()
+            yield from saida.drenar()
+
+    yield from saida.drenar()
+
+
+def enviar_zip(nome_arquivo, entradas, diretorios=(), usuario_id=None):
+    """Resposta em streaming com o ZIP; o tamanho final não é conhecido, então vai em chunked"""
+    response = Response(
+        stream_with_context(gerar_zip(entradas, diretorios)),
+        mimetype='application/zip',
+        direct_passthrough=True
+    )
+    response.headers['Content-Disposition'] = cabecalho_disposicao('attachment', nome_arquivo)
+    response.headers['Cache-Control'] = 'private, no-store'
+    return limitar_resposta(response, usuario_id)